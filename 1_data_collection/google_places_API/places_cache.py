@@ -0,0 +1,100 @@
+# IGATP - Persistent cache for the Places API
+#
+# SQLite file with two tables:
+#   place_ids  normalized (name, city) -> place_id of the text search
+#   details    place_id -> details payload (reviews) + ETag
+# Entries younger than their TTL are served without calling the API; older
+# details are revalidated with If-None-Match when the server sent an ETag,
+# so an incremental refresh only downloads new or changed places.
+
+import json
+import re
+import sqlite3
+import time
+import unicodedata
+
+
+# Place identity rarely changes; reviews do
+PLACE_ID_TTL = 180 * 24 * 3600
+DETAILS_TTL = 30 * 24 * 3600
+
+
+def normalize(text):
+    """Lowercase, accent-free, single-spaced text ("  Café  Majestic " -> "cafe majestic")."""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def place_cache_key(nome_local, cidade):
+    return f"{normalize(nome_local)}|{normalize(cidade)}"
+
+
+class PlacesCache:
+    """On-disk place_id and details cache with per-table TTLs."""
+
+    def __init__(self, path, place_id_ttl=PLACE_ID_TTL, details_ttl=DETAILS_TTL):
+        self.path = path
+        self.place_id_ttl = place_id_ttl
+        self.details_ttl = details_ttl
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS place_ids (
+                key TEXT PRIMARY KEY,
+                place_id TEXT,
+                fetched_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS details (
+                place_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                etag TEXT,
+                fetched_at REAL NOT NULL
+            );
+        """)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _fresh(self, fetched_at, ttl):
+        return time.time() - fetched_at < ttl
+
+    # place_ids
+
+    def get_place_id(self, nome_local, cidade):
+        """(hit, place_id): hit is False when missing or stale. A cached None means "not found"."""
+        row = self.db.execute("SELECT place_id, fetched_at FROM place_ids WHERE key = ?",
+                              (place_cache_key(nome_local, cidade),)).fetchone()
+        if row is None or not self._fresh(row[1], self.place_id_ttl):
+            return False, None
+        return True, row[0]
+
+    def put_place_id(self, nome_local, cidade, place_id):
+        self.db.execute("INSERT OR REPLACE INTO place_ids VALUES (?, ?, ?)",
+                        (place_cache_key(nome_local, cidade), place_id, time.time()))
+        self.db.commit()
+
+    # details
+
+    def get_details(self, place_id):
+        """(payload, etag, fresh) of a cached details call, or (None, None, False)."""
+        row = self.db.execute("SELECT payload, etag, fetched_at FROM details WHERE place_id = ?",
+                              (place_id,)).fetchone()
+        if row is None:
+            return None, None, False
+        return json.loads(row[0]), row[1], self._fresh(row[2], self.details_ttl)
+
+    def put_details(self, place_id, payload, etag=None):
+        self.db.execute("INSERT OR REPLACE INTO details VALUES (?, ?, ?, ?)",
+                        (place_id, json.dumps(payload, ensure_ascii=False), etag, time.time()))
+        self.db.commit()
+
+    def touch_details(self, place_id):
+        """Mark a cached payload as fresh again (304 Not Modified)."""
+        self.db.execute("UPDATE details SET fetched_at = ? WHERE place_id = ?", (time.time(), place_id))
+        self.db.commit()
@@ -0,0 +1,291 @@
+# IGATP - Google Places review collector
+#
+# Usage:  python places_collector.py csv/google_places_AMP.csv csv/comments_google_maps_AMP.csv
+#
+# Async replacement for the obter_place_id / obter_reviews loop of
+# notebooks/comments_AMP.ipynb. Requests share one pooled HTTP client, run
+# concurrently up to a limit and are paced by a token bucket (requests per
+# second allowed by the quota) instead of a fixed sleep. Failed calls are
+# retried with exponential backoff, and every finished place is appended to
+# a JSON Lines checkpoint so an interrupted refresh resumes where it stopped.
+# The checkpoint only lives until a run completes: it is then removed, so the
+# next refresh starts over and the cache decides what goes to the API.
+# With a PlacesCache (places_cache.py), place_ids and details that are still
+# fresh are not requested again across runs.
+# `--base-url` points the collector at a local stub server for testing.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import httpx
+import pandas as pd
+
+from places_cache import PlacesCache
+
+
+GOOGLE_BASE_URL = "https://maps.googleapis.com/maps/api/place"
+
+# Municípios da Área Metropolitana do Porto
+MUNICIPIOS_AMP = ['Arouca', 'Espinho', 'Gondomar', 'Maia', 'Matosinhos', 'Oliveira de Azeméis', 'Paredes',
+                  'Penafiel', 'Porto', 'Póvoa de Varzim', 'Santa Maria da Feira', 'Santo Tirso',
+                  'São João da Madeira', 'Trofa', 'Valongo', 'Vila do Conde', 'Vila Nova de Gaia']
+
+REVIEW_COLUMNS = ["Cidade", "Categoria", "Nome_Local", "Autor", "Texto", "Data", "Rating"]
+
+# HTTP and API statuses worth retrying (quota and transient server errors)
+RETRY_HTTP = {429, 500, 502, 503, 504}
+RETRY_API = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+# API statuses that are an answer (found / not found), checkpointed and cached.
+# Any other status (REQUEST_DENIED, INVALID_REQUEST, ...) fails the place,
+# which is then retried on the next run
+SEARCH_OK = {"OK", "ZERO_RESULTS"}
+DETAILS_OK = {"OK", "ZERO_RESULTS", "NOT_FOUND"}
+
+
+class RetryableError(Exception):
+    """Transient failure: the request is retried after a backoff."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ApiError(Exception):
+    """Non-retryable API status (bad or missing key, invalid request)."""
+
+
+def _check_status(payload, allowed):
+    status = payload.get("status")
+    if status not in allowed:
+        raise ApiError(f"{status}: {payload.get('error_message', '')}".rstrip(": "))
+
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second, bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class PlacesClient:
+    """Text search + place details over one pooled, rate-limited HTTP client."""
+
+    def __init__(self, api_key, base_url=GOOGLE_BASE_URL, rate=10.0, concurrency=8,
+                 max_retries=5, backoff=1.0, timeout=30.0, cache=None):
+        self.api_key = api_key
+        self.cache = cache
+        self.base_url = base_url.rstrip("/")
+        self.bucket = TokenBucket(rate)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.http = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+
+    async def close(self):
+        await self.http.aclose()
+
+    async def _get_json(self, endpoint, params, etag=None):
+        """(payload, etag) of a call; payload is None when the server answers 304 Not Modified."""
+        params = {**params, "key": self.api_key}
+        headers = {"If-None-Match": etag} if etag else None
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                response = await self.http.get(f"{self.base_url}/{endpoint}/json", params=params, headers=headers)
+                if response.status_code == 304:
+                    return None, etag
+                if response.status_code in RETRY_HTTP:
+                    retry_after = response.headers.get("Retry-After")
+                    raise RetryableError(f"HTTP {response.status_code}",
+                                         float(retry_after) if retry_after and retry_after.isdigit() else None)
+                response.raise_for_status()
+                payload = response.json()
+                if payload.get("status") in RETRY_API:
+                    raise RetryableError(payload["status"])
+                return payload, response.headers.get("ETag")
+            except (RetryableError, httpx.TransportError) as error:
+                if attempt == self.max_retries:
+                    raise
+                delay = getattr(error, "retry_after", None) or self.backoff * 2 ** attempt
+                await asyncio.sleep(delay + random.uniform(0, self.backoff))
+
+    async def place_id(self, nome_local, cidade):
+        """place_id of the first text search result, or None (same query as obter_place_id)."""
+        if self.cache is not None:
+            hit, place_id = self.cache.get_place_id(nome_local, cidade)
+            if hit:
+                return place_id
+
+        payload, _ = await self._get_json("textsearch", {"query": f"{nome_local}, {cidade}, Portugal"})
+        _check_status(payload, SEARCH_OK)
+        resultados = payload.get("results")
+        place_id = resultados[0].get("place_id") if resultados else None
+        if self.cache is not None:
+            self.cache.put_place_id(nome_local, cidade, place_id)
+        return place_id
+
+    async def reviews(self, place_id):
+        """Reviews of a place (same fields as obter_reviews)."""
+        cached, etag, fresh = self.cache.get_details(place_id) if self.cache is not None else (None, None, False)
+        if fresh:
+            return cached.get("result", {}).get("reviews", [])
+
+        payload, etag = await self._get_json("details", {"place_id": place_id, "fields": "review,name"},
+                                             etag=etag if cached is not None else None)
+        if payload is None:
+            # 304: the cached payload is still current
+            self.cache.touch_details(place_id)
+            payload = cached
+        else:
+            _check_status(payload, DETAILS_OK)
+            if self.cache is not None:
+                self.cache.put_details(place_id, payload, etag)
+        return payload.get("result", {}).get("reviews", [])
+
+
+def place_key(row):
+    return f"{row['Cidade']}|{row['Categoria']}|{row['Nome']}"
+
+
+def load_checkpoint(path):
+    """Records already collected, keyed by place_key. A truncated last line is ignored."""
+    done = {}
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done[record["key"]] = record
+    return done
+
+
+async def _collect_place(client, row, checkpoint):
+    place_id = await client.place_id(row["Nome"], row["Cidade"])
+    rows = []
+    if place_id:
+        for review in await client.reviews(place_id):
+            rows.append([row["Cidade"], row["Categoria"], row["Nome"], review.get("author_name"),
+                         review.get("text"), review.get("relative_time_description"), review.get("rating")])
+    else:
+        print(f"⚠️ Place ID não encontrado para: {row['Nome']}")
+
+    record = {"key": place_key(row), "place_id": place_id, "reviews": rows}
+    if checkpoint is not None:
+        # One line per place, flushed immediately so a crash loses at most the places in flight
+        checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+        checkpoint.flush()
+    return record
+
+
+async def collect_reviews_async(df_locais, api_key, checkpoint_path=None, base_url=GOOGLE_BASE_URL,
+                                rate=10.0, concurrency=8, max_retries=5, backoff=1.0, cache_path=None):
+    """Reviews of every place in `df_locais` (columns Cidade, Categoria, Nome), resuming from the checkpoint."""
+    done = load_checkpoint(checkpoint_path)
+    pending = [row for _, row in df_locais.iterrows() if place_key(row) not in done]
+    print(f"📍 {len(done)} locais já recolhidos, {len(pending)} por recolher")
+
+    cache = PlacesCache(cache_path) if cache_path else None
+    client = PlacesClient(api_key, base_url=base_url, rate=rate, concurrency=concurrency,
+                          max_retries=max_retries, backoff=backoff, cache=cache)
+    semaphore = asyncio.Semaphore(concurrency)
+    checkpoint = open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path else None
+
+    async def worker(row):
+        async with semaphore:
+            try:
+                return await _collect_place(client, row, checkpoint)
+            except (RetryableError, ApiError, httpx.HTTPError) as error:
+                # Not checkpointed: the place is retried on the next run
+                print(f"❌ Falhou: {row['Nome']} ({row['Cidade']}): {error}")
+                return None
+
+    try:
+        results = await asyncio.gather(*(worker(row) for row in pending))
+    finally:
+        await client.close()
+        if cache is not None:
+            cache.close()
+        if checkpoint is not None:
+            checkpoint.close()
+
+    for record in results:
+        if record is not None:
+            done[record["key"]] = record
+
+    if checkpoint_path and all(record is not None for record in results):
+        # Complete run: a later refresh must not replay these places
+        os.remove(checkpoint_path)
+
+    # Output keeps the order of df_locais
+    todas_reviews = []
+    for _, row in df_locais.iterrows():
+        record = done.get(place_key(row))
+        if record is not None:
+            todas_reviews.extend(record["reviews"])
+    return pd.DataFrame(todas_reviews, columns=REVIEW_COLUMNS)
+
+
+def collect_reviews(df_locais, api_key, **kwargs):
+    """Synchronous wrapper around `collect_reviews_async` (scripts and notebooks)."""
+    return asyncio.run(collect_reviews_async(df_locais, api_key, **kwargs))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect Google Places reviews for the AMP places.")
+    parser.add_argument("places_csv")
+    parser.add_argument("output_csv")
+    parser.add_argument("--checkpoint", default=None, help="JSON Lines checkpoint (default: <output>.checkpoint.jsonl)")
+    parser.add_argument("--cache", default=None, help="SQLite place cache (default: places_cache.sqlite next to the output)")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--base-url", default=GOOGLE_BASE_URL)
+    parser.add_argument("--rate", type=float, default=10.0, help="Requests per second allowed by the quota")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-retries", type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    api_key = os.getenv("GOOGLE_API_KEY")
+
+    df_locais = pd.read_csv(args.places_csv)
+    df_locais = df_locais[df_locais["Cidade"].isin(MUNICIPIOS_AMP)].reset_index(drop=True)
+    print(f"Total de locais nos municípios da AMP: {len(df_locais)}")
+
+    cache_path = None
+    if not args.no_cache:
+        cache_path = args.cache or os.path.join(os.path.dirname(os.path.abspath(args.output_csv)), "places_cache.sqlite")
+
+    df_reviews = collect_reviews(df_locais, api_key,
+                                 checkpoint_path=args.checkpoint or args.output_csv + ".checkpoint.jsonl",
+                                 base_url=args.base_url, rate=args.rate, concurrency=args.concurrency,
+                                 max_retries=args.max_retries, cache_path=cache_path)
+    df_reviews.to_csv(args.output_csv, index=False, encoding='utf-8-sig')
+    print(f"\n✅ Recolhidas {len(df_reviews)} reviews! Guardado em '{args.output_csv}'")
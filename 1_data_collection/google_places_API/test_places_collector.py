@@ -0,0 +1,102 @@
+# IGATP - places_collector against a local stub of the Places API (--base-url)
+#
+# Usage:  python -m pytest test_places_collector.py
+
+import json
+import os
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+
+from places_cache import DETAILS_TTL
+from places_collector import collect_reviews, load_checkpoint
+
+
+# Text search answers per place name; "Negado" is answered as a bad API key
+SEARCH = {
+    "Café Central": {"status": "OK", "results": [{"place_id": "p1"}]},
+    "Sem Resultados": {"status": "ZERO_RESULTS", "results": []},
+    "Negado": {"status": "REQUEST_DENIED", "error_message": "The provided API key is invalid."},
+}
+DETAILS = {
+    "p1": {"status": "OK", "result": {"name": "Café Central", "reviews": [
+        {"author_name": "Ana", "text": "Muito bom", "relative_time_description": "há um mês", "rating": 5},
+    ]}},
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path.endswith("/textsearch/json"):
+            payload = SEARCH[params["query"].split(",")[0]]
+        else:
+            payload = DETAILS.get(params["place_id"], {"status": "NOT_FOUND"})
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def base_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_api_errors_are_not_checkpointed(base_url, tmp_path):
+    locais = pd.DataFrame({"Cidade": "Porto", "Categoria": "cafe",
+                           "Nome": ["Café Central", "Sem Resultados", "Negado"]})
+    checkpoint = os.path.join(tmp_path, "reviews.checkpoint.jsonl")
+
+    reviews = collect_reviews(locais, "chave", checkpoint_path=checkpoint, base_url=base_url,
+                              rate=100, max_retries=0, cache_path=os.path.join(tmp_path, "cache.sqlite"))
+
+    assert reviews["Autor"].tolist() == ["Ana"]
+    done = load_checkpoint(checkpoint)
+    assert set(done) == {"Porto|cafe|Café Central", "Porto|cafe|Sem Resultados"}
+    assert done["Porto|cafe|Sem Resultados"]["place_id"] is None
+
+    # Once the key works, a resumed run collects the place that failed
+    SEARCH["Negado"] = {"status": "OK", "results": [{"place_id": "p2"}]}
+    try:
+        collect_reviews(locais, "chave", checkpoint_path=checkpoint, base_url=base_url, rate=100, max_retries=0)
+    finally:
+        SEARCH["Negado"] = {"status": "REQUEST_DENIED", "error_message": "The provided API key is invalid."}
+    # ... and, now complete, removes the checkpoint
+    assert not os.path.exists(checkpoint)
+
+
+def test_refresh_after_complete_run_asks_the_cache(base_url, tmp_path):
+    locais = pd.DataFrame({"Cidade": "Porto", "Categoria": "cafe", "Nome": ["Café Central"]})
+    checkpoint = os.path.join(tmp_path, "reviews.checkpoint.jsonl")
+    cache_path = os.path.join(tmp_path, "cache.sqlite")
+    collect_reviews(locais, "chave", checkpoint_path=checkpoint, base_url=base_url,
+                    rate=100, max_retries=0, cache_path=cache_path)
+    assert not os.path.exists(checkpoint)
+
+    # Details past their TTL are fetched again instead of replayed from the old run
+    review = {"author_name": "Rui", "text": "Novo", "relative_time_description": "há um dia", "rating": 4}
+    DETAILS["p1"]["result"]["reviews"].append(review)
+    try:
+        with sqlite3.connect(cache_path) as db:
+            db.execute("UPDATE details SET fetched_at = fetched_at - ?", (DETAILS_TTL + 1,))
+        reviews = collect_reviews(locais, "chave", checkpoint_path=checkpoint, base_url=base_url,
+                                  rate=100, max_retries=0, cache_path=cache_path)
+    finally:
+        DETAILS["p1"]["result"]["reviews"].remove(review)
+    assert reviews["Autor"].tolist() == ["Ana", "Rui"]
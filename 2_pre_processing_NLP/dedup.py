@@ -0,0 +1,104 @@
+# IGATP - Stable place IDs and deduplication
+#
+# Replaces the row-wise gerar_hash() (8-character SHA1 prefix of Nome +
+# Endereço) and the groupby / drop_duplicates / merge sequence that followed
+# it in pre_processing_NLP.ipynb:
+#   1. name and address are normalized with vectorized string operations
+#   2. id_unico is a 64-bit hash of the normalized pair (16 hex characters),
+#      checked for collisions over the whole table
+#   3. near-duplicates (the same place returned by several category or city
+#      searches, with small spelling differences) are grouped by blocking on
+#      the normalized address and comparing names inside each block only
+#   4. one canonical row per place is emitted with a single groupby
+
+import re
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+
+# Names inside the same address block at least this similar are the same place
+NAME_SIMILARITY = 0.9
+
+ID_HEX_CHARS = 16
+
+
+def normalizar(series):
+    """Lowercase, accent-free, punctuation-free, single-spaced strings (vectorized)."""
+    return (
+        series.fillna("").astype(str)
+        .str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+        .str.lower()
+        .str.replace(r"[^\w\s]", " ", regex=True)
+        .str.replace(r"\s+", " ", regex=True)
+        .str.strip()
+    )
+
+
+def gerar_ids(nome, endereco):
+    """Deterministic 64-bit id (hex) of the normalized (name, address) pair.
+
+    Raises ValueError if two different normalized pairs get the same id.
+    """
+    chave = (normalizar(nome) + "|" + normalizar(endereco)).to_numpy(dtype=object)
+    hashes = pd.util.hash_array(chave, categorize=True)
+
+    distinct = pd.DataFrame({"hash": hashes, "chave": chave}).drop_duplicates()
+    if distinct["hash"].duplicated().any():
+        collided = distinct[distinct["hash"].duplicated(keep=False)].sort_values("hash")
+        raise ValueError(f"id collision between {collided['chave'].head(2).tolist()}")
+
+    return pd.Series(np.char.mod(f"%0{ID_HEX_CHARS}x", hashes), index=nome.index, name="id_unico")
+
+
+def _same_place(a, b):
+    """Spelling variants of one name; numbers must match ("B1" and "B2" are different places)."""
+    if a == b:
+        return True
+    if re.findall(r"\d+", a) != re.findall(r"\d+", b):
+        return False
+    return SequenceMatcher(None, a, b).ratio() >= NAME_SIMILARITY
+
+
+def near_duplicate_groups(nome_norm, endereco_norm):
+    """Canonical position for every row: rows with the same address and similar names share it."""
+    canonical = np.arange(len(nome_norm))
+    nomes = nome_norm.to_numpy()
+    blocks = pd.Series(np.arange(len(nome_norm))).groupby(endereco_norm.to_numpy()).indices
+
+    for endereco, positions in blocks.items():
+        if not endereco or len(positions) < 2:
+            continue
+        # Distinct names of the block, each attached to the first similar one already seen
+        representatives = {}
+        for pos in positions:
+            nome = nomes[pos]
+            match = representatives.get(nome)
+            if match is None:
+                match = next((rep for rep_nome, rep in representatives.items() if _same_place(nome, rep_nome)), pos)
+                representatives[nome] = match
+            canonical[pos] = match
+    return canonical
+
+
+def canonical_places(avaliacoes, density_col="Locais_Semelhantes_Perto"):
+    """(avaliacoes with id_unico / id_canonico, one-row-per-place table).
+
+    The place table keeps the first row of every canonical place, lists
+    all its categories in `Categorias` and, as the notebook did with
+    id_unico, keeps the maximum `density_col` over the duplicates.
+    """
+    avaliacoes = avaliacoes.copy()
+    avaliacoes["id_unico"] = gerar_ids(avaliacoes["Nome"], avaliacoes["Endereço"])
+
+    canonical = near_duplicate_groups(normalizar(avaliacoes["Nome"]), normalizar(avaliacoes["Endereço"]))
+    avaliacoes["id_canonico"] = avaliacoes["id_unico"].to_numpy()[canonical]
+
+    # One real row per place (groupby "first" would take the first non-null value of each column separately)
+    locais = avaliacoes.drop_duplicates("id_canonico").set_index("id_canonico")
+    grupos = avaliacoes.groupby("id_canonico", sort=False)
+    if density_col in avaliacoes.columns:
+        locais[density_col] = grupos[density_col].max()
+    locais["Categorias"] = grupos["Categoria"].agg(lambda c: ", ".join(pd.unique(c.astype(str))))
+    return avaliacoes, locais.reset_index()
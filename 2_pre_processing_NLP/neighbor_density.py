@@ -0,0 +1,117 @@
+# IGATP - Density of similar places nearby (Locais_Semelhantes_Perto)
+#
+# Vectorized replacement for contar_proximos() of pre_processing_NLP.ipynb,
+# which computed a geopy geodesic from every place to every place of the
+# same category (O(n²) Python calls). Here each category gets a haversine
+# BallTree and all places are counted in one radius query. Several radii
+# are answered from the same query, and new places can be appended without
+# recomputing the existing ones.
+#
+# Distances are on the sphere (haversine) instead of the WGS84 ellipsoid:
+# at 100 m the difference is below 0.5 %, i.e. centimetres.
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def _radians(lat, lon):
+    return np.radians(np.column_stack([lat, lon]).astype(np.float64))
+
+
+class NeighborDensity:
+    """Per-category count of other places within each radius (metres).
+
+    As in contar_proximos, a place is not counted as its own neighbour,
+    including the other rows with the same `id_col`, and rows without
+    coordinates get NaN.
+    """
+
+    def __init__(self, radii=(100,), category_col="Categoria", id_col="id_unico",
+                 lat_col="Latitude", lon_col="Longitude"):
+        self.radii = np.asarray(sorted(radii), dtype=np.float64)
+        self.category_col = category_col
+        self.id_col = id_col
+        self.lat_col = lat_col
+        self.lon_col = lon_col
+        self.n_rows = 0
+        self._counts = np.zeros((0, len(self.radii)))
+        self._categories = {}  # categoria -> dict(coords, ids, rows, tree)
+        self._id_codes = {}
+
+    def _id_code(self, values):
+        return np.array([self._id_codes.setdefault(v, len(self._id_codes)) for v in values], dtype=np.int64)
+
+    def _pairs(self, tree, coords, ids_query, ids_tree):
+        """(query position, tree position, radius bin) of the pairs closer than the largest radius."""
+        ind, dist = tree.query_radius(coords, r=self.radii[-1] / EARTH_RADIUS_M, return_distance=True)
+        lengths = np.fromiter((len(i) for i in ind), dtype=np.int64, count=len(ind))
+        q = np.repeat(np.arange(len(ind)), lengths)
+        t = np.concatenate(ind) if len(ind) else np.zeros(0, dtype=np.int64)
+        d = np.concatenate(dist) * EARTH_RADIUS_M if len(ind) else np.zeros(0)
+
+        other = ids_query[q] != ids_tree[t]
+        q, t, d = q[other], t[other], d[other]
+        # First radius that strictly contains each pair (distance < raio, as in the notebook)
+        b = np.searchsorted(self.radii, d, side="right")
+        inside = b < len(self.radii)
+        return q[inside], t[inside], b[inside]
+
+    def _add_counts(self, rows, positions, bins):
+        """Add one neighbour at every radius >= bin for each (position, bin)."""
+        hist = np.zeros((len(rows), len(self.radii)))
+        np.add.at(hist, (positions, bins), 1)
+        self._counts[rows] += np.cumsum(hist, axis=1)
+
+    def append(self, df):
+        """Add places (rows of `df`) and update the counts of all places. Returns self."""
+        start = self.n_rows
+        self.n_rows += len(df)
+        self._counts = np.vstack([self._counts, np.full((len(df), len(self.radii)), np.nan)])
+
+        lat = df[self.lat_col].to_numpy(dtype=np.float64)
+        lon = df[self.lon_col].to_numpy(dtype=np.float64)
+        valid = ~(np.isnan(lat) | np.isnan(lon))
+        rows = np.arange(start, self.n_rows)
+        ids = self._id_code(df[self.id_col].tolist())
+        categorias = df[self.category_col].to_numpy()
+        self._counts[rows[valid]] = 0
+
+        # Places without a category match no other place (0, as `Categoria == NaN` in the notebook)
+        for categoria in pd.unique(categorias[valid & pd.notna(categorias)]):
+            sel = valid & (categorias == categoria)
+            new = {"coords": _radians(lat[sel], lon[sel]), "ids": ids[sel], "rows": rows[sel]}
+            new["tree"] = BallTree(new["coords"], metric="haversine")
+
+            # New places among themselves
+            q, t, b = self._pairs(new["tree"], new["coords"], new["ids"], new["ids"])
+            self._add_counts(new["rows"], q, b)
+
+            old = self._categories.get(categoria)
+            if old is not None:
+                # New x existing pairs, counted on both sides
+                q, t, b = self._pairs(old["tree"], new["coords"], new["ids"], old["ids"])
+                self._add_counts(new["rows"], q, b)
+                self._counts[old["rows"]] += np.cumsum(
+                    np.bincount(t * len(self.radii) + b, minlength=len(old["rows"]) * len(self.radii))
+                    .reshape(len(old["rows"]), len(self.radii)), axis=1)
+
+                coords = np.vstack([old["coords"], new["coords"]])
+                new = {"coords": coords, "ids": np.concatenate([old["ids"], new["ids"]]),
+                       "rows": np.concatenate([old["rows"], new["rows"]]),
+                       "tree": BallTree(coords, metric="haversine")}
+            self._categories[categoria] = new
+        return self
+
+    def counts(self):
+        """DataFrame (one row per appended place, in order) with one column per radius."""
+        return pd.DataFrame(self._counts, columns=[int(r) if r == int(r) else r for r in self.radii])
+
+
+def contar_proximos(df, raio=100, **kwargs):
+    """Locais_Semelhantes_Perto for every row of `df` (same index), as the notebook's apply."""
+    counts = NeighborDensity(radii=(raio,), **kwargs).append(df).counts()
+    return pd.Series(counts.iloc[:, 0].to_numpy(), index=df.index, name="Locais_Semelhantes_Perto")
@@ -0,0 +1,184 @@
+# IGATP - Streaming NLP preprocessing of the review comments
+#
+# Usage:  python nlp_pipeline.py ../1_data_collection/google_places_API/csv/comments_google_maps_AMP.csv comments_clean.csv
+#
+# Same steps as the comments part of pre_processing_NLP.ipynb, without
+# loading the whole CSV or running everything on one core:
+#   - the CSV is read in chunks (generator), so memory is bounded by
+#     CHUNK_SIZE x the number of chunks in flight
+#   - relative dates ("há 10 meses") are parsed once per distinct string
+#   - language detection, translation (translation.py, cached), cleaning,
+#     spaCy lemmatization and TextBlob polarity run in a process pool, one
+#     chunk per task, results written in input order as they arrive
+#   - Polaridade_Média (mean per Nome_Local) is accumulated while streaming
+#     and merged in a final chunked pass
+#   - translation threads (--translation-threads) are a total for the run,
+#     split between the worker processes
+
+import argparse
+import os
+import string
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import dateparser
+import pandas as pd
+import spacy
+from spacy.lang.en.stop_words import STOP_WORDS
+from textblob import TextBlob
+
+from translation import detectar_idioma, traduzir_textos
+
+
+CHUNK_SIZE = 2000
+
+# Concurrent translation requests for the whole run (divided by the number of workers)
+TRANSLATION_THREADS = 4
+
+# Columns added to the comments, in output order
+NEW_COLUMNS = ["Data_Convertida", "Idioma", "translated_text", "Texto_Normalizado", "Texto_Lematizado",
+               "Polaridade", "Polaridade_Média"]
+
+# Personalizar a lista de stopwords: manter 'not'
+custom_stopwords = STOP_WORDS - {"not"}
+
+# Modelo spaCy, carregado uma vez por processo
+_nlp = None
+
+
+def _init_worker():
+    global _nlp
+    _nlp = spacy.load("en_core_web_sm", disable=["parser", "ner"])
+
+
+def ler_chunks(path, chunk_size=CHUNK_SIZE):
+    """Comment chunks without missing texts, with `Texto` stripped."""
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        chunk = chunk.dropna(subset=["Texto"])
+        chunk["Texto"] = chunk["Texto"].astype(str).str.strip()
+        yield chunk
+
+
+class ConversorDatas:
+    """dateparser for relative dates, memoized per distinct string (there are only a few dozen)."""
+
+    def __init__(self, base=None):
+        self.settings = {"RELATIVE_BASE": base or datetime.today()}
+        self.cache = {}
+
+    def converter(self, datas):
+        novas = [d for d in pd.unique(datas.dropna()) if d not in self.cache]
+        for d in novas:
+            self.cache[d] = dateparser.parse(d, settings=self.settings)
+        # Apenas a data (sem horas), como no notebook
+        return pd.to_datetime(datas.map(self.cache), errors="coerce").dt.normalize()
+
+
+def normalizar_texto(textos):
+    """Lowercase, no punctuation, single spaces (vectorized normalizar_texto of the notebook)."""
+    return (
+        textos.fillna("").astype(str)
+        .str.lower()
+        .str.replace(r"[{}]".format(string.punctuation), "", regex=True)
+        .str.replace(r"\s+", " ", regex=True)
+        .str.strip()
+    )
+
+
+def lematizar(textos):
+    """Lemmas without stopwords (except 'not') and punctuation, with spaCy's batched nlp.pipe."""
+    out = []
+    for doc in _nlp.pipe(textos, batch_size=256):
+        out.append(" ".join(
+            token.lemma_ for token in doc
+            if token.text.lower() not in custom_stopwords and not token.is_punct
+        ))
+    return out
+
+
+def processar_chunk(chunk, traduzir=True, cache_path="translation_cache.sqlite", translation_threads=1):
+    """Idioma, translated_text, Texto_Normalizado, Texto_Lematizado and Polaridade for one chunk."""
+    if traduzir:
+        idiomas, translated = traduzir_textos(chunk["Texto"].tolist(), cache_path=cache_path,
+                                              max_workers=translation_threads)
+    else:
+        idiomas, translated = [detectar_idioma(t) for t in chunk["Texto"]], chunk["Texto"].tolist()
+    chunk["Idioma"] = idiomas
+    chunk["translated_text"] = translated
+
+    chunk["Texto_Normalizado"] = normalizar_texto(chunk["translated_text"])
+    chunk["Texto_Lematizado"] = lematizar(chunk["Texto_Normalizado"].tolist())
+    chunk["Polaridade"] = [TextBlob(t).sentiment.polarity for t in chunk["Texto_Lematizado"]]
+    return chunk
+
+
+def _map_ordered(pool, fn, items, max_in_flight, **kwargs):
+    """pool.map that keeps at most `max_in_flight` tasks submitted (bounded memory), in order."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item, **kwargs))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def run_pipeline(input_csv, output_csv, chunk_size=CHUNK_SIZE, workers=None, traduzir=True,
+                 cache_path="translation_cache.sqlite", translation_threads=TRANSLATION_THREADS):
+    """Stream `input_csv` through the NLP steps into `output_csv`. Returns the number of comments."""
+    workers = workers or os.cpu_count() or 1
+    # Each worker translates its chunk with its own thread pool
+    threads_por_worker = max(1, translation_threads // workers)
+    datas = ConversorDatas()
+    parte = output_csv + ".part"
+    somas = pd.DataFrame(columns=["soma", "n"], dtype="float64")
+    total = 0
+
+    def chunks_com_datas():
+        for chunk in ler_chunks(input_csv, chunk_size):
+            chunk["Data_Convertida"] = datas.converter(chunk["Data"])
+            yield chunk
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        results = _map_ordered(pool, processar_chunk, chunks_com_datas(), 2 * workers,
+                               traduzir=traduzir, cache_path=cache_path, translation_threads=threads_por_worker)
+        for i, chunk in enumerate(results):
+            chunk.to_csv(parte, mode="w" if i == 0 else "a", header=i == 0, index=False, encoding="utf-8")
+            por_local = chunk.groupby("Nome_Local")["Polaridade"].agg(soma="sum", n="count")
+            somas = somas.add(por_local, fill_value=0)
+            total += len(chunk)
+            print(f"✔️ {total} comentários processados")
+
+    if not os.path.exists(parte):
+        # Nenhum chunk escrito (ficheiro sem comentários): saída só com o cabeçalho
+        colunas = pd.read_csv(input_csv, nrows=0).columns.tolist() + NEW_COLUMNS
+        pd.DataFrame(columns=colunas).to_csv(output_csv, index=False, encoding="utf-8-sig")
+        return 0
+
+    # Calcular média da polaridade por local e juntar (segunda passagem, também por chunks)
+    average_polarity = (somas["soma"] / somas["n"]).rename("Polaridade_Média")
+    for i, chunk in enumerate(pd.read_csv(parte, chunksize=chunk_size)):
+        chunk = chunk.merge(average_polarity, left_on="Nome_Local", right_index=True, how="left")
+        chunk.to_csv(output_csv, mode="w" if i == 0 else "a", header=i == 0, index=False,
+                     encoding="utf-8-sig" if i == 0 else "utf-8")
+    os.remove(parte)
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunked NLP preprocessing of the Google Maps comments.")
+    parser.add_argument("input_csv")
+    parser.add_argument("output_csv")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-translate", action="store_true")
+    parser.add_argument("--translation-cache", default="translation_cache.sqlite")
+    parser.add_argument("--translation-threads", type=int, default=TRANSLATION_THREADS,
+                        help="Concurrent translation requests in total (split between the workers)")
+    args = parser.parse_args()
+
+    total = run_pipeline(args.input_csv, args.output_csv, args.chunk_size, args.workers,
+                         traduzir=not args.no_translate, cache_path=args.translation_cache,
+                         translation_threads=args.translation_threads)
+    print(f"✅ {total} comentários tratados! Guardado em '{args.output_csv}'")
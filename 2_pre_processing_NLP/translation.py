@@ -0,0 +1,175 @@
+# IGATP - Batched, cached translation of the review texts to English
+#
+# Replaces the per-comment GoogleTranslator call (plus time.sleep) of
+# pre_processing_NLP.ipynb:
+#   - identical texts are translated once (keyed by a hash of their content)
+#   - texts detected as English locally (langdetect) are never sent
+#   - the remaining texts are packed into batches of up to MAX_BATCH_CHARS,
+#     translated by a small thread pool, one request per batch
+#   - detections and translations are kept in a SQLite cache, so re-running
+#     the stage after new reviews only translates the new texts
+
+import hashlib
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from deep_translator import GoogleTranslator
+from langdetect import DetectorFactory, detect
+from langdetect.lang_detect_exception import LangDetectException
+
+
+# Para garantir resultados consistentes
+DetectorFactory.seed = 0
+
+# Google Translate accepts up to 5000 characters per request
+MAX_BATCH_CHARS = 4500
+
+# Line used to join the texts of one batch and split the translation back.
+# Texts that contain the marker themselves are never batched
+MARKER = "###"
+SEPARATOR = f"\n\n{MARKER}\n\n"
+
+
+def text_hash(texto):
+    return hashlib.sha1(str(texto).strip().encode("utf-8")).hexdigest()
+
+
+def detectar_idioma(texto):
+    """Language code of `texto` ("unknown" when langdetect cannot decide)."""
+    try:
+        return detect(str(texto))
+    except LangDetectException:
+        return "unknown"
+
+
+class TranslationCache:
+    """SQLite cache: text hash -> (detected language, English text)."""
+
+    def __init__(self, path):
+        # timeout: the NLP pipeline workers share the cache file
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS translations (
+                hash TEXT PRIMARY KEY,
+                idioma TEXT,
+                text_en TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+
+    def close(self):
+        self.db.close()
+
+    def get_many(self, hashes):
+        """{hash: (idioma, text_en)} for the hashes present in the cache."""
+        out = {}
+        hashes = list(hashes)
+        for start in range(0, len(hashes), 900):  # SQLite parameter limit
+            chunk = hashes[start:start + 900]
+            rows = self.db.execute(
+                f"SELECT hash, idioma, text_en FROM translations WHERE hash IN ({','.join('?' * len(chunk))})", chunk)
+            out.update({h: (idioma, text_en) for h, idioma, text_en in rows})
+        return out
+
+    def put_many(self, rows):
+        """rows: iterable of (hash, idioma, text_en); text_en may be None (not translated yet)."""
+        now = time.time()
+        self.db.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)",
+                            [(h, idioma, text_en, now) for h, idioma, text_en in rows])
+        self.db.commit()
+
+
+def make_batches(items, max_chars=MAX_BATCH_CHARS):
+    """Pack (hash, text) pairs into lists whose joined length stays under `max_chars`.
+
+    A text containing MARKER gets a batch of its own, so the translation of a
+    batch splits back only on the separators.
+    """
+    batches, current, size = [], [], 0
+    for item in items:
+        if MARKER in item[1]:
+            batches.append([item])
+            continue
+        length = len(item[1]) + len(SEPARATOR)
+        if current and size + length > max_chars:
+            batches.append(current)
+            current, size = [], 0
+        current.append(item)
+        size += length
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _translate_batch(batch, target="en"):
+    """{hash: translation} for one batch; texts are retried one by one if the batch does not split back."""
+    translator = GoogleTranslator(source="auto", target=target)
+    texts = [text for _, text in batch]
+    try:
+        parts = translator.translate(SEPARATOR.join(texts)).split(MARKER) if len(batch) > 1 else None
+        if parts is not None and len(parts) == len(batch):
+            return {h: part.strip() for (h, _), part in zip(batch, parts)}
+    except Exception as e:
+        print(f"Erro ao traduzir lote: {e}")
+
+    out = {}
+    for h, text in batch:
+        try:
+            out[h] = translator.translate(text)
+        except Exception as e:
+            print(f"Erro ao traduzir: {e}")
+    return out
+
+
+def traduzir_textos(textos, idiomas=None, cache_path="translation_cache.sqlite", max_workers=4,
+                    max_chars=MAX_BATCH_CHARS):
+    """English version of every text (original text when already English or untranslatable).
+
+    Returns (idiomas, translated) as lists aligned with `textos`. `idiomas`
+    may be given (e.g. an existing Idioma column) to skip detection.
+    """
+    textos = ["" if pd.isna(t) else str(t) for t in textos]
+    hashes = [text_hash(t) for t in textos]
+    unique = dict(zip(hashes, textos))
+
+    cache = TranslationCache(cache_path)
+    try:
+        known = cache.get_many(unique)
+
+        # Language of the new texts (local, no network)
+        given = dict(zip(hashes, idiomas)) if idiomas is not None else {}
+        novos = [h for h in unique if h not in known]
+        detected = {h: given[h] if pd.notna(given.get(h)) and given[h] else detectar_idioma(unique[h])
+                    for h in novos}
+        cache.put_many((h, detected[h], unique[h] if detected[h] == "en" else None) for h in novos)
+        known.update({h: (detected[h], unique[h] if detected[h] == "en" else None) for h in novos})
+
+        # Only non-English texts without a cached translation go to the API
+        pending = [(h, unique[h]) for h, (idioma, text_en) in known.items()
+                   if text_en is None and unique[h].strip()]
+        batches = make_batches(pending, max_chars)
+        print(f"🌍 {len(unique)} textos únicos, {len(pending)} por traduzir em {len(batches)} lotes")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for result in pool.map(_translate_batch, batches):
+                cache.put_many((h, known[h][0], text_en) for h, text_en in result.items())
+                known.update({h: (known[h][0], text_en) for h, text_en in result.items()})
+    finally:
+        cache.close()
+
+    idiomas_out = [known[h][0] for h in hashes]
+    translated = [known[h][1] if known[h][1] is not None else texto for h, texto in zip(hashes, textos)]
+    return idiomas_out, translated
+
+
+def traduzir_comentarios(comentarios, coluna_texto="Texto", cache_path="translation_cache.sqlite", **kwargs):
+    """Adds `Idioma` (when missing) and `translated_text` columns to the comments DataFrame."""
+    comentarios = comentarios.copy()
+    idiomas = comentarios["Idioma"].tolist() if "Idioma" in comentarios.columns else None
+    idiomas, translated = traduzir_textos(comentarios[coluna_texto].tolist(), idiomas,
+                                          cache_path=cache_path, **kwargs)
+    comentarios["Idioma"] = idiomas
+    comentarios["translated_text"] = translated
+    return comentarios
@@ -0,0 +1,180 @@
+# IGATP - Incremental Empirical Bayes rating adjustment
+#
+# Same model as bayesian_rating_adjustment.ipynb:
+#   mu_global = mean of the place ratings
+#   sigma2    = variance of the individual comment ratings
+#   tau2      = max(0, var(place ratings) - mean(sigma2 / n_i))
+#   shrinkage = tau2 / (tau2 + sigma2 / n_i)
+#   Rating_Bayes = shrinkage * Rating + (1 - shrinkage) * mu_global
+# but kept up to date from running sufficient statistics instead of being
+# recomputed from the full rating and comment history:
+#   - comment ratings: count, mean and M2 (Welford / Chan merge of batches)
+#   - places: sum and sum of squares of the ratings, sum of 1/n_i
+# Ingesting a batch of reviews costs O(batch). Rating_Bayes and its min-max
+# normalization are only recomputed for the affected places while the
+# hyperparameters move less than `tolerance`; the whole table is refreshed
+# (vectorized, O(places)) when they drift further.
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class BayesUpdater:
+    """Rating_Bayes per place, updated in O(batch) as new reviews arrive."""
+
+    def __init__(self, places, comment_stats, tolerance=1e-3):
+        """`places`: DataFrame indexed by id_unico with Rating and Total_Reviews.
+        `comment_stats`: (count, mean, M2) of the individual comment ratings."""
+        self.places = places[["Rating", "Total_Reviews"]].astype("float64").copy()
+        # Object index: label lookups on an Arrow string index convert the whole index each time
+        self.places.index = self.places.index.astype(object)
+        self.count, self.mean, self.m2 = comment_stats
+        self.tolerance = tolerance
+
+        rating = self.places["Rating"].to_numpy()
+        n = self.places["Total_Reviews"].to_numpy()
+        self.sum_rating = rating.sum()
+        self.sum_rating2 = (rating ** 2).sum()
+        self.sum_inv_n = (1.0 / n[n > 0]).sum()
+        self.n_reviewed = int((n > 0).sum())
+
+        self.hyper = self.hyperparameters()
+        self._score(self.places.index)
+        self._normalize(None)
+
+    @classmethod
+    def from_data(cls, ratings_df, comment_ratings, tolerance=1e-3):
+        """Start from the notebook inputs (ratings_geocoded.csv rows, comments_clean.csv Rating)."""
+        ratings = pd.Series(comment_ratings, dtype="float64").dropna()
+        m2 = ((ratings - ratings.mean()) ** 2).sum()
+        places = ratings_df.set_index("id_unico")
+        places = places.assign(Total_Reviews=places["Total_Reviews"].fillna(0))
+        return cls(places, (len(ratings), ratings.mean(), m2), tolerance)
+
+    # Sufficient statistics -> hyperparameters
+
+    def hyperparameters(self):
+        """(mu_global, sigma2, tau2) from the running statistics, as computed in the notebook."""
+        n_places = len(self.places)
+        mu_global = self.sum_rating / n_places
+        var_local = (self.sum_rating2 - n_places * mu_global ** 2) / (n_places - 1)
+        sigma2 = self.m2 / (self.count - 1)
+        tau2 = max(0.0, var_local - sigma2 * self.sum_inv_n / self.n_reviewed)
+        return mu_global, sigma2, tau2
+
+    def _drift(self, new):
+        return max(abs(a - b) / max(abs(b), 1e-12) for a, b in zip(new, self.hyper))
+
+    def _score(self, ids):
+        mu_global, sigma2, tau2 = self.hyper
+        sub = self.places.loc[ids]
+        n = sub["Total_Reviews"].replace(0, np.nan)
+        shrinkage = tau2 / (tau2 + sigma2 / n)
+        self.places.loc[ids, "shrinkage"] = shrinkage
+        # Locais sem reviews ficam com a média global
+        self.places.loc[ids, "Rating_Bayes"] = (shrinkage * sub["Rating"] + (1 - shrinkage) * mu_global).fillna(mu_global)
+
+    def _normalize(self, ids, previous=None):
+        """Min-max Rating_Bayes_norm; only `ids` are rescaled while the range does not change.
+
+        The bounds are kept up to date from the rescored values (`previous`
+        holds their Rating_Bayes before the update); the column is only
+        scanned again when a place that held a bound moves inwards.
+        """
+        rating_bayes = self.places["Rating_Bayes"]
+        if ids is None:
+            bounds = (rating_bayes.min(), rating_bayes.max())
+        else:
+            low, high = self._bounds
+            values = rating_bayes.loc[ids]
+            moved = values.to_numpy() != previous.to_numpy()
+            if (moved & ((previous.to_numpy() == low) | (previous.to_numpy() == high))).any():
+                bounds = (rating_bayes.min(), rating_bayes.max())
+            else:
+                bounds = (min(low, values.min()), max(high, values.max()))
+        if ids is None or bounds != self._bounds:
+            self._bounds = bounds
+            ids = self.places.index
+        low, high = bounds
+        self.places.loc[ids, "Rating_Bayes_norm"] = (
+            (rating_bayes.loc[ids] - low) / (high - low) if high > low else 0.0
+        )
+
+    # Updates
+
+    def _merge_comments(self, ratings):
+        """Chan et al. merge of a batch into (count, mean, M2)."""
+        count_b, mean_b = len(ratings), ratings.mean()
+        m2_b = ((ratings - mean_b) ** 2).sum()
+        total = self.count + count_b
+        delta = mean_b - self.mean
+        self.mean += delta * count_b / total
+        self.m2 += m2_b + delta ** 2 * self.count * count_b / total
+        self.count = total
+
+    def _set_places(self, ids, rating, n):
+        """Replace the (Rating, Total_Reviews) of `ids` in the table and in the running sums."""
+        old = self.places.loc[ids, ["Rating", "Total_Reviews"]].to_numpy()
+        old_rating, old_n = old[:, 0], old[:, 1]
+        self.sum_rating += (rating - old_rating).sum()
+        self.sum_rating2 += (rating ** 2 - old_rating ** 2).sum()
+        self.sum_inv_n += (1.0 / n[n > 0]).sum() - (1.0 / old_n[old_n > 0]).sum()
+        self.n_reviewed += int((n > 0).sum() - (old_n > 0).sum())
+        self.places.loc[ids, ["Rating", "Total_Reviews"]] = np.column_stack([rating, n])
+
+    def add_reviews(self, reviews, key="id_unico"):
+        """Ingest new reviews (columns `key`, Rating). Returns the ids whose Rating_Bayes was recomputed.
+
+        Places not seen before are added with the mean and count of their
+        new reviews.
+        """
+        reviews = reviews.dropna(subset=["Rating"])
+        if reviews.empty:
+            return pd.Index([])
+        self._merge_comments(reviews["Rating"].to_numpy(dtype=np.float64))
+
+        batch = reviews.groupby(key)["Rating"].agg(["sum", "count"])
+        novos = batch.index.difference(self.places.index)
+        if len(novos):
+            # All new places in one concat (enlarging with .loc copies the frame per place)
+            self.places = pd.concat([self.places, pd.DataFrame({"Rating": 0.0, "Total_Reviews": 0.0}, index=novos)])
+            self.places.index = self.places.index.astype(object)
+        current = self.places.loc[batch.index]
+        previous = current["Rating_Bayes"]
+        rating, n = current["Rating"].to_numpy(), current["Total_Reviews"].to_numpy()
+        soma, k = batch["sum"].to_numpy(dtype=np.float64), batch["count"].to_numpy(dtype=np.float64)
+        self._set_places(batch.index, (rating * n + soma) / (n + k), n + k)
+
+        new_hyper = self.hyperparameters()
+        if self._drift(new_hyper) > self.tolerance:
+            self.hyper = new_hyper
+            affected = self.places.index
+            self._score(affected)
+            self._normalize(None)
+        else:
+            affected = batch.index
+            self._score(affected)
+            self._normalize(affected, previous)
+        return affected
+
+    def frame(self):
+        """Current table: id_unico, Rating, Total_Reviews, shrinkage, Rating_Bayes, Rating_Bayes_norm."""
+        return self.places.rename_axis("id_unico").reset_index()
+
+    # Persistence (daily refreshes start from here instead of the full history)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.places.rename_axis("id_unico").to_csv(os.path.join(directory, "places_state.csv"))
+        with open(os.path.join(directory, "comment_stats.json"), "w") as f:
+            json.dump({"count": self.count, "mean": self.mean, "m2": self.m2, "tolerance": self.tolerance}, f)
+
+    @classmethod
+    def load(cls, directory):
+        places = pd.read_csv(os.path.join(directory, "places_state.csv"), index_col="id_unico")
+        with open(os.path.join(directory, "comment_stats.json")) as f:
+            stats = json.load(f)
+        return cls(places, (stats["count"], stats["mean"], stats["m2"]), stats["tolerance"])
@@ -0,0 +1,103 @@
+# IGATP - Hierarchical Empirical Bayes priors (per thematic group / municipality)
+#
+# Generalizes bayesian_rating_adjustment.ipynb, where every place shrinks
+# towards one mu_global with one tau2: here the prior mean and between-place
+# variance are estimated per group of a chosen level (Grupo_Tematico,
+# Cidade, ...) by method of moments, all groups at once with np.bincount.
+# With iterations > 1 the moments are re-estimated with precision weights
+# 1 / (tau2_g + sigma2 / n_i). Groups with fewer than `min_places` places
+# use the global prior. level=None reproduces the notebook exactly.
+
+import numpy as np
+import pandas as pd
+
+
+# Prior levels offered to the composite index / dashboard
+PRIOR_LEVELS = {
+    "global": None,
+    "theme": "Grupo_Tematico",
+    "municipality": "Cidade",
+}
+
+MIN_PLACES = 5
+
+
+def _moments(codes, n_groups, rating, s, weights=None):
+    """Per-group (mu, tau2) by method of moments; `s` = sigma2 / n_i (NaN without reviews)."""
+    count = np.bincount(codes, minlength=n_groups).astype(np.float64)
+    reviewed = ~np.isnan(s)
+
+    if weights is None:
+        # Notebook estimator: plain mean and variance (ddof=1) of the ratings,
+        # minus the mean sampling variance of the places with reviews
+        total = np.bincount(codes, weights=rating, minlength=n_groups)
+        mu = total / count
+        dev2 = np.bincount(codes, weights=(rating - mu[codes]) ** 2, minlength=n_groups)
+        var = dev2 / np.maximum(count - 1, 1)
+        n_rev = np.bincount(codes[reviewed], minlength=n_groups)
+        mean_s = np.bincount(codes[reviewed], weights=s[reviewed], minlength=n_groups) / np.maximum(n_rev, 1)
+        return mu, np.maximum(0.0, var - mean_s), count
+
+    # Precision-weighted re-estimate (places with reviews only)
+    c, w, r, si = codes[reviewed], weights[reviewed], rating[reviewed], s[reviewed]
+    w_sum = np.bincount(c, weights=w, minlength=n_groups)
+    mu = np.bincount(c, weights=w * r, minlength=n_groups) / np.where(w_sum > 0, w_sum, np.nan)
+    excess = np.bincount(c, weights=w * ((r - mu[c]) ** 2 - si), minlength=n_groups)
+    tau2 = np.maximum(0.0, excess / np.where(w_sum > 0, w_sum, np.nan))
+    return mu, tau2, count
+
+
+def fit_priors(df, sigma2, level=None, iterations=1, min_places=MIN_PLACES,
+               rating_col="Rating", n_col="Total_Reviews"):
+    """Prior mean and variance per group of `level` (DataFrame indexed by group: mu_prior, tau2_prior, n_places)."""
+    rating = df[rating_col].to_numpy(dtype=np.float64)
+    n = df[n_col].fillna(0).to_numpy(dtype=np.float64)
+    s = np.where(n > 0, sigma2 / np.where(n > 0, n, 1), np.nan)
+
+    zeros = np.zeros(len(df), dtype=np.int64)
+    mu_g, tau2_g, _ = _moments(zeros, 1, rating, s)
+    if level is None:
+        codes, groups = zeros, pd.Index(["global"])
+    else:
+        codes, groups = pd.factorize(df[level].fillna("(missing)"))
+    n_groups = len(groups)
+
+    mu, tau2, count = _moments(codes, n_groups, rating, s)
+    for _ in range(iterations - 1):
+        weights = 1.0 / (tau2[codes] + s)
+        mu_new, tau2_new, _ = _moments(codes, n_groups, rating, s, weights)
+        # Groups without reviewed places keep the unweighted estimate
+        mu = np.where(np.isnan(mu_new), mu, mu_new)
+        tau2 = np.where(np.isnan(tau2_new), tau2, tau2_new)
+
+    small = count < min_places
+    mu = np.where(small, mu_g[0], mu)
+    tau2 = np.where(small, tau2_g[0], tau2)
+    return pd.DataFrame({"mu_prior": mu, "tau2_prior": tau2, "n_places": count.astype(int)},
+                        index=pd.Index(groups, name=level or "level"))
+
+
+def shrink(df, sigma2, level=None, iterations=1, min_places=MIN_PLACES,
+           rating_col="Rating", n_col="Total_Reviews"):
+    """mu_prior, tau2_prior, shrinkage and Rating_Bayes for every row of `df` (same index)."""
+    priors = fit_priors(df, sigma2, level, iterations, min_places, rating_col, n_col)
+    if level is None:
+        row_priors = priors.iloc[np.zeros(len(df), dtype=np.int64)]
+    else:
+        row_priors = priors.loc[df[level].fillna("(missing)")]
+
+    mu = row_priors["mu_prior"].to_numpy()
+    tau2 = row_priors["tau2_prior"].to_numpy()
+    n = df[n_col].fillna(0).to_numpy(dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shrinkage = np.where(n > 0, tau2 / (tau2 + sigma2 / n), np.nan)
+    # Locais sem reviews ficam com a média do prior
+    rating_bayes = np.where(n > 0, shrinkage * df[rating_col].to_numpy(dtype=np.float64) + (1 - shrinkage) * mu, mu)
+    return pd.DataFrame({"mu_prior": mu, "tau2_prior": tau2, "shrinkage": shrinkage,
+                         "Rating_Bayes": rating_bayes}, index=df.index)
+
+
+def rating_bayes_levels(df, sigma2, levels=PRIOR_LEVELS, **kwargs):
+    """One Rating_Bayes_<level> column per prior level, so consumers can switch level without refitting."""
+    return pd.DataFrame({f"Rating_Bayes_{name}": shrink(df, sigma2, level, **kwargs)["Rating_Bayes"]
+                         for name, level in levels.items()}, index=df.index)
@@ -0,0 +1,267 @@
+# IGATP - Composite index scoring library
+#
+# Usage:  python scoring.py                     # fit on the current data, write composite_index.csv
+#         python scoring.py --score new.csv     # score new places with the saved parameters
+#
+# One implementation of composite_index.ipynb, used by the pipeline and by
+# the dashboard engine:
+#   - average polarity is attached to the places by id_unico: comments are
+#     linked to the place row with the same Cidade / Nome, and by name only
+#     (as in the notebook) when the search city has no place of that name.
+#     The comment Categoria is the Portuguese search term ("restaurante"),
+#     not the Google place type, so it is not part of the key
+#   - the normalization of each sub-index is fitted once and its parameters
+#     are saved (scoring_params.json), so new places are scored in O(new
+#     rows) without refitting; besides the notebook's min-max there are
+#     rank, log min-max and robust (5th-95th percentile) normalizations
+#   - IGATP accepts one weight vector or a (k, 3) array of them, computed
+#     as a single matrix product
+#   - Rating_Bayes is also computed under the theme and municipality priors
+#     of hierarchical_bayes.py (Rating_Bayes_<level> and its normalized
+#     Rating_Bayes_norm_<level>), so the dashboard can switch prior level
+#     without rerunning the pipeline
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+COMPOSITE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(COMPOSITE_DIR)
+RATINGS_CSV = os.path.join(PROJECT_DIR, "4_bayesian_rating_adjustment", "ratings_with_bayesian_adjustment.csv")
+COMMENTS_CSV = os.path.join(PROJECT_DIR, "2_pre_processing_NLP", "comments_clean.csv")
+OUTPUT_CSV = os.path.join(COMPOSITE_DIR, "composite_index.csv")
+PARAMS_JSON = os.path.join(COMPOSITE_DIR, "scoring_params.json")
+
+sys.path.insert(0, os.path.join(PROJECT_DIR, "4_bayesian_rating_adjustment"))
+from hierarchical_bayes import PRIOR_LEVELS, rating_bayes_levels  # noqa: E402
+
+# Raw column -> normalized sub-index
+SUBINDEX_SOURCES = {
+    "Rating_Bayes_norm": "Rating_Bayes",
+    "Popularity_norm": "Total_Reviews",
+    "Sentiment_norm": "Avg_Polarity",
+}
+SUBINDICES = list(SUBINDEX_SOURCES)
+
+# Rating_Bayes under each prior level -> its normalized column (same method as Rating_Bayes_norm)
+PRIOR_SOURCES = {f"Rating_Bayes_norm_{name}": f"Rating_Bayes_{name}" for name in PRIOR_LEVELS}
+EQUAL_WEIGHTS = (1/3, 1/3, 1/3)
+
+# Notebook choice: min-max for the three sub-indices
+DEFAULT_METHODS = {"Rating_Bayes_norm": "minmax", "Popularity_norm": "minmax", "Sentiment_norm": "minmax"}
+
+# Comments are linked to the place rows with the same search city and name
+PLACE_KEY = ["Cidade", "Nome"]
+
+# Share of the places with comments in the current composite_index.csv that
+# may lose them on a rebuild (generic names such as "Jardim", which the
+# notebook's name-only join gave the comments of every place of that name)
+COVERAGE_TOLERANCE = 0.01
+
+
+# Normalizations
+
+class Normalizer:
+    """Maps one raw column to [0, 1] with parameters fitted on a reference set."""
+
+    METHODS = ("minmax", "rank", "log_minmax", "robust")
+
+    def __init__(self, method="minmax", params=None):
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown normalization: {method}")
+        self.method = method
+        self.params = params or {}
+
+    def fit(self, values):
+        x = np.asarray(values, dtype=np.float64)
+        x = x[~np.isnan(x)]
+        if self.method == "minmax":
+            self.params = {"low": float(x.min()), "high": float(x.max())}
+        elif self.method == "log_minmax":
+            lx = np.log1p(np.maximum(x, 0.0))
+            self.params = {"low": float(lx.min()), "high": float(lx.max())}
+        elif self.method == "robust":
+            low, high = np.percentile(x, [5, 95])
+            self.params = {"low": float(low), "high": float(high)}
+        else:
+            # Sorted reference values: a new value is placed by binary search
+            self.params = {"reference": np.sort(x).tolist()}
+        return self
+
+    def transform(self, values):
+        x = np.asarray(values, dtype=np.float64)
+        if self.method == "rank":
+            ref = np.asarray(self.params["reference"])
+            # Mid-rank of x among the reference values, scaled to [0, 1]
+            below = np.searchsorted(ref, x, side="left")
+            upto = np.searchsorted(ref, x, side="right")
+            out = ((below + upto - 1) / 2) / max(len(ref) - 1, 1)
+            return np.where(np.isnan(x), np.nan, np.clip(out, 0.0, 1.0))
+
+        if self.method == "log_minmax":
+            x = np.log1p(np.maximum(x, 0.0))
+        low, high = self.params["low"], self.params["high"]
+        out = (x - low) / (high - low) if high > low else np.zeros_like(x)
+        # Same scale as MinMaxScaler on the reference; robust also clips the tails
+        return np.clip(out, 0.0, 1.0) if self.method == "robust" else out
+
+    def to_dict(self):
+        return {"method": self.method, "params": self.params}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["method"], data["params"])
+
+
+# Scoring
+
+def igatp(X, weights=EQUAL_WEIGHTS):
+    """IGATP of the sub-index matrix X (n, 3): (n,) for one weight vector, (n, k) for a (k, 3) array."""
+    X = np.asarray(X, dtype=np.float64)
+    W = np.asarray(weights, dtype=np.float64)
+    return X @ W.T
+
+
+class CompositeScorer:
+    """Fitted normalizations of the three sub-indices (and the sentiment fill value)."""
+
+    def __init__(self, methods=None):
+        self.methods = {**DEFAULT_METHODS, **(methods or {})}
+        self.normalizers = {}
+        self.sentiment_fill = None
+
+    def fit(self, places):
+        """Fit on the places table (Rating_Bayes, Total_Reviews, Avg_Polarity and any Rating_Bayes_<level>)."""
+        # Places without comments get the mean polarity of the reference set
+        self.sentiment_fill = float(places["Avg_Polarity"].mean())
+        filled = self._fill(places)
+        self.normalizers = {col: Normalizer(self.methods[col]).fit(filled[source])
+                            for col, source in SUBINDEX_SOURCES.items()}
+        for col, source in PRIOR_SOURCES.items():
+            if source in places.columns:
+                self.normalizers[col] = Normalizer(self.methods["Rating_Bayes_norm"]).fit(places[source])
+        return self
+
+    def _fill(self, places):
+        return places.assign(Avg_Polarity=places["Avg_Polarity"].fillna(self.sentiment_fill))
+
+    def subindices(self, places):
+        """Places with Avg_Polarity filled and the *_norm columns (Rating_Bayes_norm_<level> when fitted and present)."""
+        out = self._fill(places)
+        for col, source in SUBINDEX_SOURCES.items():
+            out[col] = self.normalizers[col].transform(out[source])
+        for col, source in PRIOR_SOURCES.items():
+            if col in self.normalizers and source in out.columns:
+                out[col] = self.normalizers[col].transform(out[source])
+        return out
+
+    def score(self, places, weights=EQUAL_WEIGHTS):
+        """subindices() plus IGATP (one weight vector) or IGATP_0..k-1 (an array of weight vectors)."""
+        out = self.subindices(places)
+        scores = igatp(out[SUBINDICES].to_numpy(), weights)
+        if scores.ndim == 1:
+            out["IGATP"] = scores
+        else:
+            columns = [f"IGATP_{i}" for i in range(scores.shape[1])]
+            out = pd.concat([out, pd.DataFrame(scores, columns=columns, index=out.index)], axis=1)
+        return out
+
+    def save(self, path=PARAMS_JSON):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"sentiment_fill": self.sentiment_fill,
+                       "normalizers": {c: n.to_dict() for c, n in self.normalizers.items()}}, f)
+
+    @classmethod
+    def load(cls, path=PARAMS_JSON):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        scorer = cls({c: n["method"] for c, n in data["normalizers"].items()})
+        scorer.sentiment_fill = data["sentiment_fill"]
+        scorer.normalizers = {c: Normalizer.from_dict(n) for c, n in data["normalizers"].items()}
+        return scorer
+
+
+# Data
+
+def average_polarity(comments, places):
+    """Avg_Polarity per id_unico.
+
+    Comments without id_unico are linked on PLACE_KEY; those whose (Cidade,
+    Nome_Local) is not a place row (the same place found from another
+    city's search) fall back to the place rows with that name.
+    """
+    if "id_unico" not in comments.columns:
+        comments = comments.rename(columns={"Nome_Local": "Nome"})
+        known = comments.set_index(PLACE_KEY).index.isin(places.set_index(PLACE_KEY).index)
+        by_key = comments[known].merge(places[PLACE_KEY + ["id_unico"]].drop_duplicates(), on=PLACE_KEY)
+        by_name = comments[~known].drop(columns="Cidade").merge(
+            places[["Nome", "id_unico"]].drop_duplicates(), on="Nome")
+        comments = pd.concat([by_key, by_name], ignore_index=True)
+    polarity = comments.groupby("id_unico")["Polaridade"].mean()
+    return polarity.rename("Avg_Polarity").reset_index()
+
+
+def build_composite(ratings_bayes, comments, scorer=None, weights=EQUAL_WEIGHTS, methods=None, sigma2=None):
+    """composite_index.csv table; a scorer (with `methods`) is fitted on these places unless one is given.
+
+    `sigma2` is the variance of the individual review ratings (by default
+    the variance of comments["Rating"], as in the Bayesian notebook); with
+    it, the Rating_Bayes_<level> columns of every prior level are added.
+    """
+    df = ratings_bayes.drop(columns=["Nome_Local", "Avg_Polarity"], errors="ignore")
+    df = df.merge(average_polarity(comments, df), on="id_unico", how="left")
+    # Nome_Local as in the notebook output (set for places with comments), read by the topics join
+    df.insert(df.columns.get_loc("Avg_Polarity"), "Nome_Local", df["Nome"].where(df["Avg_Polarity"].notna()))
+
+    if sigma2 is None and "Rating" in comments.columns:
+        sigma2 = comments["Rating"].var()
+    levels = rating_bayes_levels(df, sigma2) if sigma2 is not None else pd.DataFrame(index=df.index)
+    scorer = scorer or CompositeScorer(methods).fit(df.join(levels))
+    scored = scorer.score(df.join(levels), weights)
+    # Notebook columns first, the prior-level columns at the end
+    extra = [c for c in list(PRIOR_SOURCES.values()) + list(PRIOR_SOURCES) if c in scored.columns]
+    return scored[[c for c in scored.columns if c not in extra] + extra], scorer
+
+
+def check_coverage(scored, previous_path=OUTPUT_CSV, tolerance=COVERAGE_TOLERANCE):
+    """Raise if more than `tolerance` of the places with comments in `previous_path` have none in `scored`."""
+    if not os.path.exists(previous_path):
+        return
+    previous = pd.read_csv(previous_path, usecols=["id_unico", "Nome_Local"])
+    covered = set(previous.loc[previous["Nome_Local"].notna(), "id_unico"])
+    lost = covered - set(scored.loc[scored["Nome_Local"].notna(), "id_unico"])
+    print(f"Locais com comentários: {scored['Nome_Local'].notna().sum()} (antes {len(covered)}, "
+          f"{len(lost)} sem comentários agora)")
+    if len(lost) > tolerance * len(covered):
+        raise ValueError(f"{len(lost)} of {len(covered)} places of '{previous_path}' lost their comments "
+                         "(use --allow-coverage-drop if the comments changed)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Composite IGATP index.")
+    parser.add_argument("--score", default=None, help="CSV of new places to score with the saved parameters")
+    parser.add_argument("--popularity", choices=Normalizer.METHODS, default="minmax",
+                        help="Normalization of Total_Reviews when fitting")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--allow-coverage-drop", action="store_true",
+                        help="Write even if places of the current composite_index.csv lose their comments")
+    args = parser.parse_args()
+
+    if args.score:
+        scorer = CompositeScorer.load()
+        scored = scorer.score(pd.read_csv(args.score))
+        output = args.output or os.path.splitext(args.score)[0] + "_scored.csv"
+    else:
+        scored, scorer = build_composite(pd.read_csv(RATINGS_CSV), pd.read_csv(COMMENTS_CSV),
+                                         methods={"Popularity_norm": args.popularity})
+        output = args.output or OUTPUT_CSV
+        if not args.allow_coverage_drop:
+            check_coverage(scored)
+        scorer.save()
+    scored.to_csv(output, index=False)
+    print(f"✅ {len(scored)} locais guardados em '{output}'")
@@ -0,0 +1,140 @@
+# IGATP - Parallel model selection for KMeans / K-Medoids
+#
+# Usage:  python cluster_sweep.py ../5_composite_index/composite_index.csv [--k-min 2 --k-max 10]
+#
+# Replaces the sequential silhouette loops of clustering_analysis.ipynb:
+#   - every (method, k, seed) candidate is fitted in a process pool
+#   - silhouette is estimated on a random sample (SILHOUETTE_SAMPLE points)
+#     instead of the exact O(n²) score
+#   - K-Medoids runs on one pairwise distance matrix, computed once and
+#     shared by all workers through a read-only memory map; for large n it
+#     is computed on a random subset of MEDOID_SAMPLE places
+#   - stability is reported as the mean pairwise ARI between the runs of
+#     the same k with different seeds, plus ARI KMeans vs K-Medoids
+
+import argparse
+import itertools
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.impute import SimpleImputer
+from sklearn.metrics import adjusted_rand_score, silhouette_score
+from sklearn.preprocessing import StandardScaler
+
+from kmedoids import KMedoids, pairwise_distances
+
+
+FEATURES = ['Rating_Bayes_norm', 'Popularity_norm', 'Sentiment_norm']
+
+SILHOUETTE_SAMPLE = 5000
+MEDOID_SAMPLE = 5000
+SEEDS = (42, 43, 44)
+
+# Set in each worker by _init_worker
+_X = None
+_D = None
+
+
+def prepare_features(df, features=FEATURES):
+    """Mean-imputed, standardized feature matrix (as in the notebook)."""
+    X_imputed = SimpleImputer(strategy='mean').fit_transform(df[features])
+    return StandardScaler().fit_transform(X_imputed)
+
+
+def _init_worker(X, distance_path):
+    global _X, _D
+    _X = X
+    _D = np.load(distance_path, mmap_mode="r") if distance_path else None
+
+
+def _fit(method, k, seed, silhouette_sample):
+    """Labels and sampled silhouette of one candidate (runs in a worker)."""
+    if method == "kmeans":
+        labels = KMeans(n_clusters=k, random_state=seed).fit_predict(_X)
+        score = silhouette_score(_X, labels, sample_size=min(silhouette_sample, len(_X)), random_state=seed)
+    else:
+        rng = np.random.default_rng(seed)
+        initial_medoids = rng.choice(len(_D), size=k, replace=False).tolist()
+        labels = KMedoids(n_clusters=k).fit_distances(_D, initial_medoids).labels_
+        # The medoid subset is already a sample; the distance matrix is reused
+        idx = rng.choice(len(_D), size=min(silhouette_sample, len(_D)), replace=False)
+        score = silhouette_score(np.asarray(_D[np.ix_(idx, idx)]), labels[idx], metric="precomputed")
+    return method, k, seed, labels, score
+
+
+def _mean_pairwise_ari(runs):
+    pairs = list(itertools.combinations(runs, 2))
+    return float(np.mean([adjusted_rand_score(a, b) for a, b in pairs])) if pairs else np.nan
+
+
+def sweep(X, k_values=range(2, 11), methods=("kmeans", "kmedoids"), seeds=SEEDS,
+          silhouette_sample=SILHOUETTE_SAMPLE, medoid_sample=MEDOID_SAMPLE, n_jobs=None, random_state=0):
+    """Fit every candidate in parallel.
+
+    Returns (summary, labels): `summary` has one row per (method, k) with
+    the mean/std sampled silhouette and the seed-to-seed ARI; `labels[(method, k, seed)]`
+    are the labels of each run (for K-Medoids, of the `medoid_rows` subset,
+    see summary.attrs["medoid_rows"]).
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    medoid_rows = np.arange(len(X))
+    if len(X) > medoid_sample:
+        medoid_rows = np.sort(np.random.default_rng(random_state).choice(len(X), medoid_sample, replace=False))
+
+    distance_path = None
+    tmpdir = tempfile.mkdtemp(prefix="igatp_sweep_")
+    try:
+        if "kmedoids" in methods:
+            # One distance matrix for all K-Medoids runs, shared read-only by the workers
+            distance_path = os.path.join(tmpdir, "distances.npy")
+            np.save(distance_path, pairwise_distances(X[medoid_rows], X[medoid_rows]).astype(np.float32))
+
+        tasks = [(m, k, s) for m in methods for k in k_values for s in seeds]
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(X, distance_path)) as pool:
+            results = list(pool.map(_fit, *zip(*tasks), itertools.repeat(silhouette_sample)))
+    finally:
+        if distance_path and os.path.exists(distance_path):
+            os.remove(distance_path)
+        os.rmdir(tmpdir)
+
+    labels = {(m, k, s): lab for m, k, s, lab, _ in results}
+    scores = {(m, k, s): score for m, k, s, _, score in results}
+
+    rows = []
+    for m in methods:
+        for k in k_values:
+            sil = [scores[(m, k, s)] for s in seeds]
+            rows.append({"method": m, "k": k, "silhouette": np.mean(sil), "silhouette_std": np.std(sil),
+                         "stability_ari": _mean_pairwise_ari([labels[(m, k, s)] for s in seeds])})
+    summary = pd.DataFrame(rows)
+
+    if set(methods) >= {"kmeans", "kmedoids"}:
+        # Agreement between the two algorithms on the medoid subset (first seed)
+        agreement = {k: adjusted_rand_score(labels[("kmeans", k, seeds[0])][medoid_rows],
+                                            labels[("kmedoids", k, seeds[0])]) for k in k_values}
+        summary["ari_kmeans_vs_kmedoids"] = summary["k"].map(agreement)
+    summary.attrs["medoid_rows"] = medoid_rows
+    return summary, labels
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Silhouette / stability sweep over k.")
+    parser.add_argument("composite_csv")
+    parser.add_argument("--k-min", type=int, default=2)
+    parser.add_argument("--k-max", type=int, default=10)
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--silhouette-sample", type=int, default=SILHOUETTE_SAMPLE)
+    parser.add_argument("--output", default="cluster_sweep.csv")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.composite_csv)
+    summary, _ = sweep(prepare_features(df), range(args.k_min, args.k_max + 1), n_jobs=args.jobs,
+                       silhouette_sample=args.silhouette_sample)
+    print(summary.round(3).to_string(index=False))
+    summary.to_csv(args.output, index=False)
+    print(f"✅ Guardado em '{args.output}'")
@@ -0,0 +1,240 @@
+# IGATP - K-Medoids engine (FasterPAM swaps, CLARA sampling)
+#
+# In-project replacement for pyclustering.cluster.kmedoids, used for the
+# cluster_k7_pam profiles:
+#   - distances are computed with NumPy in row blocks (no Python loops
+#     over points), or taken from a precomputed matrix
+#   - the swap phase follows FasterPAM (Schubert & Rousseeuw, 2021): the
+#     gain of every (medoid, candidate) swap is evaluated for one candidate
+#     at a time in O(n) and the first improving swap is applied eagerly
+#   - for large n, CLARA runs FasterPAM on several random samples and keeps
+#     the medoids with the lowest cost over all points
+#   - predict() assigns new places to the nearest existing medoid, so they
+#     get a profile label without refitting
+#   - ProfileModel starts from the medoids of the published cluster_k7_pam
+#     profiles and keeps their IDs (swaps replace a medoid in its own slot),
+#     so predicted labels match the profile names of the dashboards
+
+import joblib
+import numpy as np
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import StandardScaler
+
+
+BLOCK_ROWS = 4096
+
+# Above this many points fit() switches to CLARA
+PAM_MAX_POINTS = 8000
+
+# Published profile labels that ProfileModel keeps
+PROFILE_COLUMN = "cluster_k7_pam"
+
+
+def pairwise_distances(A, B, block_rows=BLOCK_ROWS):
+    """Euclidean distances between the rows of A and B (float64), computed in row blocks."""
+    A = np.asarray(A, dtype=np.float64)
+    B = np.asarray(B, dtype=np.float64)
+    b2 = (B ** 2).sum(axis=1)
+    out = np.empty((len(A), len(B)))
+    for start in range(0, len(A), block_rows):
+        a = A[start:start + block_rows]
+        d2 = (a ** 2).sum(axis=1)[:, None] + b2[None, :] - 2.0 * a @ B.T
+        np.sqrt(np.maximum(d2, 0.0, out=d2), out=out[start:start + block_rows])
+    return out
+
+
+def nearest(A, B, block_rows=BLOCK_ROWS):
+    """(index, distance) of the nearest row of B for every row of A, without the full matrix."""
+    labels = np.empty(len(A), dtype=np.int64)
+    dist = np.empty(len(A))
+    for start in range(0, len(A), block_rows):
+        d = pairwise_distances(A[start:start + block_rows], B)
+        labels[start:start + block_rows] = d.argmin(axis=1)
+        dist[start:start + block_rows] = d[np.arange(len(d)), labels[start:start + block_rows]]
+    return labels, dist
+
+
+def _build(D, k, block_rows=BLOCK_ROWS // 4):
+    """Greedy BUILD initialization: each new medoid is the one that lowers the total deviation most."""
+    medoids = [int(D.sum(axis=1).argmin())]
+    d1 = np.array(D[medoids[0]], dtype=np.float64)
+    for _ in range(1, k):
+        gain = np.empty(len(D))
+        for start in range(0, len(D), block_rows):
+            # Rows of the (symmetric) matrix = candidate medoids
+            gain[start:start + block_rows] = np.maximum(d1[None, :] - D[start:start + block_rows], 0.0).sum(axis=1)
+        gain[medoids] = -1
+        medoids.append(int(gain.argmax()))
+        d1 = np.minimum(d1, D[medoids[-1]])
+    return np.array(medoids)
+
+
+def _nearest_two(D, medoids):
+    """Nearest medoid (position in `medoids`), its distance, and the distance to the second nearest."""
+    dm = D[:, medoids]
+    order = np.argsort(dm, axis=1)[:, :2]
+    rows = np.arange(len(D))
+    d1 = dm[rows, order[:, 0]]
+    d2 = dm[rows, order[:, 1]] if len(medoids) > 1 else np.full(len(D), np.inf)
+    return order[:, 0], d1, d2
+
+
+def fasterpam(D, medoids, max_iter=100):
+    """FasterPAM swap phase on a symmetric distance matrix. Returns (medoids, labels, total deviation)."""
+    medoids = np.array(medoids, dtype=np.int64)
+    k, n = len(medoids), len(D)
+    m1, d1, d2 = _nearest_two(D, medoids)
+
+    for _ in range(max_iter):
+        swapped = False
+        # Cost of removing each medoid (its points move to their second nearest)
+        removal = np.bincount(m1, weights=d2 - d1, minlength=k)
+        is_medoid = np.zeros(n, dtype=bool)
+        is_medoid[medoids] = True
+
+        for c in range(n):
+            if is_medoid[c]:
+                continue
+            dc = D[c]  # row = column, contiguous
+            closer = dc < d1
+            second = ~closer & (dc < d2)
+            delta = removal.copy()
+            delta += np.bincount(m1[closer], weights=(d1 - d2)[closer], minlength=k)
+            delta += np.bincount(m1[second], weights=(dc - d2)[second], minlength=k)
+            i = int(delta.argmin())
+            change = delta[i] + (dc[closer] - d1[closer]).sum()
+            if change < -1e-12:
+                is_medoid[medoids[i]] = False
+                is_medoid[c] = True
+                medoids[i] = c
+                m1, d1, d2 = _nearest_two(D, medoids)
+                removal = np.bincount(m1, weights=d2 - d1, minlength=k)
+                swapped = True
+        if not swapped:
+            break
+    return medoids, m1, float(d1.sum())
+
+
+class KMedoids:
+    """K-Medoids over the rows of X (Euclidean), PAM-style for small n and CLARA for large n."""
+
+    def __init__(self, n_clusters=7, method="auto", max_iter=100, clara_samples=5, clara_sample_size=None,
+                 random_state=42):
+        self.n_clusters = n_clusters
+        self.method = method
+        self.max_iter = max_iter
+        self.clara_samples = clara_samples
+        self.clara_sample_size = clara_sample_size
+        self.random_state = random_state
+
+    def fit_distances(self, D, medoids=None):
+        """Fit on a precomputed symmetric (n, n) distance matrix (float32 memmaps are used as is);
+        `medoids` are optional initial indices."""
+        D = np.asarray(D)
+        start = _build(D, self.n_clusters) if medoids is None else medoids
+        self.medoid_indices_, self.labels_, self.inertia_ = fasterpam(D, start, self.max_iter)
+        return self
+
+    def fit(self, X, medoids=None):
+        """Fit on the rows of X; `medoids` are optional initial row indices (label i = slot of medoids[i])."""
+        X = np.asarray(X, dtype=np.float64)
+        method = self.method
+        if method == "auto":
+            method = "pam" if len(X) <= PAM_MAX_POINTS else "clara"
+
+        if method == "pam":
+            self.fit_distances(pairwise_distances(X, X), medoids)
+        else:
+            self._fit_clara(X, medoids)
+        self.cluster_centers_ = X[self.medoid_indices_]
+        return self
+
+    def _fit_clara(self, X, medoids=None):
+        rng = np.random.default_rng(self.random_state)
+        size = min(len(X), self.clara_sample_size or max(40 + 2 * self.n_clusters, 2000))
+        # Initial medoids are the first "best" kept in every sample
+        best = None if medoids is None else (np.asarray(medoids, dtype=np.int64), None, np.inf)
+        for _ in range(self.clara_samples):
+            # Each sample keeps the best medoids found so far
+            keep = best[0] if best is not None else np.zeros(0, dtype=np.int64)
+            rest = rng.choice(np.setdiff1d(np.arange(len(X)), keep), size - len(keep), replace=False)
+            sample = np.concatenate([keep, rest])
+            start = np.arange(len(keep)) if best is not None else None
+
+            D = pairwise_distances(X[sample], X[sample])
+            local, _, _ = fasterpam(D, start if start is not None else _build(D, self.n_clusters), self.max_iter)
+            medoids = sample[local]
+            labels, dist = nearest(X, X[medoids])
+            if best is None or dist.sum() < best[2]:
+                best = (medoids, labels, float(dist.sum()))
+        self.medoid_indices_, self.labels_, self.inertia_ = best
+
+    def predict(self, X):
+        """Nearest fitted medoid for each row of X."""
+        return nearest(np.asarray(X, dtype=np.float64), self.cluster_centers_)[0]
+
+    def fit_predict(self, X):
+        return self.fit(X).labels_
+
+
+def cluster_medoids(X, labels):
+    """(ids, row index of the medoid of each id) of an existing labelling; NaN labels are ignored."""
+    labels = np.asarray(labels, dtype=np.float64)
+    ids = np.unique(labels[~np.isnan(labels)])
+    medoids = np.empty(len(ids), dtype=np.int64)
+    for i, label in enumerate(ids):
+        members = np.flatnonzero(labels == label)
+        costs = np.zeros(len(members))
+        for start in range(0, len(members), BLOCK_ROWS):
+            block = members[start:start + BLOCK_ROWS]
+            costs += pairwise_distances(X[members], X[block]).sum(axis=1)
+        medoids[i] = members[costs.argmin()]
+    return ids, medoids
+
+
+class ProfileModel:
+    """Imputer + scaler + K-Medoids on the three sub-indices, saved together so new places can be labelled."""
+
+    def __init__(self, features, n_clusters=7, **kwargs):
+        self.features = list(features)
+        self.imputer = SimpleImputer(strategy='mean')
+        self.scaler = StandardScaler()
+        self.kmedoids = KMedoids(n_clusters=n_clusters, **kwargs)
+        self.label_ids_ = np.arange(n_clusters)
+
+    def fit(self, df, anchor=PROFILE_COLUMN, refine=False):
+        """Fit on `df`, keeping the profiles of its `anchor` column when present.
+
+        Anchored, the medoids are those of the published clusters (with their
+        IDs); refine=True runs the swap phase from them, which keeps the IDs
+        but may move the medoids. Without an anchor column, a fresh
+        clustering is fitted with labels 0..n_clusters-1.
+        """
+        X = self.scaler.fit_transform(self.imputer.fit_transform(df[self.features]))
+        if anchor is None or anchor not in df.columns:
+            self.label_ids_ = np.arange(self.kmedoids.n_clusters)
+            self.kmedoids.fit(X)
+        else:
+            ids, medoids = cluster_medoids(X, df[anchor])
+            self.label_ids_ = ids.astype(np.int64)
+            self.kmedoids.n_clusters = len(ids)
+            if refine:
+                self.kmedoids.fit(X, medoids)
+            else:
+                km = self.kmedoids
+                km.medoid_indices_, km.cluster_centers_ = medoids, X[medoids]
+                km.labels_, dist = nearest(X, km.cluster_centers_)
+                km.inertia_ = float(dist.sum())
+        self.labels_ = self.label_ids_[self.kmedoids.labels_]
+        return self
+
+    def predict(self, df):
+        X = self.scaler.transform(self.imputer.transform(df[self.features]))
+        return self.label_ids_[self.kmedoids.predict(X)]
+
+    def save(self, path):
+        joblib.dump(self, path)
+
+    @staticmethod
+    def load(path):
+        return joblib.load(path)
@@ -0,0 +1,191 @@
+# IGATP - Topic assignment for new reviews without refitting LDA
+#
+# Usage:  python topic_serving.py fit ../2_pre_processing_NLP/comments_clean.csv [--k 4]
+#         python topic_serving.py update ../2_pre_processing_NLP/comments_clean.csv [--online]
+#
+# topic_modeling.ipynb computes Topic_0..Topic_k and dominant_topic for the
+# whole corpus after a full LDA fit. Here the fitted CountVectorizer and LDA
+# are saved together once (topic_model.joblib) and new or changed reviews
+# are transformed in batches against them; their rows are appended to (or
+# replace theirs in) ratings_polarity_lda_topics.csv. With --online the
+# model is also nudged with LatentDirichletAllocation.partial_fit on the new
+# batch (rows already stored keep the distributions they were given, and
+# every row records the model_version that scored it).
+#
+# In pipeline.py this script is the stage that owns
+# ratings_polarity_lda_topics.csv, so a pipeline run updates the file
+# incrementally instead of re-running the notebook over it. The model is fitted
+# on the first update (or refitted on demand with `fit`).
+
+import argparse
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import LatentDirichletAllocation
+from sklearn.feature_extraction.text import CountVectorizer
+
+from topic_sweep import VECTORIZER_PARAMS, stop_list
+
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "topic_model.joblib")
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ratings_polarity_lda_topics.csv")
+
+# A review is the same review when these match (plus its occurrence number, since
+# one author can review a place more than once); it changed when its text did
+REVIEW_KEY = ["Cidade", "Categoria", "Nome_Local", "Autor"]
+TEXT_COL = "Texto_Lematizado"
+BATCH_SIZE = 2000
+
+# Cluster labels joined onto the reviews (the notebook's merge with composite_index_with_clusters.csv)
+CLUSTER_COLUMNS = ['cluster_k6_pam']
+
+
+class TopicModel:
+    """Fitted CountVectorizer + LDA, loaded once and used to score review batches."""
+
+    def __init__(self, vectorizer, lda, version=1):
+        self.vectorizer = vectorizer
+        self.lda = lda
+        self.version = version
+
+    @classmethod
+    def fit(cls, texts, stop_words, k=4, max_iter=20, random_state=42):
+        """Same model as the notebook's final fit (optimal_k = 4, max_iter = 20)."""
+        vectorizer = CountVectorizer(stop_words=stop_words, **VECTORIZER_PARAMS)
+        dtm = vectorizer.fit_transform(pd.Series(texts).fillna(""))
+        lda = LatentDirichletAllocation(n_components=k, random_state=random_state, max_iter=max_iter)
+        lda.fit(dtm)
+        return cls(vectorizer, lda)
+
+    @property
+    def topic_columns(self):
+        return ['Topic_' + str(i) for i in range(self.lda.n_components)]
+
+    def transform(self, texts, batch_size=BATCH_SIZE):
+        """Topic_i distributions and dominant_topic (as the notebook's idxmax) for `texts`."""
+        texts = pd.Series(texts).fillna("").reset_index(drop=True)
+        parts = [self.lda.transform(self.vectorizer.transform(texts[start:start + batch_size]))
+                 for start in range(0, len(texts), batch_size)]
+        doc_topics = np.vstack(parts) if parts else np.zeros((0, self.lda.n_components))
+        out = pd.DataFrame(doc_topics, columns=self.topic_columns)
+        out['dominant_topic'] = np.array(self.topic_columns, dtype=object)[doc_topics.argmax(axis=1)]
+        return out
+
+    def partial_fit(self, texts):
+        """Online update of the topics with a new batch (the vocabulary stays fixed)."""
+        dtm = self.vectorizer.transform(pd.Series(texts).fillna(""))
+        if dtm.nnz:
+            self.lda.partial_fit(dtm)
+            self.version += 1
+        return self
+
+    def save(self, path=MODEL_PATH):
+        joblib.dump(self, path)
+
+    @staticmethod
+    def load(path=MODEL_PATH):
+        return joblib.load(path)
+
+
+def _text_hash(df):
+    return pd.util.hash_pandas_object(df[TEXT_COL].fillna(""), index=False).to_numpy()
+
+
+def _review_index(df, key):
+    ids = df[key].astype(str)
+    ids["_n"] = ids.groupby(key).cumcount()
+    return pd.MultiIndex.from_frame(ids)
+
+
+def new_or_changed(stored, reviews, key=REVIEW_KEY):
+    """Boolean mask over `reviews`: not in `stored` yet, or stored with a different text."""
+    if stored is None or stored.empty:
+        return np.ones(len(reviews), dtype=bool)
+    known = pd.Series(_text_hash(stored), index=_review_index(stored, key))
+    previous = known.reindex(_review_index(reviews, key)).to_numpy()
+    return pd.isna(previous) | (previous != _text_hash(reviews))
+
+
+def update_results(reviews, model, results_path=RESULTS_PATH, online=False, batch_size=BATCH_SIZE,
+                   place_columns=None, key=REVIEW_KEY):
+    """Score the new/changed rows of `reviews` and merge them into the stored results.
+
+    `reviews` is the current comments table (all reviews, as re-collected):
+    rows already scored with the same text are skipped, and stored rows
+    whose review is no longer in `reviews` (deleted upstream) are dropped.
+
+    `place_columns` is an optional DataFrame indexed by Nome_Local (e.g. the
+    cluster labels of composite_index_with_clusters.csv) joined onto the new
+    rows, like the notebook's merge; when results are stored, only the
+    columns they already have are joined, so every row has the same layout.
+    Returns the number of rows scored.
+    """
+    stored = pd.read_csv(results_path) if os.path.exists(results_path) else None
+    mask = new_or_changed(stored, reviews, key)
+    batch = reviews[mask].reset_index(drop=True)
+    batch_index = _review_index(reviews, key)[mask]
+
+    removed = 0
+    if stored is not None:
+        stored_index = _review_index(stored, key)
+        gone = ~stored_index.isin(_review_index(reviews, key))
+        # Changed reviews replace their previous row
+        replaced = stored_index.isin(batch_index)
+        stored = stored[~(gone | replaced)]
+        removed = int(gone.sum())
+    if batch.empty and not removed:
+        return 0
+
+    parts = [stored] if stored is not None else []
+    if not batch.empty:
+        if online:
+            model.partial_fit(batch[TEXT_COL])
+        scored = pd.concat([batch, model.transform(batch[TEXT_COL], batch_size)], axis=1)
+        scored['model_version'] = model.version
+        if place_columns is not None:
+            if stored is not None:
+                place_columns = place_columns[[c for c in place_columns.columns if c in stored.columns]]
+            scored = scored.join(place_columns, on='Nome_Local')
+        parts.append(scored)
+    if removed:
+        print(f"🗑️ {removed} comentários removidos (já não existem nos comentários)")
+
+    tmp = results_path + ".tmp"
+    pd.concat(parts, ignore_index=True).to_csv(tmp, index=False)
+    os.replace(tmp, results_path)
+    if online and not batch.empty:
+        model.save()
+    return int(mask.sum())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the topic model once / score new reviews against it.")
+    parser.add_argument("command", choices=["fit", "update"])
+    parser.add_argument("comments_csv")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--online", action="store_true", help="Also update the topics with the new reviews")
+    parser.add_argument("--clusters", default=None,
+                        help="composite_index_with_clusters.csv, to add its cluster labels (those already "
+                             "in the stored results) to new rows")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.comments_csv)
+    if args.command == "fit":
+        model = TopicModel.fit(df[TEXT_COL], stop_list(), k=args.k)
+        model.save()
+        print(f"✅ Modelo guardado em '{MODEL_PATH}'")
+    else:
+        if os.path.exists(MODEL_PATH):
+            model = TopicModel.load()
+        else:
+            print("⚠️ Sem modelo guardado: a ajustar o LDA uma vez")
+            model = TopicModel.fit(df[TEXT_COL], stop_list(), k=args.k)
+            model.save()
+        place_columns = None
+        if args.clusters:
+            composite = pd.read_csv(args.clusters)
+            place_columns = composite.drop_duplicates('Nome_Local').set_index('Nome_Local')[CLUSTER_COLUMNS]
+        n = update_results(df, model, online=args.online, place_columns=place_columns)
+        print(f"✅ {n} comentários novos/alterados classificados em '{RESULTS_PATH}'")
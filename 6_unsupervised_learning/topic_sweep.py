@@ -0,0 +1,163 @@
+# IGATP - Topic-count sweep with a persisted corpus and cached coherence
+#
+# Usage:  python topic_sweep.py ../2_pre_processing_NLP/comments_clean.csv [--k-min 2 --k-max 10]
+#
+# Replaces compute_coherence() of topic_modeling.ipynb, which rebuilt the
+# gensim Dictionary and refitted the CountVectorizer for every k and then
+# trained and scored the models one after the other:
+#   - the tokenized corpus, the sparse document-term matrix and the gensim
+#     dictionary are built once and stored under topic_cache/<corpus hash>/
+#   - the candidate k values are trained and scored (c_v) in a process pool
+#   - coherence and fitted models are cached per (k, LDA parameters) inside
+#     the corpus directory, so a re-run only trains the new k values; a
+#     change in the texts, stop words or vectorizer settings changes the hash
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import pandas as pd
+import scipy.sparse as sp
+from gensim.corpora import Dictionary
+from gensim.models import CoherenceModel
+from nltk.corpus import stopwords
+from sklearn.decomposition import LatentDirichletAllocation
+from sklearn.feature_extraction.text import CountVectorizer
+
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "topic_cache")
+
+# Custom stop words of the notebook (on top of NLTK's English list)
+EXTRA_STOPWORDS = {'good', 'great', 'nice', 'recommend', 'stay', 'place', 'porto', 'thank', 'area', 'location',
+                   'hour', 'go', 'amazing', 'perfect', 'excellent', 'beautiful', 'day', 'lot', 'enjoy',
+                   'experience', 'time', 'come', 'friendly', 'need', 'like', 'work', 'small', 'bad', 'people',
+                   'helpful', 'worth', 'leave', 'tell', 'ask', 'find', 'center', 'say', 'lovely', 'super', 'love',
+                   'feel', 'welcome'}
+
+VECTORIZER_PARAMS = {"min_df": 10, "max_df": 0.95}
+LDA_PARAMS = {"random_state": 42, "max_iter": 10}
+
+
+def stop_list():
+    return sorted(set(stopwords.words('english')) | EXTRA_STOPWORDS)
+
+
+class Corpus:
+    """Texts, their sparse DTM (fitted CountVectorizer) and the gensim structures used for c_v."""
+
+    def __init__(self, texts, stop_words, vectorizer_params=VECTORIZER_PARAMS, cache_dir=CACHE_DIR):
+        self.texts = ["" if pd.isna(t) else str(t) for t in texts]
+        self.stop_words = sorted(stop_words)
+        self.vectorizer_params = dict(vectorizer_params)
+        self.hash = self._hash()
+        self.directory = os.path.join(cache_dir, self.hash)
+        self.tokenized = [doc.split() for doc in self.texts]
+        if os.path.exists(os.path.join(self.directory, "dtm.npz")):
+            self._load()
+        else:
+            self._build()
+
+    def _hash(self):
+        digest = hashlib.sha256()
+        digest.update(json.dumps([self.stop_words, self.vectorizer_params], sort_keys=True).encode("utf-8"))
+        for text in self.texts:
+            digest.update(text.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()[:16]
+
+    def _build(self):
+        self.vectorizer = CountVectorizer(stop_words=self.stop_words, **self.vectorizer_params)
+        self.dtm = self.vectorizer.fit_transform(self.texts).tocsr()
+        self.dictionary = Dictionary(self.tokenized)
+
+        os.makedirs(self.directory, exist_ok=True)
+        sp.save_npz(os.path.join(self.directory, "dtm.npz"), self.dtm)
+        joblib.dump(self.vectorizer, os.path.join(self.directory, "vectorizer.joblib"))
+        self.dictionary.save(os.path.join(self.directory, "dictionary.gensim"))
+
+    def _load(self):
+        self.dtm = sp.load_npz(os.path.join(self.directory, "dtm.npz"))
+        self.vectorizer = joblib.load(os.path.join(self.directory, "vectorizer.joblib"))
+        self.dictionary = Dictionary.load(os.path.join(self.directory, "dictionary.gensim"))
+
+    @property
+    def feature_names(self):
+        return self.vectorizer.get_feature_names_out()
+
+    def model_path(self, k, lda_params=LDA_PARAMS):
+        return os.path.join(self.directory, f"lda_k{k}_{_params_key(lda_params)}.joblib")
+
+
+def _params_key(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+
+
+# Corpus pieces of the worker processes (sent once, by the initializer)
+_worker = {}
+
+
+def _init_worker(dtm, feature_names, tokenized, dictionary):
+    _worker.update(dtm=dtm, feature_names=feature_names, tokenized=tokenized, dictionary=dictionary)
+
+
+def _fit_and_score(k, lda_params, topn, model_path):
+    """Train one LDA, save it and return its c_v coherence and top terms (runs in a worker)."""
+    lda = LatentDirichletAllocation(n_components=k, **lda_params)
+    lda.fit(_worker["dtm"])
+    joblib.dump(lda, model_path)
+
+    feature_names = _worker["feature_names"]
+    topics_terms = [[feature_names[i] for i in comp.argsort()[-topn:][::-1]] for comp in lda.components_]
+    cm = CoherenceModel(topics=topics_terms, texts=_worker["tokenized"], dictionary=_worker["dictionary"],
+                        coherence='c_v', processes=1)
+    return k, float(cm.get_coherence()), topics_terms
+
+
+def coherence_sweep(corpus, values_k=range(2, 11), lda_params=LDA_PARAMS, topn=10, n_jobs=None):
+    """c_v coherence per k (DataFrame k, coherence, cached), training only the k values not in the cache."""
+    results_path = os.path.join(corpus.directory, "coherence.json")
+    results = {}
+    if os.path.exists(results_path):
+        with open(results_path) as f:
+            results = json.load(f)
+
+    key = lambda k: f"{k}|{_params_key(lda_params)}|{topn}"
+    missing = [k for k in values_k if key(k) not in results or not os.path.exists(corpus.model_path(k, lda_params))]
+    if missing:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(corpus.dtm, corpus.feature_names, corpus.tokenized, corpus.dictionary)) as pool:
+            futures = [pool.submit(_fit_and_score, k, lda_params, topn, corpus.model_path(k, lda_params))
+                       for k in missing]
+            for future in futures:
+                k, coherence, terms = future.result()
+                results[key(k)] = {"coherence": coherence, "terms": terms}
+                # Written after every k, so an interrupted sweep keeps what finished
+                with open(results_path, "w") as f:
+                    json.dump(results, f, indent=1)
+
+    return pd.DataFrame({"k": list(values_k),
+                         "coherence": [results[key(k)]["coherence"] for k in values_k],
+                         "cached": [k not in missing for k in values_k]})
+
+
+def load_model(corpus, k, lda_params=LDA_PARAMS):
+    """The LDA fitted for k by the sweep."""
+    return joblib.load(corpus.model_path(k, lda_params))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Topic coherence sweep over the number of topics.")
+    parser.add_argument("comments_csv")
+    parser.add_argument("--k-min", type=int, default=2)
+    parser.add_argument("--k-max", type=int, default=10)
+    parser.add_argument("--jobs", type=int, default=None)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.comments_csv)
+    corpus = Corpus(df['Texto_Lematizado'].fillna(""), stop_list())
+    scores = coherence_sweep(corpus, range(args.k_min, args.k_max + 1), n_jobs=args.jobs)
+    print(scores.to_string(index=False))
+    print(f"Melhor k (c_v): {int(scores.loc[scores['coherence'].idxmax(), 'k'])}")
@@ -0,0 +1,240 @@
+# IGATP - Cached spatial weights and batched Moran's I / LISA
+#
+# Usage:  python spatial_weights.py [--permutations 999] [--jobs N] [--weights queen|knn|distance]
+#
+# spatial_analysis.ipynb and validation.ipynb rebuild libpysal Queen
+# contiguity from the parish GeoDataFrame and run esda Moran / Moran_Local
+# separately for every indicator. Here:
+#   - Queen, KNN and distance-band weights are built once and stored as a
+#     sparse matrix under weights_cache/, keyed by the content hash of the
+#     shapefile (and the weight parameters)
+#   - global and local Moran are computed for the four indicators at once:
+#     the permutations are drawn as index matrices and the spatial lags of
+#     all of them come from one sparse product; the local (conditional)
+#     permutations are evaluated per neighbour cardinality in NumPy
+#   - permutations are processed in fixed chunks with their own seeds, so the
+#     result does not depend on the number of workers
+#   - the LISA table is written to lisa_by_parish.csv, which data_bundle.py
+#     joins to the parish layer of the dashboard
+#
+# Same statistics as esda (row-standardized weights, folded pseudo p-values,
+# quadrants 1 = High-High, 2 = Low-High, 3 = Low-Low, 4 = High-Low).
+
+import argparse
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from libpysal.weights import KNN, DistanceBand, Queen
+
+
+SPATIAL_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(SPATIAL_DIR)
+CACHE_DIR = os.path.join(SPATIAL_DIR, "weights_cache")
+
+FREG_SHP = os.path.join(PROJECT_DIR, "1_data_collection", "spatial_data_AMP", "shape_CAOP_Freg_AMP.shp")
+FREG_MEANS = os.path.join(SPATIAL_DIR, "mean_freg_all_by_parish.csv")
+LISA_CSV = os.path.join(SPATIAL_DIR, "lisa_by_parish.csv")
+MORAN_CSV = os.path.join(SPATIAL_DIR, "moran_global.csv")
+
+# Parish means of mean_freg_all_by_parish.csv
+INDICATORS = ["IGATP_Mean", "Rating_Bayes_Mean", "Popularity_Mean", "Sentiment_Mean"]
+
+# Distances of the KNN / distance-band weights are computed in PT-TM06 (metres)
+METRIC_CRS = "EPSG:3763"
+
+PERMUTATIONS = 999
+PERM_CHUNK = 100
+SIGNIFICANCE = 0.05
+
+LISA_LABELS = {1: "High-High", 2: "Low-High", 3: "Low-Low", 4: "High-Low"}
+
+
+# Weights
+
+def shapefile_hash(shp_path):
+    """sha256 of the .shp and its sidecar files (.shx, .dbf, .prj)."""
+    digest = hashlib.sha256()
+    base = os.path.splitext(shp_path)[0]
+    for ext in (".shp", ".shx", ".dbf", ".prj"):
+        if os.path.exists(base + ext):
+            with open(base + ext, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def build_weights(gdf, kind="queen", k=6, threshold=None):
+    """Binary (n, n) CSR weights in the row order of `gdf`."""
+    gdf = gdf.reset_index(drop=True)
+    if kind == "queen":
+        w = Queen.from_dataframe(gdf)
+    elif kind == "knn":
+        w = KNN.from_dataframe(gdf.to_crs(METRIC_CRS), k=k)
+    elif kind == "distance":
+        if threshold is None:
+            raise ValueError("Distance-band weights need a threshold (metres)")
+        w = DistanceBand.from_dataframe(gdf.to_crs(METRIC_CRS), threshold=threshold, binary=True)
+    else:
+        raise ValueError(f"Unknown weights kind: {kind}")
+    return sp.csr_matrix(w.sparse, dtype=np.float64)
+
+
+def load_weights(shp_path=FREG_SHP, id_col="DICOFRE_le", kind="queen", cache_dir=CACHE_DIR, **params):
+    """(ids, W) for the polygons of `shp_path`, read from the cache when the shapefile did not change."""
+    key = "_".join([shapefile_hash(shp_path), kind] + [f"{p}{v}" for p, v in sorted(params.items())])
+    path = os.path.join(cache_dir, key + ".npz")
+    if os.path.exists(path):
+        data = np.load(path, allow_pickle=False)
+        W = sp.csr_matrix((data["data"], data["indices"], data["indptr"]), shape=tuple(data["shape"]))
+        return data["ids"].astype(str), W
+
+    gdf = gpd.read_file(shp_path)
+    W = build_weights(gdf, kind, **params)
+    ids = gdf[id_col].astype(str).to_numpy(dtype=str)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(path, data=W.data, indices=W.indices, indptr=W.indptr, shape=np.array(W.shape), ids=ids)
+    return ids, W
+
+
+def row_standardize(W):
+    """Rows summing to 1 (rows of islands stay empty)."""
+    sums = np.asarray(W.sum(axis=1)).ravel()
+    return sp.diags(np.divide(1.0, sums, out=np.zeros_like(sums), where=sums > 0)) @ W
+
+
+# Moran
+
+def _fold(larger, permutations):
+    """esda pseudo p-value: the smaller tail, (larger + 1) / (permutations + 1)."""
+    larger = np.where(permutations - larger < larger, permutations - larger, larger)
+    return (larger + 1.0) / (permutations + 1.0)
+
+
+def _cardinality_groups(W):
+    """Rows grouped by number of neighbours: {k: (rows, (len(rows), k) weights)}."""
+    cards = np.diff(W.indptr)
+    groups = {}
+    for k in np.unique(cards[cards > 0]):
+        rows = np.flatnonzero(cards == k)
+        weights = np.vstack([W.data[W.indptr[i]:W.indptr[i + 1]] for i in rows])
+        groups[int(k)] = (rows, weights)
+    return groups
+
+
+def _permutation_chunk(z, zs, W, Is, count, seed):
+    """Global I of `count` random permutations and, per place, how many local permutations reach Is."""
+    n, m = z.shape
+    rng = np.random.default_rng(seed)
+    s0 = W.sum()
+    ss = (z * z).sum(axis=0)
+
+    # Global: all permutations and indicators in one sparse product
+    order = np.argsort(rng.random((count, n)), axis=1)
+    zp = z[order]  # (count, n, m)
+    lag = (W @ zp.transpose(1, 0, 2).reshape(n, count * m)).reshape(n, count, m).transpose(1, 0, 2)
+    I_sim = n / s0 * (zp * lag).sum(axis=1) / ss
+
+    # Local: conditional permutations (place i fixed, its neighbours drawn from the other n - 1)
+    ss_s = (zs * zs).sum(axis=0)
+    larger = np.zeros((n, m))
+    groups = _cardinality_groups(W)
+    if groups:
+        k_max = max(groups)
+        draws = np.argsort(rng.random((count, n - 1)), axis=1)[:, :k_max]
+        for k, (rows, weights) in groups.items():
+            idx = draws[None, :, :k]
+            idx = idx + (idx >= rows[:, None, None])  # skip place i itself
+            lag_i = np.einsum("gk,gckm->gcm", weights, zs[idx])
+            Is_sim = (n - 1) * zs[rows][:, None, :] * lag_i / ss_s
+            larger[rows] = (Is_sim >= Is[rows][:, None, :]).sum(axis=1)
+    return I_sim, larger
+
+
+def moran_batch(Y, W, permutations=PERMUTATIONS, seed=12345, n_jobs=1):
+    """Global and local Moran of every column of Y (n, m) on row-standardized W.
+
+    Returns (global, local): `global` has I, EI, p_sim and z_sim per column;
+    `local` is a dict of (n, m) arrays Is, p_sim and q.
+    """
+    Y = np.asarray(Y, dtype=np.float64)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    W = sp.csr_matrix(row_standardize(W))
+    n = len(Y)
+
+    z = Y - Y.mean(axis=0)
+    I = n / W.sum() * (z * (W @ z)).sum(axis=0) / (z * z).sum(axis=0)
+    zs = z / Y.std(axis=0)
+    lag_s = W @ zs
+    Is = (n - 1) * zs * lag_s / (zs * zs).sum(axis=0)
+    q = np.select([(zs > 0) & (lag_s > 0), (zs <= 0) & (lag_s > 0), (zs <= 0) & (lag_s <= 0)], [1, 2, 3], 4)
+
+    counts = [min(PERM_CHUNK, permutations - start) for start in range(0, permutations, PERM_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(counts))
+    args = [(z, zs, W, Is, c, s) for c, s in zip(counts, seeds)]
+    if n_jobs == 1:
+        results = [_permutation_chunk(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(_permutation_chunk, *zip(*args)))
+
+    I_sim = np.vstack([r[0] for r in results])
+    larger_local = sum(r[1] for r in results)
+    global_ = pd.DataFrame({
+        "I": I,
+        "EI": -1.0 / (n - 1),
+        "p_sim": _fold((I_sim >= I).sum(axis=0), permutations),
+        "z_sim": (I - I_sim.mean(axis=0)) / I_sim.std(axis=0),
+    })
+    p_local = _fold(larger_local, permutations)
+    # Islands have no neighbours to permute
+    p_local[np.diff(W.indptr) == 0] = np.nan
+    return global_, {"Is": Is, "p_sim": p_local, "q": q}
+
+
+def lisa_table(values, ids, W, indicators=INDICATORS, id_col="Parish_Code", significance=SIGNIFICANCE, **kwargs):
+    """Global Moran per indicator and a LISA table per unit (units with a missing indicator are left out).
+
+    `values` has one row per unit (id_col + indicators); `ids` gives the row
+    order of W.
+    """
+    values = values.assign(**{id_col: values[id_col].astype(str)}).drop_duplicates(id_col).set_index(id_col)
+    aligned = values.reindex(ids)[indicators]
+    keep = aligned.notna().all(axis=1).to_numpy()
+    W = sp.csr_matrix(W)[keep][:, keep]
+
+    global_, local = moran_batch(aligned[keep].to_numpy(), W, **kwargs)
+    global_.insert(0, "indicator", indicators)
+
+    lisa = pd.DataFrame({id_col: np.asarray(ids)[keep]})
+    for j, col in enumerate(indicators):
+        lisa[f"{col}_Is"] = local["Is"][:, j]
+        lisa[f"{col}_p"] = local["p_sim"][:, j]
+        category = pd.Series(local["q"][:, j]).map(LISA_LABELS)
+        lisa[f"{col}_LISA"] = category.where(local["p_sim"][:, j] < significance, "Not Significant")
+    return global_, lisa
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Global Moran's I and LISA for the parish indicators.")
+    parser.add_argument("--weights", choices=["queen", "knn", "distance"], default="queen")
+    parser.add_argument("--k", type=int, default=6, help="Neighbours of the KNN weights")
+    parser.add_argument("--threshold", type=float, default=None, help="Distance band (metres)")
+    parser.add_argument("--permutations", type=int, default=PERMUTATIONS)
+    parser.add_argument("--jobs", type=int, default=1)
+    args = parser.parse_args()
+
+    params = {"knn": {"k": args.k}, "distance": {"threshold": args.threshold}}.get(args.weights, {})
+    ids, W = load_weights(kind=args.weights, **params)
+    df_freg = pd.read_csv(FREG_MEANS, dtype={"Parish_Code": str})
+
+    global_, lisa = lisa_table(df_freg, ids, W, permutations=args.permutations, n_jobs=args.jobs)
+    print(global_.round(4).to_string(index=False))
+    global_.to_csv(MORAN_CSV, index=False)
+    lisa.to_csv(LISA_CSV, index=False, encoding="utf-8-sig")
+    print(f"✅ LISA guardado em '{LISA_CSV}'")
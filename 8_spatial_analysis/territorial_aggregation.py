@@ -0,0 +1,156 @@
+# IGATP - Territorial aggregation of the indicators in one pass
+#
+# Usage:  python territorial_aggregation.py [--levels Grupo_Tematico Cidade] [--weight Total_Reviews]
+#
+# Replaces the per-indicator groupby("DICO_right") / groupby("DICOFRE_le")
+# + merge loops of spatial_analysis.ipynb. Places get municipality and
+# parish codes once (spatial_assignment.assign_territories); then, for every
+# level (municipality, parish and any extra column), the count, mean,
+# median, standard deviation and a mean weighted by Total_Reviews of all
+# indicators come from np.bincount sums over the integer codes and one sort
+# per level and indicator. The result is one tidy table
+# (territorial_means.csv); the parish table in the mean_freg_all_by_parish.csv
+# layout read by the dashboard is derived from it.
+
+import argparse
+import os
+import sys
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+
+SPATIAL_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(SPATIAL_DIR)
+sys.path.insert(0, os.path.join(PROJECT_DIR, "9_visualization"))
+from spatial_assignment import assign_territories  # noqa: E402
+
+
+INDEX_CSV = os.path.join(PROJECT_DIR, "6_unsupervised_learning", "composite_index_with_clusters.csv")
+MUN_SHP = os.path.join(PROJECT_DIR, "1_data_collection", "spatial_data_AMP", "shape_CAOP_Conc_AMP.shp")
+FREG_SHP = os.path.join(PROJECT_DIR, "1_data_collection", "spatial_data_AMP", "shape_CAOP_Freg_AMP.shp")
+OUTPUT_CSV = os.path.join(SPATIAL_DIR, "territorial_means.csv")
+PARISH_CSV = os.path.join(SPATIAL_DIR, "mean_freg_all_by_parish.csv")
+
+INDICATORS = ["IGATP", "Rating_Bayes_norm", "Popularity_norm", "Sentiment_norm"]
+WEIGHT_COL = "Total_Reviews"
+
+# Column names of mean_freg_all_by_parish.csv
+PARISH_COLUMNS = {"IGATP": "IGATP_Mean", "Rating_Bayes_norm": "Rating_Bayes_Mean",
+                  "Popularity_norm": "Popularity_Mean", "Sentiment_norm": "Sentiment_Mean"}
+
+
+def group_stats(values, codes, n_units, weights=None):
+    """count, mean, median, std (ddof=1) and weighted mean per unit for every column of `values`.
+
+    `codes` are unit positions (-1 = no unit); NaN values are ignored per
+    indicator, as in pandas. Each statistic is an (n_units, n_indicators) array.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    keep = codes >= 0
+    values, codes = values[keep], codes[keep]
+    valid = ~np.isnan(values)
+    v = np.where(valid, values, 0.0)
+
+    stats = {name: np.full((n_units, values.shape[1]), np.nan) for name in ("mean", "median", "std", "weighted_mean")}
+    stats["count"] = np.zeros((n_units, values.shape[1]), dtype=np.int64)
+    w = None if weights is None else np.nan_to_num(np.asarray(weights, dtype=np.float64)[keep])
+
+    starts = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=n_units))[:-1]])
+    for j in range(values.shape[1]):
+        count = np.bincount(codes, weights=valid[:, j], minlength=n_units)
+        total = np.bincount(codes, weights=v[:, j], minlength=n_units)
+        total2 = np.bincount(codes, weights=v[:, j] ** 2, minlength=n_units)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = total / count
+            stats["mean"][:, j] = mean
+            stats["std"][:, j] = np.sqrt(np.maximum(total2 - count * mean ** 2, 0.0) / (count - 1))
+            if w is not None:
+                w_sum = np.bincount(codes, weights=w * valid[:, j], minlength=n_units)
+                stats["weighted_mean"][:, j] = np.bincount(codes, weights=w * v[:, j], minlength=n_units) / w_sum
+        stats["count"][:, j] = count
+        stats["std"][count < 2, j] = np.nan
+
+        # Median: middle element(s) of each unit after sorting by (unit, value); NaNs sort last
+        sorted_values = values[np.lexsort((values[:, j], codes)), j]
+        c = count.astype(np.int64)
+        has = c > 0
+        lo = sorted_values[(starts + (c - 1) // 2)[has]]
+        hi = sorted_values[(starts + c // 2)[has]]
+        stats["median"][has, j] = (lo + hi) / 2
+    return stats
+
+
+def tidy(stats, level, unit_codes, unit_names, indicators=INDICATORS):
+    """Long table: one row per (unit, indicator) with a count > 0."""
+    n_units = len(unit_codes)
+    frame = pd.DataFrame({
+        "level": level,
+        "unit_code": np.repeat(np.asarray(unit_codes, dtype=object), len(indicators)),
+        "unit_name": np.repeat(np.asarray(unit_names, dtype=object), len(indicators)),
+        "indicator": np.tile(indicators, n_units),
+    })
+    for name in ("count", "mean", "median", "std", "weighted_mean"):
+        frame[name] = stats[name].ravel()
+    return frame[frame["count"] > 0].reset_index(drop=True)
+
+
+def aggregate(points, shape_mun, shape_freg, levels=(), indicators=INDICATORS, weight_col=WEIGHT_COL):
+    """Tidy statistics of `indicators` per municipality, parish and each column in `levels`.
+
+    `points` must carry mun_code / freg_code (assign_territories).
+    """
+    values = points[indicators].to_numpy(dtype=np.float64)
+    weights = points[weight_col].to_numpy(dtype=np.float64) if weight_col else None
+
+    tables = [
+        tidy(group_stats(values, points["mun_code"].to_numpy(), len(shape_mun), weights), "municipality",
+             shape_mun["DICO_left"].astype(str), shape_mun["Municipio_"], indicators),
+        tidy(group_stats(values, points["freg_code"].to_numpy(), len(shape_freg), weights), "parish",
+             shape_freg["DICOFRE_le"].astype(str), shape_freg["Freguesia_"], indicators),
+    ]
+    for level in levels:
+        codes, units = pd.factorize(points[level], sort=True)
+        tables.append(tidy(group_stats(values, codes, len(units), weights), level,
+                           units.astype(str), units.astype(str), indicators))
+    return pd.concat(tables, ignore_index=True)
+
+
+def wide(table, level, stat="mean"):
+    """One row per unit of `level`, one column per indicator (values of `stat`)."""
+    sub = table[table["level"] == level]
+    out = sub.pivot_table(index=["unit_code", "unit_name"], columns="indicator", values=stat, sort=True)
+    return out.reset_index().rename_axis(columns=None)
+
+
+def parish_means(table):
+    """The mean_freg_all_by_parish.csv layout (Parish_Code, Parish, IGATP_Mean, ...)."""
+    out = wide(table, "parish")
+    out = out[["unit_code", "unit_name"] + list(PARISH_COLUMNS)]
+    return out.rename(columns={"unit_code": "Parish_Code", "unit_name": "Parish", **PARISH_COLUMNS})
+
+
+def load_points(index_csv=INDEX_CSV, mun_shp=MUN_SHP, freg_shp=FREG_SHP):
+    """Composite index places with their municipality / parish codes, and the two shapefiles."""
+    df = pd.read_csv(index_csv).dropna(subset=["Latitude_Nova", "Longitude_Nova"])
+    shape_mun = gpd.read_file(mun_shp).to_crs("EPSG:4326")
+    shape_freg = gpd.read_file(freg_shp).to_crs("EPSG:4326")
+    points = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df["Longitude_Nova"], df["Latitude_Nova"]),
+                              crs="EPSG:4326")
+    return assign_territories(points, shape_mun, shape_freg), shape_mun, shape_freg
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Territorial statistics of the IGATP indicators.")
+    parser.add_argument("--levels", nargs="*", default=["Grupo_Tematico"], help="Extra grouping columns")
+    parser.add_argument("--weight", default=WEIGHT_COL, help="Column for the weighted mean ('' to skip)")
+    parser.add_argument("--output", default=OUTPUT_CSV)
+    parser.add_argument("--parish-csv", default=PARISH_CSV)
+    args = parser.parse_args()
+
+    points, shape_mun, shape_freg = load_points()
+    table = aggregate(points, shape_mun, shape_freg, args.levels, weight_col=args.weight or None)
+    table.to_csv(args.output, index=False, encoding="utf-8-sig")
+    parish_means(table).to_csv(args.parish_csv, index=False, encoding="utf-8-sig")
+    print(f"✅ {len(table)} linhas guardadas em '{args.output}'")
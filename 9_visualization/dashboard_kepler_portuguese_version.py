@@ -2,11 +2,16 @@
 
 import streamlit as st
 import pandas as pd
-import geopandas as gpd
 import altair as alt
 from sklearn.preprocessing import MinMaxScaler
-from streamlit_keplergl import keplergl_static
 from keplergl import KeplerGl
+from data_bundle import load_data as load_bundle_or_sources, data_version
+from igatp_engine import IGATPEngine, prior_levels, with_prior_level
+from ranking import RankingIndex, top_bottom
+from time_cube import slice_time_cube
+from geometry_cache import DETAIL_LEVELS, GeometryCache
+from hotspot import HotspotGrid
+from map_cache import ByteLRUCache, kepler_html, map_key, show_kepler
 
 
 # CONFIG
@@ -14,25 +19,46 @@ st.set_page_config(layout="wide")
 st.title("IGATP - Índice de Atratividade Turística Percecionada na AMP")
 
 # DATA LOADING
-@st.cache_data
-
+@st.cache_resource
 def load_data():
-    df_index = pd.read_csv("C:/Users/Fernanda Costa/OneDrive - Universidade de Aveiro/Desktop/seminar_project/6_unsupervised_learning/composite_index_with_clusters.csv")
-    df_topics = pd.read_csv("C:/Users/Fernanda Costa/OneDrive - Universidade de Aveiro/Desktop/seminar_project/6_unsupervised_learning/ratings_polarity_lda_topics.csv")
-    df_freg = pd.read_csv("C:/Users/Fernanda Costa/OneDrive - Universidade de Aveiro/Desktop/seminar_project/8_spatial_analysis/mean_freg_all_by_parish.csv")
-    shape_mun = gpd.read_file("C:/Users/Fernanda Costa/OneDrive - Universidade de Aveiro/Desktop/seminar_project/1_data_collection/spatial_data_AMP/shape_CAOP_Conc_AMP.shp").to_crs("EPSG:4326")
-    shape_freg = gpd.read_file("C:/Users/Fernanda Costa/OneDrive - Universidade de Aveiro/Desktop/seminar_project/1_data_collection/spatial_data_AMP/shape_CAOP_Freg_AMP.shp").to_crs("EPSG:4326")
+    # Bundle colunar mapeado em memória (python data_bundle.py); CSV + shapefiles como alternativa.
+    # cache_resource: os DataFrames (só de leitura) são partilhados, sem cópia a cada rerun
+    return load_bundle_or_sources()
 
-    df = pd.merge(df_index, df_topics[["Nome_Local", "Categoria", "dominant_topic"]],
-                  on=["Nome_Local", "Categoria"], how="left")
-    df = df.dropna(subset=["Latitude_Nova", "Longitude_Nova"])
+# Load
+points, mun_shape, freg_shape, df_freg, time_cube = load_data()
 
-    gdf_points = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df["Longitude_Nova"], df["Latitude_Nova"]),
-                                   crs="EPSG:4326")
-    return gdf_points, shape_mun, shape_freg, df_freg
+# Motor vetorizado (matriz de subíndices + códigos inteiros), criado uma vez por processo
+@st.cache_resource
+def load_engine(prior_level="global"):
+    points, mun_shape, freg_shape, _, _ = load_data()
+    return IGATPEngine(with_prior_level(points, prior_level), len(mun_shape), len(freg_shape))
 
-# Load
-points, mun_shape, freg_shape, df_freg = load_data()
+# Rankings top-K sobre o motor (subíndices pré-ordenados, seleção parcial para o IGATP)
+@st.cache_resource
+def load_ranking(prior_level="global"):
+    return RankingIndex(load_engine(prior_level))
+
+# Polígonos simplificados, serializados uma vez por nível de detalhe
+@st.cache_resource
+def load_geometry_cache():
+    _, mun_shape, freg_shape, _, _ = load_data()
+    return GeometryCache({"mun": mun_shape, "freg": freg_shape})
+
+geometry_cache = load_geometry_cache()
+
+# HTML dos mapas já renderizados, partilhado entre sessões (LRU limitado em bytes)
+@st.cache_resource
+def load_map_cache():
+    return ByteLRUCache()
+
+map_cache = load_map_cache()
+
+# Grelha para as superfícies de calor (superfícies suavizadas em cache por largura de banda e filtro)
+@st.cache_resource
+def load_hotspots(prior_level="global"):
+    points, mun_shape, _, _, _ = load_data()
+    return HotspotGrid(with_prior_level(points, prior_level), mun_shape)
 
 # SECTION: ABOUT
 with st.expander("ℹ️ Sobre o Projeto"):
@@ -144,33 +170,73 @@ with st.sidebar:
     total = w1 + w2 + w3 or 1
     w1, w2, w3 = w1 / total, w2 / total, w3 / total
 
+    st.markdown("---")
+
+    # Nível do prior do Rating Bayesiano (hierarchical_bayes.py), quando o índice traz as colunas
+    prior_names = {"global": "Global", "theme": "Grupo temático", "municipality": "Município"}
+    available_priors = prior_levels(points)
+    prior_level = "global"
+    if len(available_priors) > 1:
+        st.markdown("### 📐 **Prior do Rating Bayesiano**")
+        prior_level = st.selectbox(
+            "Média de referência do ajuste",
+            options=available_priors,
+            format_func=lambda level: prior_names.get(level, level),
+            help="Cada local é ajustado para a média global, do seu grupo temático ou do seu município."
+        )
+        st.markdown("---")
+
+    # Detalhe dos polígonos nos mapas por município/freguesia
+    st.markdown("### 🗺️ **Detalhe do Mapa**")
+    detail = st.select_slider(
+        "Detalhe dos polígonos",
+        options=list(DETAIL_LEVELS),
+        value="medium",
+        help="Limites simplificados carregam muito mais depressa; 'full' usa a geometria original da CAOP."
+    )
+
+
 
 
+# Motor, rankings e grelha de calor para o prior escolhido (um por nível, partilhados entre sessões)
+points = with_prior_level(points, prior_level)
+engine = load_engine(prior_level)
+ranking = load_ranking(prior_level)
+hotspots = load_hotspots(prior_level)
 
 # CALCULATE IGATP & FILTER DATA
-filtered = points[
-    (points["Grupo_Tematico"].isin(grupos)) &
-    (points["cluster_k7_pam"].isin(selected_clusters))
-].copy()
+weights = (w1, w2, w3)
+mask, igatp = engine.recompute(weights, grupos, selected_clusters)
 
-filtered["IGATP"] = w1 * filtered["Rating_Bayes_norm"] + w2 * filtered["Popularity_norm"] + w3 * filtered["Sentiment_norm"]
-filtered_nonull = filtered[filtered["IGATP"].notna()]
+# Média do IGATP por município (as médias do motor estão indexadas pela linha do shapefile)
+mun_map = pd.DataFrame(mun_shape.drop(columns="geometry"))
+mun_map["IGATP"] = engine.means("mun", weights, grupos, selected_clusters)[:, 0]
 
-# Filtrar apenas pontos dentro dos limites da AMP
-mun_shape = mun_shape.to_crs("EPSG:4326")
-filtered_nonull = gpd.sjoin(
-    filtered_nonull.to_crs("EPSG:4326"),
-    mun_shape[["geometry"]],
-    how="inner",
-    predicate="within"
-).drop(columns="index_right", errors="ignore")
+# Normalizar IGATP para gradiente de cores
+scaler = MinMaxScaler()
+mun_map["IGATPScaled"] = scaler.fit_transform(mun_map[["IGATP"]].fillna(0))
+
+# Garantir que o código da freguesia está em formato string
+df_freg = df_freg.assign(Parish_Code=df_freg["Parish_Code"].astype(str))
+
+# Juntar shapefile com dados agregados
+freg_map = pd.DataFrame(freg_shape.drop(columns="geometry")).merge(df_freg, left_on="DICOFRE_le", right_on="Parish_Code", how="left")
+
+# Calcular coluna normalizada
+scaler = MinMaxScaler()
+if "IGATP_Mean" in freg_map.columns:
+    freg_map["IGATPScaled"] = scaler.fit_transform(freg_map[["IGATP_Mean"]].fillna(0))
+else:
+    freg_map["IGATPScaled"] = 0  # fallback defensivo
 
 
 # TABS
-tab1, tab2, tab3, tab4, tab5 = st.tabs(["📍 Mapa Pontual", "🗺️ Mapa por Município", "🏘️ Mapa por Freguesia", "📊 Rankings", "📈 Evolução Temporal"])
+tab_names = ["📍 Mapa Pontual", "🗺️ Mapa por Município", "🏘️ Mapa por Freguesia", "📊 Rankings", "📈 Evolução Temporal", "🔥 Superfície de Calor IGATP"]
+# Só a secção selecionada é executada, os mapas escondidos nunca são criados
+active_tab = st.radio("Secção", tab_names, horizontal=True, label_visibility="collapsed")
 
 # TAB 1 - KEPLER MAP (Pontos)
-with tab1:
+if active_tab == tab_names[0]:
     st.subheader("Locais com IGATP")
 
     # Instruções para configurar o pop-up corretamente no Kepler.gl
@@ -191,38 +257,44 @@ with tab1:
     ⚠️ Estes campos não aparecem por defeito — é necessário ativá-los manualmente.
     """)
 
-    # Mapa com Kepler.gl
-    mapa1 = KeplerGl(
-        height=600,
-        data={
-            "IGATP Points": filtered_nonull,
-            "AMP Municípios": mun_shape
-        },
-        config={
-            "version": "v1",
-            "config": {
-                "mapState": {
-                    "latitude": 41.15,
-                    "longitude": -8.6,
-                    "zoom": 8,
-                    "bearing": 0,
-                    "pitch": 0
-                },
-                "mapStyle": {
-                    "styleType": "muted_night"
-                },
-                "visState": {
-                    "layers": []  # camada por defeito, tooltip configurado manualmente
+    # Mapa com Kepler.gl (HTML em cache por estado de filtros/pesos)
+    def render_mapa1():
+        # Um único produto matriz-vetor; as linhas só são copiadas para o mapa de pontos
+        filtered_nonull = points[mask].assign(IGATP=igatp[mask])
+
+        mapa1 = KeplerGl(
+            height=600,
+            data={
+                "IGATP Points": filtered_nonull,
+                "AMP Municípios": geometry_cache.feature_collection("mun", mun_shape[["Municipio_"]], detail)
+            },
+            config={
+                "version": "v1",
+                "config": {
+                    "mapState": {
+                        "latitude": 41.15,
+                        "longitude": -8.6,
+                        "zoom": 8,
+                        "bearing": 0,
+                        "pitch": 0
+                    },
+                    "mapStyle": {
+                        "styleType": "muted_night"
+                    },
+                    "visState": {
+                        "layers": []  # camada por defeito, tooltip configurado manualmente
+                    }
                 }
             }
-        }
-    )
+        )
+        return kepler_html(mapa1)
 
-    keplergl_static(mapa1)
+    key = map_key("points", grupos, selected_clusters, weights, data_version(), detail=detail, prior=prior_level)
+    show_kepler(map_cache.get_or_render(key, render_mapa1), height=600)
     st.caption("Pontos representam locais turísticos. Cores e atributos podem ser ajustados diretamente na interface do Kepler.gl.")
 
 # TAB 2 - Interpolação por Município
-with tab2:
+if active_tab == tab_names[1]:
     st.subheader("IGATP médio por Município")
 
     # Instrução para o utilizador
@@ -235,55 +307,38 @@ with tab2:
     5. Ajuste o intervalo se necessário (0 a 1).
     """)
 
-    # Spatial Join entre pontos e municípios para calcular IGATP médio
-    filtered_mun = gpd.sjoin(
-        filtered_nonull.to_crs("EPSG:4326"),
-        mun_shape[["Municipio_", "geometry"]],
-        how="left",
-        predicate="within"
-    )
-
-    filtered_mun["Municipio_"] = filtered_mun["Municipio_"].str.lower().str.strip()
-    mun_shape["Municipio_"] = mun_shape["Municipio_"].str.lower().str.strip()
-
-    # Cálculo da média do IGATP por município
-    mean_mun = filtered_mun.groupby("Municipio_")["IGATP"].mean().reset_index()
-
-    # Merge com shapefile
-    mun_map = mun_shape.merge(mean_mun, on="Municipio_", how="left")
-
-    # Normalizar IGATP para gradiente de cores
-    scaler = MinMaxScaler()
-    mun_map["IGATPScaled"] = scaler.fit_transform(mun_map[["IGATP"]].fillna(0))
-
-    # Mapa com Kepler.gl
-    mapa2 = KeplerGl(
-        height=600,
-        data={"Municípios IGATP": mun_map},
-        config={
-            "version": "v1",
-            "config": {
-                "mapState": {
-                    "latitude": 41.15,
-                    "longitude": -8.6,
-                    "zoom": 8,
-                    "bearing": 0,
-                    "pitch": 0
-                },
-                "mapStyle": {
-                    "styleType": "muted_night"
+    # Mapa com Kepler.gl (HTML em cache por estado de filtros/pesos)
+    def render_mapa2():
+        mapa2 = KeplerGl(
+            height=600,
+            data={"Municípios IGATP": geometry_cache.feature_collection("mun", mun_map, detail)},
+            config={
+                "version": "v1",
+                "config": {
+                    "mapState": {
+                        "latitude": 41.15,
+                        "longitude": -8.6,
+                        "zoom": 8,
+                        "bearing": 0,
+                        "pitch": 0
+                    },
+                    "mapStyle": {
+                        "styleType": "muted_night"
+                    }
+                    # A camada será configurada manualmente pelo utilizador
                 }
-                # A camada será configurada manualmente pelo utilizador
             }
-        }
-    )
-    keplergl_static(mapa2)
+        )
+        return kepler_html(mapa2)
+
+    key = map_key("municipalities", grupos, selected_clusters, weights, data_version(), detail=detail, prior=prior_level)
+    show_kepler(map_cache.get_or_render(key, render_mapa2), height=600)
 
     st.caption("Interpolação por município com base no valor médio de IGATP. Configure o preenchimento da camada no Kepler para ver o gradiente.")
 
 
 # TAB 3 - Mapa por Freguesia
-with tab3:
+if active_tab == tab_names[2]:
     st.subheader("IGATP médio por Freguesia")
 
     # Instruções para o utilizador
@@ -294,73 +349,64 @@ with tab3:
     3. Em **"Fill Color"**, selecione `IGATPScaled`.
     4. Escolha uma escala de cor (`quantile`, `sequential`, ou `continuous`).
     5. Ajuste o intervalo de valores, se necessário (de 0 a 1).
+
+    🧭 Para clusters espaciais, colorir por `IGATP_Mean_LISA` (ou o campo `_LISA` de um sub-índice): High-High, Low-Low, High-Low, Low-High ou Not Significant (Moran Local, p < 0.05).
     """)
 
-    # Garantir que o código da freguesia está em formato string
-    df_freg["Parish_Code"] = df_freg["Parish_Code"].astype(str)
-
-    # Juntar shapefile com dados agregados
-    freg_map = freg_shape.merge(df_freg, left_on="DICOFRE_le", right_on="Parish_Code", how="left")
-
-    # Calcular coluna normalizada
-    scaler = MinMaxScaler()
-    if "IGATP_Mean" in freg_map.columns:
-        freg_map["IGATPScaled"] = scaler.fit_transform(freg_map[["IGATP_Mean"]].fillna(0))
-    else:
-        freg_map["IGATPScaled"] = 0  # fallback defensivo
-
-    # Garantir CRS
-    freg_map = freg_map.to_crs("EPSG:4326")
-
-    # Criar o mapa com Kepler.gl
-    mapa3 = KeplerGl(
-        height=600,
-        data={"Freguesias IGATP": freg_map},
-        config={
-            "version": "v1",
-            "config": {
-                "mapState": {
-                    "latitude": 41.15,
-                    "longitude": -8.6,
-                    "zoom": 8,
-                    "bearing": 0,
-                    "pitch": 0
-                },
-                "mapStyle": {
-                    "styleType": "muted_night"
+    # Criar o mapa com Kepler.gl (HTML em cache por nível de detalhe)
+    def render_mapa3():
+        mapa3 = KeplerGl(
+            height=600,
+            data={"Freguesias IGATP": geometry_cache.feature_collection("freg", freg_map, detail)},
+            config={
+                "version": "v1",
+                "config": {
+                    "mapState": {
+                        "latitude": 41.15,
+                        "longitude": -8.6,
+                        "zoom": 8,
+                        "bearing": 0,
+                        "pitch": 0
+                    },
+                    "mapStyle": {
+                        "styleType": "muted_night"
+                    }
                 }
             }
-        }
-    )
-    keplergl_static(mapa3)
+        )
+        return kepler_html(mapa3)
+
+    key = map_key("parishes", [], [], [], data_version(), detail=detail)
+    show_kepler(map_cache.get_or_render(key, render_mapa3), height=600)
 
     st.caption("Mapa por freguesia baseado no valor médio de IGATP. Configure o preenchimento manualmente no Kepler.")
 
 
 
 # TAB 4 - Rankings
-with tab4:
-    st.subheader("🏆 Top 5 por Sub-índice IGATP")
+if active_tab == tab_names[3]:
+    top_n = st.number_input("Número de locais por ranking", min_value=1, max_value=50, value=5, step=1)
+    st.subheader(f"🏆 Top {top_n} por Sub-índice IGATP")
 
-    # Top 5 locais por subíndice
-    top_igatp = filtered_nonull.groupby("Nome_Local")["IGATP"].mean().sort_values(ascending=False).head(5)
-    top_rating = filtered_nonull.groupby("Nome_Local")["Rating_Bayes_norm"].mean().sort_values(ascending=False).head(5)
-    top_pop = filtered_nonull.groupby("Nome_Local")["Popularity_norm"].mean().sort_values(ascending=False).head(5)
-    top_sent = filtered_nonull.groupby("Nome_Local")["Sentiment_norm"].mean().sort_values(ascending=False).head(5)
+    # Top K locais por subíndice
+    top_igatp = ranking.top("IGATP", top_n, weights, grupos, selected_clusters)
+    top_rating = ranking.top("Rating_Bayes_norm", top_n, weights, grupos, selected_clusters)
+    top_pop = ranking.top("Popularity_norm", top_n, weights, grupos, selected_clusters)
+    top_sent = ranking.top("Sentiment_norm", top_n, weights, grupos, selected_clusters)
 
     col1, col2 = st.columns(2)
     with col1:
-        st.markdown("**🌐 Top 5 IGATP**")
+        st.markdown(f"**🌐 Top {top_n} IGATP**")
         st.dataframe(top_igatp)
 
-        st.markdown("**⭐ Top 5 Rating Bayesiano**")
+        st.markdown(f"**⭐ Top {top_n} Rating Bayesiano**")
         st.dataframe(top_rating)
 
     with col2:
-        st.markdown("**📣 Top 5 Popularidade**")
+        st.markdown(f"**📣 Top {top_n} Popularidade**")
         st.dataframe(top_pop)
 
-        st.markdown("**💬 Top 5 Sentimento**")
+        st.markdown(f"**💬 Top {top_n} Sentimento**")
         st.dataframe(top_sent)
 
     # NOVA SECÇÃO – Rankings territoriais
@@ -368,29 +414,30 @@ with tab4:
     st.subheader("🗺️ Rankings Territoriais de IGATP")
 
     # Top 3 municípios
-    top_mun = mun_map[["Municipio_", "IGATP"]].dropna().sort_values("IGATP", ascending=False)
+    top_mun, bottom_mun = top_bottom(mun_map[["Municipio_", "IGATP"]].dropna(), "IGATP", 3)
     st.markdown("**🏙️ Municípios com Maior IGATP Médio**")
-    st.dataframe(top_mun.head(3).reset_index(drop=True))
+    st.dataframe(top_mun)
 
     st.markdown("**🏙️ Municípios com Menor IGATP Médio**")
-    st.dataframe(top_mun.tail(3).reset_index(drop=True))
+    st.dataframe(bottom_mun)
 
     # Top 3 freguesias
-    top_freg = freg_map[["Parish", "IGATP_Mean"]].dropna().sort_values("IGATP_Mean", ascending=False)
+    top_freg, bottom_freg = top_bottom(freg_map[["Parish", "IGATP_Mean"]].dropna(), "IGATP_Mean", 3)
     st.markdown("**🏘️ Freguesias com Maior IGATP Médio**")
-    st.dataframe(top_freg.head(3).reset_index(drop=True))
+    st.dataframe(top_freg)
 
     st.markdown("**🏘️ Freguesias com Menor IGATP Médio**")
-    st.dataframe(top_freg.tail(3).reset_index(drop=True))
+    st.dataframe(bottom_freg)
 
 
 
 # TAB 5 - Evolução Temporal
-with tab5:
+if active_tab == tab_names[4]:
     st.subheader("Polaridade média ao longo do tempo")
-    df_topics = pd.read_csv("C:/Users/Fernanda Costa/OneDrive - Universidade de Aveiro/Desktop/seminar_project/6_unsupervised_learning/ratings_polarity_lda_topics.csv")
-    df_topics["Data_Convertida"] = pd.to_datetime(df_topics["Data_Convertida"], errors='coerce')
-    df_month = df_topics.groupby(pd.Grouper(key="Data_Convertida", freq="M")).agg({"Polaridade": "mean"}).dropna().reset_index()
+    # Cubo pré-agregado (criado com os dados), filtrado com os filtros da barra lateral
+    df_month = slice_time_cube(time_cube, grupos, selected_clusters,
+                               options={"Grupo_Tematico": points["Grupo_Tematico"].dropna().unique(),
+                                        "cluster_k7_pam": list(cluster_options.values())})
     chart = alt.Chart(df_month).mark_line().encode(
         x=alt.X("Data_Convertida:T", title="Data"),
         y=alt.Y("Polaridade:Q", title="Polaridade Média")
@@ -398,6 +445,58 @@ with tab5:
     st.altair_chart(chart, use_container_width=True)
     st.caption("Linha temporal da polaridade média dos comentários (sentimento). Tendência geralmente positiva e estável.")
 
+
+# TAB 6 - Superfície de Calor
+if active_tab == tab_names[5]:
+    st.subheader("Superfície de Calor do IGATP")
+
+    indicator_labels = {
+        "IGATP": "IGATP (pesos selecionados)",
+        "Rating_Bayes_norm": "Rating Bayesiano",
+        "Popularity_norm": "Popularidade",
+        "Sentiment_norm": "Sentimento",
+        "density": "Densidade de locais (por km²)",
+    }
+    col1, col2 = st.columns(2)
+    with col1:
+        indicator = st.selectbox("Indicador", list(indicator_labels), format_func=indicator_labels.get)
+    with col2:
+        bandwidth = st.select_slider("Largura de banda do kernel (m)", options=[250, 500, 750, 1000, 1500, 2000, 3000],
+                                     value=1000, help="Desvio padrão do kernel gaussiano.")
+
+    # Células da grelha dentro da AMP, suavizadas por convolução FFT (em cache por largura de banda e filtro)
+    def render_mapa6():
+        surface = hotspots.layer(indicator, bandwidth, mask, weights)
+        mapa6 = KeplerGl(
+            height=600,
+            data={
+                "Superfície de Calor IGATP": surface,
+                "Municípios AMP": geometry_cache.feature_collection("mun", mun_shape[["Municipio_"]], detail)
+            },
+            config={
+                "version": "v1",
+                "config": {
+                    "mapState": {
+                        "latitude": 41.15,
+                        "longitude": -8.6,
+                        "zoom": 8,
+                        "bearing": 0,
+                        "pitch": 0
+                    },
+                    "mapStyle": {
+                        "styleType": "muted_night"
+                    }
+                }
+            }
+        )
+        return kepler_html(mapa6)
+
+    key = map_key("heat", grupos, selected_clusters, weights, data_version(), detail=detail, prior=prior_level,
+                  indicator=indicator, bandwidth=bandwidth)
+    show_kepler(map_cache.get_or_render(key, render_mapa6), height=600)
+    st.caption(f"Média ponderada pelo kernel numa grelha de {hotspots.cell_size} m, recortada pelos municípios da AMP. "
+               f"No Kepler, colorir a camada \"Superfície de Calor IGATP\" por `{indicator}` (ou usá-la como peso de um heatmap).")
+
 # FOOTER
 st.markdown("---")
 st.caption("Projeto desenvolvido por Beatriz Santos e Joana Guerreiro | Seminário 2025 | Mestrado em Ciência de Dados para Ciências Sociais | Universidade de Aveiro")
\ No newline at end of file
@@ -2,11 +2,16 @@
 
 import streamlit as st
 import pandas as pd
-import geopandas as gpd
 import altair as alt
 from sklearn.preprocessing import MinMaxScaler
-from streamlit_keplergl import keplergl_static
 from keplergl import KeplerGl
+from data_bundle import load_data as load_bundle_or_sources, data_version
+from igatp_engine import IGATPEngine, prior_levels, with_prior_level
+from ranking import RankingIndex, top_bottom
+from time_cube import slice_time_cube
+from geometry_cache import DETAIL_LEVELS, GeometryCache
+from hotspot import HotspotGrid
+from map_cache import ByteLRUCache, kepler_html, map_key, show_kepler
 
 
 # CONFIG
@@ -14,25 +19,46 @@ st.set_page_config(layout="wide")
 st.title("IGATP - Índice de Atratividade Turística Percecionada na AMP")
 
 # DATA LOADING
-@st.cache_data
-
+@st.cache_resource
 def load_data():
-    df_index = pd.read_csv("C:/Users/Fernanda Costa/OneDrive - Universidade de Aveiro/Desktop/seminar_project/6_unsupervised_learning/composite_index_with_clusters.csv")
-    df_topics = pd.read_csv("C:/Users/Fernanda Costa/OneDrive - Universidade de Aveiro/Desktop/seminar_project/6_unsupervised_learning/ratings_polarity_lda_topics.csv")
-    df_freg = pd.read_csv("C:/Users/Fernanda Costa/OneDrive - Universidade de Aveiro/Desktop/seminar_project/8_spatial_analysis/mean_freg_all_by_parish.csv")
-    shape_mun = gpd.read_file("C:/Users/Fernanda Costa/OneDrive - Universidade de Aveiro/Desktop/seminar_project/1_data_collection/spatial_data_AMP/shape_CAOP_Conc_AMP.shp").to_crs("EPSG:4326")
-    shape_freg = gpd.read_file("C:/Users/Fernanda Costa/OneDrive - Universidade de Aveiro/Desktop/seminar_project/1_data_collection/spatial_data_AMP/shape_CAOP_Freg_AMP.shp").to_crs("EPSG:4326")
+    # Memory-mapped columnar bundle (python data_bundle.py); CSV + shapefiles as fallback.
+    # cache_resource: the (read-only) frames are shared, not copied on every rerun
+    return load_bundle_or_sources()
 
-    df = pd.merge(df_index, df_topics[["Nome_Local", "Categoria", "dominant_topic"]],
-                  on=["Nome_Local", "Categoria"], how="left")
-    df = df.dropna(subset=["Latitude_Nova", "Longitude_Nova"])
+# Load
+points, mun_shape, freg_shape, df_freg, time_cube = load_data()
 
-    gdf_points = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df["Longitude_Nova"], df["Latitude_Nova"]),
-                                   crs="EPSG:4326")
-    return gdf_points, shape_mun, shape_freg, df_freg
+# Array-backed engine (sub-index matrix + integer codes), built once per server process
+@st.cache_resource
+def load_engine(prior_level="global"):
+    points, mun_shape, freg_shape, _, _ = load_data()
+    return IGATPEngine(with_prior_level(points, prior_level), len(mun_shape), len(freg_shape))
 
-# Load
-points, mun_shape, freg_shape, df_freg = load_data()
+# Top-K rankings on top of the engine (presorted sub-indices, partial selection for IGATP)
+@st.cache_resource
+def load_ranking(prior_level="global"):
+    return RankingIndex(load_engine(prior_level))
+
+# Simplified polygons serialized once per detail level
+@st.cache_resource
+def load_geometry_cache():
+    _, mun_shape, freg_shape, _, _ = load_data()
+    return GeometryCache({"mun": mun_shape, "freg": freg_shape})
+
+geometry_cache = load_geometry_cache()
+
+# Rendered map HTML, shared by all sessions (LRU bounded by size in bytes)
+@st.cache_resource
+def load_map_cache():
+    return ByteLRUCache()
+
+map_cache = load_map_cache()
+
+# Binned grid for the heat surfaces (smoothed surfaces cached per bandwidth and filter)
+@st.cache_resource
+def load_hotspots(prior_level="global"):
+    points, mun_shape, _, _, _ = load_data()
+    return HotspotGrid(with_prior_level(points, prior_level), mun_shape)
 
 # SECTION: ABOUT
 with st.expander("ℹ️ About the Project"):
@@ -144,34 +170,74 @@ with st.sidebar:
     total = w1 + w2 + w3 or 1
     w1, w2, w3 = w1 / total, w2 / total, w3 / total
 
+    st.markdown("---")
+
+    # Prior level of the Bayesian rating (hierarchical_bayes.py), when the index carries its columns
+    prior_names = {"global": "Global", "theme": "Thematic group", "municipality": "Municipality"}
+    available_priors = prior_levels(points)
+    prior_level = "global"
+    if len(available_priors) > 1:
+        st.markdown("### 📐 **Bayesian Rating Prior**")
+        prior_level = st.selectbox(
+            "Reference mean of the adjustment",
+            options=available_priors,
+            format_func=lambda level: prior_names.get(level, level),
+            help="Each place is shrunk towards the global mean, its thematic group's mean or its municipality's mean."
+        )
+        st.markdown("---")
+
+    # Polygon detail for the municipality/parish maps
+    st.markdown("### 🗺️ **Map Detail**")
+    detail = st.select_slider(
+        "Polygon detail",
+        options=list(DETAIL_LEVELS),
+        value="medium",
+        help="Simplified borders load much faster; 'full' uses the original CAOP geometry."
+    )
+
+
 
 
 
+# Engine, rankings and heat grid for the selected prior (one per level, shared by all sessions)
+points = with_prior_level(points, prior_level)
+engine = load_engine(prior_level)
+ranking = load_ranking(prior_level)
+hotspots = load_hotspots(prior_level)
 
 # CALCULATE IGATP & FILTER DATA
-filtered = points[
-    (points["Grupo_Tematico"].isin(grupos)) &
-    (points["cluster_k7_pam"].isin(selected_clusters))
-].copy()
+weights = (w1, w2, w3)
+mask, igatp = engine.recompute(weights, grupos, selected_clusters)
 
-filtered["IGATP"] = w1 * filtered["Rating_Bayes_norm"] + w2 * filtered["Popularity_norm"] + w3 * filtered["Sentiment_norm"]
-filtered_nonull = filtered[filtered["IGATP"].notna()]
+# Average IGATP per municipality (engine means are indexed by shapefile row)
+mun_map = pd.DataFrame(mun_shape.drop(columns="geometry"))
+mun_map["IGATP"] = engine.means("mun", weights, grupos, selected_clusters)[:, 0]
 
-# Filter only points within the AMP boundaries
-mun_shape = mun_shape.to_crs("EPSG:4326")
-filtered_nonull = gpd.sjoin(
-    filtered_nonull.to_crs("EPSG:4326"),
-    mun_shape[["geometry"]],
-    how="inner",
-    predicate="within"
-).drop(columns="index_right", errors="ignore")
+# Normalize IGATP for color gradient
+scaler = MinMaxScaler()
+mun_map["IGATPScaled"] = scaler.fit_transform(mun_map[["IGATP"]].fillna(0))
+
+# Ensure parish code is string
+df_freg = df_freg.assign(Parish_Code=df_freg["Parish_Code"].astype(str))
+
+# Merge shapefile with aggregated data
+freg_map = pd.DataFrame(freg_shape.drop(columns="geometry")).merge(df_freg, left_on="DICOFRE_le", right_on="Parish_Code", how="left")
+
+# Calculate normalized column
+scaler = MinMaxScaler()
+if "IGATP_Mean" in freg_map.columns:
+    freg_map["IGATPScaled"] = scaler.fit_transform(freg_map[["IGATP_Mean"]].fillna(0))
+else:
+    freg_map["IGATPScaled"] = 0  # defensive fallback
 
 
 # TABS
-tab1, tab2, tab3, tab4, tab5 = st.tabs(["📍 Point Map", "🗺️ Municipality Map", "🏘️ Parish Map", "📊 Rankings", "📈 Temporal Evolution"])
+tab_names = ["📍 Point Map", "🗺️ Municipality Map", "🏘️ Parish Map", "📊 Rankings", "📈 Temporal Evolution", "🔥 IGATP Heat Surface"]
+# Only the selected section is executed, so hidden maps are never built
+active_tab = st.radio("Section", tab_names, horizontal=True, label_visibility="collapsed")
 
 # TAB 1 - KEPLER MAP (Points)
-with tab1:
+if active_tab == tab_names[0]:
     st.subheader("Locations with IGATP")
 
     # Instructions to correctly configure the tooltip in Kepler.gl
@@ -192,39 +258,45 @@ with tab1:
     ⚠️ These fields are not shown by default — they must be manually activated.
     """)
 
-    # Map with Kepler.gl
-    mapa1 = KeplerGl(
-        height=600,
-        data={
-            "IGATP Points": filtered_nonull,
-            "AMP Municipalities": mun_shape
-        },
-        config={
-            "version": "v1",
-            "config": {
-                "mapState": {
-                    "latitude": 41.15,
-                    "longitude": -8.6,
-                    "zoom": 8,
-                    "bearing": 0,
-                    "pitch": 0
-                },
-                "mapStyle": {
-                    "styleType": "muted_night"
-                },
-                "visState": {
-                    "layers": []  # default layer, tooltip configured manually
+    # Map with Kepler.gl (rendered HTML cached per filter/weight state)
+    def render_mapa1():
+        # One matrix-vector product; rows are only copied for the point map
+        filtered_nonull = points[mask].assign(IGATP=igatp[mask])
+
+        mapa1 = KeplerGl(
+            height=600,
+            data={
+                "IGATP Points": filtered_nonull,
+                "AMP Municipalities": geometry_cache.feature_collection("mun", mun_shape[["Municipio_"]], detail)
+            },
+            config={
+                "version": "v1",
+                "config": {
+                    "mapState": {
+                        "latitude": 41.15,
+                        "longitude": -8.6,
+                        "zoom": 8,
+                        "bearing": 0,
+                        "pitch": 0
+                    },
+                    "mapStyle": {
+                        "styleType": "muted_night"
+                    },
+                    "visState": {
+                        "layers": []  # default layer, tooltip configured manually
+                    }
                 }
             }
-        }
-    )
+        )
+        return kepler_html(mapa1)
 
-    keplergl_static(mapa1)
+    key = map_key("points", grupos, selected_clusters, weights, data_version(), detail=detail, prior=prior_level)
+    show_kepler(map_cache.get_or_render(key, render_mapa1), height=600)
     st.caption("Points represent tourist locations. Colors and attributes can be customized directly in the Kepler.gl interface.")
 
 
 # TAB 2 - Interpolation by Municipality
-with tab2:
+if active_tab == tab_names[1]:
     st.subheader("Average IGATP by Municipality")
 
     # Instruction for the user
@@ -237,55 +309,38 @@ with tab2:
     5. Adjust the range if needed (0 to 1).
     """)
 
-    # Spatial Join between points and municipalities to calculate average IGATP
-    filtered_mun = gpd.sjoin(
-        filtered_nonull.to_crs("EPSG:4326"),
-        mun_shape[["Municipio_", "geometry"]],
-        how="left",
-        predicate="within"
-    )
-
-    filtered_mun["Municipio_"] = filtered_mun["Municipio_"].str.lower().str.strip()
-    mun_shape["Municipio_"] = mun_shape["Municipio_"].str.lower().str.strip()
-
-    # Calculate average IGATP per municipality
-    mean_mun = filtered_mun.groupby("Municipio_")["IGATP"].mean().reset_index()
-
-    # Merge with shapefile
-    mun_map = mun_shape.merge(mean_mun, on="Municipio_", how="left")
-
-    # Normalize IGATP for color gradient
-    scaler = MinMaxScaler()
-    mun_map["IGATPScaled"] = scaler.fit_transform(mun_map[["IGATP"]].fillna(0))
-
-    # Map with Kepler.gl
-    mapa2 = KeplerGl(
-        height=600,
-        data={"IGATP Municipalities": mun_map},
-        config={
-            "version": "v1",
-            "config": {
-                "mapState": {
-                    "latitude": 41.15,
-                    "longitude": -8.6,
-                    "zoom": 8,
-                    "bearing": 0,
-                    "pitch": 0
-                },
-                "mapStyle": {
-                    "styleType": "muted_night"
+    # Map with Kepler.gl (rendered HTML cached per filter/weight state)
+    def render_mapa2():
+        mapa2 = KeplerGl(
+            height=600,
+            data={"IGATP Municipalities": geometry_cache.feature_collection("mun", mun_map, detail)},
+            config={
+                "version": "v1",
+                "config": {
+                    "mapState": {
+                        "latitude": 41.15,
+                        "longitude": -8.6,
+                        "zoom": 8,
+                        "bearing": 0,
+                        "pitch": 0
+                    },
+                    "mapStyle": {
+                        "styleType": "muted_night"
+                    }
+                    # Layer will be configured manually by the user
                 }
-                # Layer will be configured manually by the user
             }
-        }
-    )
-    keplergl_static(mapa2)
+        )
+        return kepler_html(mapa2)
+
+    key = map_key("municipalities", grupos, selected_clusters, weights, data_version(), detail=detail, prior=prior_level)
+    show_kepler(map_cache.get_or_render(key, render_mapa2), height=600)
 
     st.caption("Municipality-level interpolation based on average IGATP. Configure the layer fill in Kepler to view the gradient.")
 
 
 # TAB 3 - Map by Parish
-with tab3:
+if active_tab == tab_names[2]:
     st.subheader("Average IGATP by Parish")
 
     # Instructions for the user
@@ -296,45 +351,35 @@ with tab3:
     3. In **"Fill Color"**, select `IGATPScaled`.
     4. Choose a color scale (`quantile`, `sequential`, or `continuous`).
     5. Adjust the value range if necessary (from 0 to 1).
+
+    🧭 For spatial clusters, color by `IGATP_Mean_LISA` (or the `_LISA` field of a sub-index): High-High, Low-Low, High-Low, Low-High or Not Significant (Local Moran, p < 0.05).
     """)
 
-    # Ensure parish code is string
-    df_freg["Parish_Code"] = df_freg["Parish_Code"].astype(str)
-
-    # Merge shapefile with aggregated data
-    freg_map = freg_shape.merge(df_freg, left_on="DICOFRE_le", right_on="Parish_Code", how="left")
-
-    # Calculate normalized column
-    scaler = MinMaxScaler()
-    if "IGATP_Mean" in freg_map.columns:
-        freg_map["IGATPScaled"] = scaler.fit_transform(freg_map[["IGATP_Mean"]].fillna(0))
-    else:
-        freg_map["IGATPScaled"] = 0  # defensive fallback
-
-    # Ensure CRS
-    freg_map = freg_map.to_crs("EPSG:4326")
-
-    # Create map with Kepler.gl
-    mapa3 = KeplerGl(
-        height=600,
-        data={"IGATP Parishes": freg_map},
-        config={
-            "version": "v1",
-            "config": {
-                "mapState": {
-                    "latitude": 41.15,
-                    "longitude": -8.6,
-                    "zoom": 8,
-                    "bearing": 0,
-                    "pitch": 0
-                },
-                "mapStyle": {
-                    "styleType": "muted_night"
+    # Create map with Kepler.gl (rendered HTML cached per detail level)
+    def render_mapa3():
+        mapa3 = KeplerGl(
+            height=600,
+            data={"IGATP Parishes": geometry_cache.feature_collection("freg", freg_map, detail)},
+            config={
+                "version": "v1",
+                "config": {
+                    "mapState": {
+                        "latitude": 41.15,
+                        "longitude": -8.6,
+                        "zoom": 8,
+                        "bearing": 0,
+                        "pitch": 0
+                    },
+                    "mapStyle": {
+                        "styleType": "muted_night"
+                    }
                 }
             }
-        }
-    )
-    keplergl_static(mapa3)
+        )
+        return kepler_html(mapa3)
+
+    key = map_key("parishes", [], [], [], data_version(), detail=detail)
+    show_kepler(map_cache.get_or_render(key, render_mapa3), height=600)
 
     st.caption("Parish-level map based on average IGATP. Manually configure the layer fill in Kepler to view the color gradient.")
 
@@ -342,28 +387,29 @@ with tab3:
 
 
 # TAB 4 - Rankings
-with tab4:
-    st.subheader("🏆 Top 5 by IGATP Sub-index")
+if active_tab == tab_names[3]:
+    top_n = st.number_input("Number of places per ranking", min_value=1, max_value=50, value=5, step=1)
+    st.subheader(f"🏆 Top {top_n} by IGATP Sub-index")
 
-    # Top 5 places by subindex
-    top_igatp = filtered_nonull.groupby("Nome_Local")["IGATP"].mean().sort_values(ascending=False).head(5)
-    top_rating = filtered_nonull.groupby("Nome_Local")["Rating_Bayes_norm"].mean().sort_values(ascending=False).head(5)
-    top_pop = filtered_nonull.groupby("Nome_Local")["Popularity_norm"].mean().sort_values(ascending=False).head(5)
-    top_sent = filtered_nonull.groupby("Nome_Local")["Sentiment_norm"].mean().sort_values(ascending=False).head(5)
+    # Top K places by subindex
+    top_igatp = ranking.top("IGATP", top_n, weights, grupos, selected_clusters)
+    top_rating = ranking.top("Rating_Bayes_norm", top_n, weights, grupos, selected_clusters)
+    top_pop = ranking.top("Popularity_norm", top_n, weights, grupos, selected_clusters)
+    top_sent = ranking.top("Sentiment_norm", top_n, weights, grupos, selected_clusters)
 
     col1, col2 = st.columns(2)
     with col1:
-        st.markdown("**🌐 Top 5 IGATP**")
+        st.markdown(f"**🌐 Top {top_n} IGATP**")
         st.dataframe(top_igatp)
 
-        st.markdown("**⭐ Top 5 Bayesian Rating**")
+        st.markdown(f"**⭐ Top {top_n} Bayesian Rating**")
         st.dataframe(top_rating)
 
     with col2:
-        st.markdown("**📣 Top 5 Popularity**")
+        st.markdown(f"**📣 Top {top_n} Popularity**")
         st.dataframe(top_pop)
 
-        st.markdown("**💬 Top 5 Sentiment**")
+        st.markdown(f"**💬 Top {top_n} Sentiment**")
         st.dataframe(top_sent)
 
     # NEW SECTION – Territorial Rankings
@@ -371,28 +417,29 @@ with tab4:
     st.subheader("🗺️ IGATP Territorial Rankings")
 
     # Top 3 municipalities
-    top_mun = mun_map[["Municipio_", "IGATP"]].dropna().sort_values("IGATP", ascending=False)
+    top_mun, bottom_mun = top_bottom(mun_map[["Municipio_", "IGATP"]].dropna(), "IGATP", 3)
     st.markdown("**🏙️ Municipalities with Highest Average IGATP**")
-    st.dataframe(top_mun.head(3).reset_index(drop=True))
+    st.dataframe(top_mun)
 
     st.markdown("**🏙️ Municipalities with Lowest Average IGATP**")
-    st.dataframe(top_mun.tail(3).reset_index(drop=True))
+    st.dataframe(bottom_mun)
 
     # Top 3 parishes
-    top_freg = freg_map[["Parish", "IGATP_Mean"]].dropna().sort_values("IGATP_Mean", ascending=False)
+    top_freg, bottom_freg = top_bottom(freg_map[["Parish", "IGATP_Mean"]].dropna(), "IGATP_Mean", 3)
     st.markdown("**🏘️ Parishes with Highest Average IGATP**")
-    st.dataframe(top_freg.head(3).reset_index(drop=True))
+    st.dataframe(top_freg)
 
     st.markdown("**🏘️ Parishes with Lowest Average IGATP**")
-    st.dataframe(top_freg.tail(3).reset_index(drop=True))
+    st.dataframe(bottom_freg)
 
 
 # TAB 5 - Temporal Evolution
-with tab5:
+if active_tab == tab_names[4]:
     st.subheader("Average Sentiment Polarity Over Time")
-    df_topics = pd.read_csv("C:/Users/Fernanda Costa/OneDrive - Universidade de Aveiro/Desktop/seminar_project/6_unsupervised_learning/ratings_polarity_lda_topics.csv")
-    df_topics["Data_Convertida"] = pd.to_datetime(df_topics["Data_Convertida"], errors='coerce')
-    df_month = df_topics.groupby(pd.Grouper(key="Data_Convertida", freq="M")).agg({"Polaridade": "mean"}).dropna().reset_index()
+    # Pre-aggregated cube (built with the data), sliced with the sidebar filters
+    df_month = slice_time_cube(time_cube, grupos, selected_clusters,
+                               options={"Grupo_Tematico": points["Grupo_Tematico"].dropna().unique(),
+                                        "cluster_k7_pam": list(cluster_options.values())})
     chart = alt.Chart(df_month).mark_line().encode(
         x=alt.X("Data_Convertida:T", title="Date"),
         y=alt.Y("Polaridade:Q", title="Average Polarity")
@@ -401,6 +448,58 @@ with tab5:
     st.caption("Time series of average comment polarity (sentiment). Generally stable and positive trend.")
 
 
+# TAB 6 - Heat Surface
+if active_tab == tab_names[5]:
+    st.subheader("IGATP Heat Surface")
+
+    indicator_labels = {
+        "IGATP": "IGATP (selected weights)",
+        "Rating_Bayes_norm": "Bayesian Rating",
+        "Popularity_norm": "Popularity",
+        "Sentiment_norm": "Sentiment",
+        "density": "Density of places (per km²)",
+    }
+    col1, col2 = st.columns(2)
+    with col1:
+        indicator = st.selectbox("Indicator", list(indicator_labels), format_func=indicator_labels.get)
+    with col2:
+        bandwidth = st.select_slider("Kernel bandwidth (m)", options=[250, 500, 750, 1000, 1500, 2000, 3000],
+                                     value=1000, help="Standard deviation of the Gaussian kernel.")
+
+    # Grid cells inside the AMP, smoothed with FFT convolution (cached per bandwidth and filter)
+    def render_mapa6():
+        surface = hotspots.layer(indicator, bandwidth, mask, weights)
+        mapa6 = KeplerGl(
+            height=600,
+            data={
+                "IGATP Heat Surface": surface,
+                "AMP Municipalities": geometry_cache.feature_collection("mun", mun_shape[["Municipio_"]], detail)
+            },
+            config={
+                "version": "v1",
+                "config": {
+                    "mapState": {
+                        "latitude": 41.15,
+                        "longitude": -8.6,
+                        "zoom": 8,
+                        "bearing": 0,
+                        "pitch": 0
+                    },
+                    "mapStyle": {
+                        "styleType": "muted_night"
+                    }
+                }
+            }
+        )
+        return kepler_html(mapa6)
+
+    key = map_key("heat", grupos, selected_clusters, weights, data_version(), detail=detail, prior=prior_level,
+                  indicator=indicator, bandwidth=bandwidth)
+    show_kepler(map_cache.get_or_render(key, render_mapa6), height=600)
+    st.caption(f"Kernel-weighted mean of the indicator on a {hotspots.cell_size} m grid, clipped to the AMP municipalities. "
+               f"In Kepler, color the \"IGATP Heat Surface\" layer by `{indicator}` (or use it as a heatmap weight).")
+
+
 # FOOTER
 st.markdown("---")
 st.caption("Project developed by Beatriz Santos and Joana Guerreiro | Seminar 2025 | Master's in Data Science for Social Sciences | University of Aveiro")
@@ -0,0 +1,167 @@
+# IGATP Dashboard - Columnar data bundle
+#
+# Build step:   python data_bundle.py [--project-dir DIR] [--bundle-dir DIR]
+#
+# Reads the CSV outputs of the previous stages and the CAOP shapefiles once,
+# joins them, projects everything to EPSG:4326, attaches municipality/parish
+# codes and writes uncompressed Arrow IPC (Feather v2) files with
+# dictionary-encoded categories and WKB geometries. The dashboard memory-maps
+# these files at start-up and only falls back to the CSV/shapefile path when
+# the bundle has not been built.
+
+import argparse
+import hashlib
+import json
+import os
+
+import geopandas as gpd
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from spatial_assignment import assign_territories
+from time_cube import build_time_cube
+
+
+BUNDLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_bundle")
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BUNDLE_TABLES = {
+    "points": "points.arrow",
+    "municipalities": "municipalities.arrow",
+    "parishes": "parishes.arrow",
+    "parish_means": "parish_means.arrow",
+    "time_cube": "time_cube.arrow",
+}
+
+SOURCE_FILES = [
+    "6_unsupervised_learning/composite_index_with_clusters.csv",
+    "6_unsupervised_learning/ratings_polarity_lda_topics.csv",
+    "8_spatial_analysis/mean_freg_all_by_parish.csv",
+    "1_data_collection/spatial_data_AMP/shape_CAOP_Conc_AMP.shp",
+    "1_data_collection/spatial_data_AMP/shape_CAOP_Freg_AMP.shp",
+]
+
+# LISA clusters per parish (8_spatial_analysis/spatial_weights.py), joined when present
+LISA_FILE = "8_spatial_analysis/lisa_by_parish.csv"
+
+# String columns with at most this share of distinct values are stored as categories
+CATEGORY_RATIO = 0.5
+
+
+def load_sources(project_dir=PROJECT_DIR):
+    """Original load path: CSVs + shapefiles, joined and projected on every call."""
+    index_csv, topics_csv, freg_csv, mun_shp, freg_shp = (os.path.join(project_dir, f) for f in SOURCE_FILES)
+    df_index = pd.read_csv(index_csv)
+    df_topics = pd.read_csv(topics_csv)
+    # Parish codes are read as text to keep their leading zeros ("010402")
+    df_freg = pd.read_csv(freg_csv, dtype={"Parish_Code": str})
+    lisa_csv = os.path.join(project_dir, LISA_FILE)
+    if os.path.exists(lisa_csv):
+        df_freg = df_freg.merge(pd.read_csv(lisa_csv, dtype={"Parish_Code": str}), on="Parish_Code", how="left")
+    shape_mun = gpd.read_file(mun_shp).to_crs("EPSG:4326")
+    shape_freg = gpd.read_file(freg_shp).to_crs("EPSG:4326")
+
+    df = pd.merge(df_index, df_topics[["Nome_Local", "Categoria", "dominant_topic"]],
+                  on=["Nome_Local", "Categoria"], how="left")
+    df = df.dropna(subset=["Latitude_Nova", "Longitude_Nova"])
+
+    gdf_points = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df["Longitude_Nova"], df["Latitude_Nova"]),
+                                   crs="EPSG:4326")
+
+    # Municipality/parish codes computed once (avoids a spatial join on every rerun)
+    gdf_points = assign_territories(gdf_points, shape_mun, shape_freg)
+
+    # Normalized municipality names
+    shape_mun["Municipio_"] = shape_mun["Municipio_"].str.lower().str.strip()
+
+    # Monthly sentiment cube for the Temporal Evolution tab
+    time_cube = build_time_cube(df_topics, gdf_points)
+    return gdf_points, shape_mun, shape_freg, df_freg, time_cube
+
+
+def _to_table(frame):
+    """Arrow table with low-cardinality strings dictionary-encoded and geometry as WKB."""
+    frame = pd.DataFrame(frame).copy()
+    metadata = {}
+
+    if "geometry" in frame.columns:
+        geometry = gpd.GeoSeries(frame["geometry"])
+        metadata["crs"] = geometry.crs.to_string() if geometry.crs is not None else ""
+        frame["geometry"] = geometry.to_wkb()
+
+    for column in frame.columns:
+        if column == "geometry" or not pd.api.types.is_string_dtype(frame[column]):
+            continue
+        if frame[column].nunique() <= CATEGORY_RATIO * len(frame):
+            frame[column] = frame[column].astype("category")
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    return table.replace_schema_metadata({**(table.schema.metadata or {}), b"igatp": json.dumps(metadata).encode()})
+
+
+def _from_table(table):
+    """Inverse of `_to_table`: GeoDataFrame when the table has a WKB geometry column."""
+    metadata = json.loads((table.schema.metadata or {}).get(b"igatp", b"{}"))
+    frame = table.to_pandas()
+    if "geometry" not in frame.columns:
+        return frame
+    geometry = gpd.GeoSeries.from_wkb(frame.pop("geometry"), crs=metadata.get("crs") or None)
+    return gpd.GeoDataFrame(frame, geometry=geometry)
+
+
+def build_bundle(project_dir=PROJECT_DIR, bundle_dir=BUNDLE_DIR):
+    """Write the pre-joined, pre-projected bundle used by the dashboard."""
+    points, shape_mun, shape_freg, df_freg, time_cube = load_sources(project_dir)
+    os.makedirs(bundle_dir, exist_ok=True)
+
+    frames = {"points": points, "municipalities": shape_mun, "parishes": shape_freg,
+              "parish_means": df_freg, "time_cube": time_cube}
+    for name, frame in frames.items():
+        feather.write_feather(_to_table(frame), os.path.join(bundle_dir, BUNDLE_TABLES[name]),
+                              compression="uncompressed")
+
+
+def bundle_exists(bundle_dir=BUNDLE_DIR):
+    return all(os.path.exists(os.path.join(bundle_dir, f)) for f in BUNDLE_TABLES.values())
+
+
+def load_bundle(bundle_dir=BUNDLE_DIR):
+    """Memory-map the bundle and return (points, shape_mun, shape_freg, df_freg, time_cube).
+
+    to_pandas() copies the columns out of the mapped files once; the
+    dashboard keeps the result with st.cache_resource and treats it as
+    read-only, so it is not copied again on reruns.
+    """
+    out = []
+    for name in BUNDLE_TABLES:
+        with pa.memory_map(os.path.join(bundle_dir, BUNDLE_TABLES[name]), "r") as source:
+            out.append(_from_table(pa.ipc.open_file(source).read_all()))
+    return tuple(out)
+
+
+def data_version(project_dir=PROJECT_DIR, bundle_dir=BUNDLE_DIR):
+    """Short hash of the files `load_data` reads (path, size, mtime), used as a cache key."""
+    if bundle_exists(bundle_dir):
+        paths = [os.path.join(bundle_dir, f) for f in BUNDLE_TABLES.values()]
+    else:
+        paths = [os.path.join(project_dir, f) for f in SOURCE_FILES + [LISA_FILE]]
+    state = [(p, os.path.getsize(p), os.path.getmtime(p)) for p in paths if os.path.exists(p)]
+    return hashlib.sha1(json.dumps(state).encode("utf-8")).hexdigest()[:12]
+
+
+def load_data(project_dir=PROJECT_DIR, bundle_dir=BUNDLE_DIR):
+    """Bundle when available, CSV + shapefile path otherwise."""
+    if bundle_exists(bundle_dir):
+        return load_bundle(bundle_dir)
+    return load_sources(project_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the IGATP dashboard data bundle.")
+    parser.add_argument("--project-dir", default=PROJECT_DIR)
+    parser.add_argument("--bundle-dir", default=BUNDLE_DIR)
+    args = parser.parse_args()
+
+    build_bundle(args.project_dir, args.bundle_dir)
+    print(f"✅ Bundle written to {args.bundle_dir}")
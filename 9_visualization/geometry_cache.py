@@ -0,0 +1,86 @@
+# IGATP Dashboard - Simplified geometry delivery for the Kepler maps
+#
+# The CAOP municipality and parish polygons are simplified once per detail
+# level (shared borders are simplified together, so neighbouring polygons
+# keep touching) and their GeoJSON geometries are serialized once. On each
+# rerun only the attribute part of every feature (IGATP values) is
+# serialized and spliced around the cached geometry strings.
+
+import json
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+
+# Simplification tolerance in metres (computed in the CAOP projection, EPSG:3763)
+DETAIL_LEVELS = {
+    "low": 250.0,
+    "medium": 60.0,
+    "high": 15.0,
+    "full": 0.0,
+}
+
+METRIC_CRS = "EPSG:3763"
+
+# Decimal places kept in the served coordinates (5 ~ 1 m)
+COORD_PRECISION = 5
+
+
+def simplify_coverage(shape, tolerance):
+    """Topology-preserving simplification of a polygon coverage, in the shape's own CRS."""
+    if tolerance <= 0:
+        return shape.geometry.to_numpy()
+
+    metric = shape.geometry.to_crs(METRIC_CRS)
+    if hasattr(shapely, "coverage_simplify"):
+        # shapely >= 2.1: borders shared by two polygons are simplified only once
+        simplified = shapely.coverage_simplify(metric.to_numpy(), tolerance)
+    else:
+        simplified = shapely.simplify(metric.to_numpy(), tolerance, preserve_topology=True)
+    return gpd.GeoSeries(simplified, crs=METRIC_CRS).to_crs(shape.crs).to_numpy()
+
+
+def _geometry_json(geometries):
+    rounded = shapely.transform(geometries, lambda coords: np.round(coords, COORD_PRECISION))
+    return shapely.to_geojson(rounded).tolist()
+
+
+def _properties_json(properties):
+    """One JSON object per row; NaN becomes null."""
+    frame = pd.DataFrame(properties)
+    frame = frame.astype(object).where(frame.notna(), None)
+    return [json.dumps(row, ensure_ascii=False, default=str) for row in frame.to_dict("records")]
+
+
+class GeometryCache:
+    """Serialized, simplified geometries per (layer, detail level).
+
+    `layers` maps a layer name to its GeoDataFrame (EPSG:4326). Rows keep
+    their order, so attribute tables built from the same GeoDataFrame (e.g.
+    `mun_shape.copy()` plus an IGATP column) line up with the cached geometries.
+    """
+
+    def __init__(self, layers):
+        self.layers = layers
+        self._geometries = {}
+
+    def geometries(self, layer, level="medium"):
+        key = (layer, level)
+        if key not in self._geometries:
+            shape = self.layers[layer]
+            self._geometries[key] = _geometry_json(simplify_coverage(shape, DETAIL_LEVELS[level]))
+        return self._geometries[key]
+
+    def feature_collection(self, layer, properties, level="medium"):
+        """GeoJSON string with the cached geometries and the given attribute columns."""
+        geometries = self.geometries(layer, level)
+        if len(properties) != len(geometries):
+            raise ValueError(f"{layer}: expected {len(geometries)} attribute rows, got {len(properties)}")
+
+        features = ",".join(
+            '{"type":"Feature","geometry":' + geometry + ',"properties":' + props + "}"
+            for geometry, props in zip(geometries, _properties_json(properties))
+        )
+        return '{"type":"FeatureCollection","features":[' + features + "]}"
@@ -0,0 +1,143 @@
+# IGATP Dashboard - Grid KDE hotspot surfaces
+#
+# Heat surfaces of the IGATP and its sub-indices over the AMP:
+#   - places are binned once to a fixed metric grid (PT-TM06, CELL_SIZE m)
+#   - the Gaussian kernel is applied as an FFT convolution of the binned
+#     grid, instead of evaluating gaussian_kde at every cell of a mesh
+#     (O(points x cells))
+#   - surfaces are clipped to the municipality polygons with a cell mask
+#     computed once from the cell centres
+#   - the smoothed place count and sub-index sums are cached per
+#     (bandwidth, filter). As in igatp_engine, IGATP is linear in the
+#     sub-indices, so a weight change only recombines cached surfaces
+#
+# Values are kernel-weighted means (Nadaraya-Watson) of the indicator, or
+# the density of places (per km²) for "density"; cells without enough
+# nearby places are left empty.
+
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.signal import fftconvolve
+
+from igatp_engine import SUBINDICES
+
+
+METRIC_CRS = "EPSG:3763"
+CELL_SIZE = 250
+
+# Kernel truncated at this many bandwidths
+KERNEL_RADIUS = 3
+
+# Minimum kernel weight (in "places at distance 0") for a mean to be shown
+MIN_SUPPORT = 0.1
+
+INDICATORS = ["IGATP"] + SUBINDICES + ["density"]
+
+
+class HotspotGrid:
+    """Binned places on a fixed grid over the municipalities, smoothed on demand."""
+
+    def __init__(self, points, shape_mun, cell_size=CELL_SIZE, max_cached=32):
+        self.cell_size = cell_size
+        self.max_cached = max_cached
+        self._cache = OrderedDict()
+        # Shared by all sessions (st.cache_resource), as map_cache.ByteLRUCache
+        self._lock = threading.Lock()
+
+        self.X = np.ascontiguousarray(points[SUBINDICES].to_numpy(dtype=np.float64))
+        self.valid = ~np.isnan(self.X).any(axis=1)
+
+        mun = shape_mun.to_crs(METRIC_CRS)
+        xmin, ymin, xmax, ymax = mun.total_bounds
+        self.origin = (xmin, ymin)
+        self.nx = math.ceil((xmax - xmin) / cell_size)
+        self.ny = math.ceil((ymax - ymin) / cell_size)
+
+        # Flat cell of every place (-1 outside the grid)
+        xy = gpd.GeoSeries(points.geometry).to_crs(METRIC_CRS)
+        ix = np.floor((xy.x.to_numpy() - xmin) / cell_size)
+        iy = np.floor((xy.y.to_numpy() - ymin) / cell_size)
+        inside = (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)
+        self.cell = np.where(inside, iy * self.nx + ix, -1).astype(np.int64)
+
+        # Cells whose centre lies in a municipality
+        cx = xmin + (np.arange(self.nx) + 0.5) * cell_size
+        cy = ymin + (np.arange(self.ny) + 0.5) * cell_size
+        CX, CY = np.meshgrid(cx, cy)
+        area = mun.geometry.union_all()
+        shapely.prepare(area)
+        self.clip = np.flatnonzero(shapely.contains_xy(area, CX.ravel(), CY.ravel()))
+
+        centres = gpd.GeoSeries(gpd.points_from_xy(CX.ravel()[self.clip], CY.ravel()[self.clip]),
+                                crs=METRIC_CRS).to_crs("EPSG:4326")
+        self.longitude = centres.x.to_numpy()
+        self.latitude = centres.y.to_numpy()
+
+    def _kernel(self, bandwidth):
+        """Gaussian kernel on the grid, in places per km² for one place."""
+        r = max(1, math.ceil(KERNEL_RADIUS * bandwidth / self.cell_size))
+        d = np.arange(-r, r + 1) * self.cell_size
+        d2 = d[:, None] ** 2 + d[None, :] ** 2
+        return np.exp(-d2 / (2 * bandwidth ** 2)) / (2 * math.pi * bandwidth ** 2) * 1e6
+
+    def smoothed(self, bandwidth, selection):
+        """(4, n_clipped_cells) smoothed [count, sum of each sub-index] of the selected places."""
+        selection = np.asarray(selection, dtype=bool)
+        key = (round(float(bandwidth)), hashlib.sha1(np.packbits(selection).tobytes()).hexdigest())
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        use = selection & self.valid & (self.cell >= 0)
+        cells = self.cell[use]
+        n_cells = self.nx * self.ny
+        grids = np.empty((1 + self.X.shape[1], n_cells))
+        grids[0] = np.bincount(cells, minlength=n_cells)
+        for j in range(self.X.shape[1]):
+            grids[j + 1] = np.bincount(cells, weights=self.X[use, j], minlength=n_cells)
+
+        kernel = self._kernel(bandwidth)
+        smooth = fftconvolve(grids.reshape(-1, self.ny, self.nx), kernel[None], mode="same", axes=(1, 2))
+        # FFT round-off can leave tiny negative values
+        out = np.maximum(smooth.reshape(len(grids), -1)[:, self.clip], 0.0)
+
+        # The convolution runs outside the lock; two sessions may compute the same surface once each
+        with self._lock:
+            self._cache[key] = out
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return out
+
+    def surface(self, indicator, bandwidth, selection, weights=(1/3, 1/3, 1/3)):
+        """Values of `indicator` on the clipped cells (NaN where there is not enough support)."""
+        s = self.smoothed(bandwidth, selection)
+        density = s[0]
+        if indicator == "density":
+            return density
+
+        if indicator == "IGATP":
+            w = np.asarray(weights, dtype=np.float64)
+            w = w / (w.sum() or 1)
+        else:
+            w = np.eye(len(SUBINDICES))[SUBINDICES.index(indicator)]
+        min_density = MIN_SUPPORT * 1e6 / (2 * math.pi * bandwidth ** 2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(density >= min_density, (w @ s[1:]) / density, np.nan)
+
+    def layer(self, indicator, bandwidth, selection, weights=(1/3, 1/3, 1/3)):
+        """Cell centres with a value, as a point table for Kepler (latitude, longitude, <indicator>)."""
+        values = self.surface(indicator, bandwidth, selection, weights)
+        keep = np.isfinite(values)
+        if indicator == "density":
+            keep &= values > 1e-3 * (values.max() if len(values) else 0)
+        return pd.DataFrame({"latitude": self.latitude[keep], "longitude": self.longitude[keep],
+                             indicator: values[keep]})
@@ -0,0 +1,163 @@
+# IGATP Dashboard - Array-backed IGATP recomputation engine
+#
+# The three normalized sub-indices are kept as one contiguous (n, 3) NumPy
+# matrix and every categorical column used by the sidebar filters or by the
+# territorial tables is stored as integer codes. A slider change is then a
+# single matrix-vector product, and every territorial mean comes from
+# `np.bincount` sums, without copying the GeoDataFrame or its geometries.
+#
+# Since IGATP is linear in the sub-indices, the mean IGATP of a territory is
+# the weighted sum of its sub-index means. Sums are therefore computed per
+# (territory, group x cluster cell) once, and the weights are only applied
+# to the aggregated table. The weighted sum itself is the one of
+# 5_composite_index/scoring.py, which also builds composite_index.csv.
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "5_composite_index"))
+from scoring import PRIOR_LEVELS, SUBINDICES, igatp  # noqa: E402
+
+# Columns returned by IGATPEngine.means (IGATP first, then the sub-indices)
+MEAN_COLUMNS = ["IGATP"] + SUBINDICES
+
+
+def prior_levels(points):
+    """Prior levels of Rating_Bayes available in `points` (Rating_Bayes_norm_<level> columns)."""
+    return [level for level in PRIOR_LEVELS if f"Rating_Bayes_norm_{level}" in points.columns]
+
+
+def with_prior_level(points, level):
+    """`points` with Rating_Bayes_norm taken from the `level` prior ("global" = the notebook's)."""
+    column = f"Rating_Bayes_norm_{level}"
+    if level == "global" or column not in points.columns:
+        return points
+    return points.assign(Rating_Bayes_norm=points[column])
+
+
+def _codes(values):
+    """Factorize `values` into codes shifted by one, so that 0 means missing."""
+    codes, categories = pd.factorize(values, sort=True)
+    return (codes + 1).astype(np.int32), pd.Index(categories)
+
+
+class IGATPEngine:
+    """Holds the sub-index matrix and the categorical codes of every place.
+
+    `points` must already carry `mun_code` / `freg_code` (see
+    `spatial_assignment.assign_territories`); `n_mun` and `n_freg` are the
+    number of polygons in each shapefile.
+    """
+
+    def __init__(self, points, n_mun, n_freg):
+        self.X = np.ascontiguousarray(points[SUBINDICES].to_numpy(dtype=np.float64))
+        valid = ~np.isnan(self.X).any(axis=1)
+
+        # Group and cluster are folded into a single "cell" code; places with a
+        # missing sub-index go to an extra cell that is never selected
+        group_codes, self.groups = _codes(points["Grupo_Tematico"])
+        cluster_codes, self.clusters = _codes(points["cluster_k7_pam"])
+        self.n_cells = (len(self.groups) + 1) * (len(self.clusters) + 1)
+        self.cell_codes = group_codes * (len(self.clusters) + 1) + cluster_codes
+        self.cell_codes[~valid] = self.n_cells
+
+        # Territorial and place-name levels (code 0 = no match / missing)
+        name_codes, self.names = _codes(points["Nome_Local"])
+        self.levels = {
+            "mun": (points["mun_code"].to_numpy().astype(np.int32) + 1, n_mun),
+            "freg": (points["freg_code"].to_numpy().astype(np.int32) + 1, n_freg),
+            "name": (name_codes, len(self.names)),
+        }
+
+        # Per (territory, cell) count and sub-index sums, built once
+        self.cubes = {level: self._cube(level) for level in ("mun", "freg")}
+
+        self._last_mask = (None, None)
+        self._last_sums = {}
+
+    def __len__(self):
+        return self.X.shape[0]
+
+    def _cube(self, level):
+        codes, n_units = self.levels[level]
+        n_bins = (n_units + 1) * (self.n_cells + 1)
+        key = codes * (self.n_cells + 1) + self.cell_codes
+        X = np.where(np.isnan(self.X), 0.0, self.X)
+        stats = [np.bincount(key, minlength=n_bins).astype(np.float64)]
+        stats += [np.bincount(key, weights=X[:, j], minlength=n_bins) for j in range(X.shape[1])]
+        return np.stack(stats, axis=-1).reshape(n_units + 1, self.n_cells + 1, len(stats))
+
+    def selected_cells(self, groups, clusters):
+        """Boolean table over cells, True for the (group, cluster) pairs kept by the filters."""
+        group_ok = np.zeros(len(self.groups) + 1, dtype=bool)
+        group_ok[1:] = self.groups.isin(groups)
+        cluster_ok = np.zeros(len(self.clusters) + 1, dtype=bool)
+        cluster_ok[1:] = self.clusters.isin(clusters)
+        cells = np.zeros(self.n_cells + 1, dtype=bool)
+        cells[:-1] = np.outer(group_ok, cluster_ok).ravel()
+        return cells
+
+    def mask(self, groups, clusters):
+        """Boolean mask of the places kept by the sidebar filters (memoized on the filters)."""
+        key = (tuple(groups), tuple(clusters))
+        # The engine is shared by every session (st.cache_resource): read the
+        # (key, mask) pair once, so the mask returned is the one of `key`
+        last_key, mask = self._last_mask
+        if last_key != key:
+            mask = self.selected_cells(groups, clusters)[self.cell_codes]
+            self._last_mask = (key, mask)
+        return mask
+
+    def scores(self, weights):
+        """IGATP for every place: a single (n, 3) @ (3,) product ((n, k) for a (k, 3) array of weights)."""
+        return igatp(self.X, weights)
+
+    def recompute(self, weights, groups, clusters):
+        """Return `(mask, igatp)` for the current slider and filter state."""
+        return self.mask(groups, clusters), self.scores(weights)
+
+    def _sums(self, level, groups, clusters):
+        """(n_units, 4) table of [count, sum of each sub-index] under the filters."""
+        key = (tuple(groups), tuple(clusters))
+        # One read of the shared (key, sums) pair, as in mask()
+        cached = self._last_sums.get(level)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        if level in self.cubes:
+            cells = self.selected_cells(groups, clusters)
+            sums = self.cubes[level][1:, cells, :].sum(axis=1)
+        else:
+            codes, n_units = self.levels[level]
+            mask = self.mask(groups, clusters)
+            sums = np.empty((n_units, self.X.shape[1] + 1))
+            sums[:, 0] = np.bincount(codes, weights=mask.astype(np.float64), minlength=n_units + 1)[1:]
+            for j in range(self.X.shape[1]):
+                values = np.where(mask, self.X[:, j], 0.0)
+                sums[:, j + 1] = np.bincount(codes, weights=values, minlength=n_units + 1)[1:]
+
+        self._last_sums[level] = (key, sums)
+        return sums
+
+    def means(self, level, weights, groups, clusters):
+        """Mean IGATP and sub-indices per unit of `level` ("mun", "freg" or "name").
+
+        Returns an (n_units, 4) array ordered as MEAN_COLUMNS, with NaN for
+        units that have no place under the current filters.
+        """
+        sums = self._sums(level, groups, clusters)
+        out = np.empty((sums.shape[0], len(MEAN_COLUMNS)))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[:, 1:] = sums[:, 1:] / sums[:, :1]
+        out[:, 0] = out[:, 1:] @ np.asarray(weights, dtype=np.float64)
+        return out
+
+    def means_frame(self, level, weights, groups, clusters):
+        """`means` as a DataFrame; the "name" level is indexed by Nome_Local."""
+        out = pd.DataFrame(self.means(level, weights, groups, clusters), columns=MEAN_COLUMNS)
+        if level == "name":
+            out.index = self.names.rename("Nome_Local")
+        return out
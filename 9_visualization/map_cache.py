@@ -0,0 +1,101 @@
+# IGATP Dashboard - Rendered Kepler map cache
+#
+# Building a KeplerGl object and serializing its data to HTML is the most
+# expensive part of a map tab. The rendered HTML is kept in a bounded LRU
+# cache, evicted by total size in bytes, keyed on everything that changes
+# the map: tab, filters, rounded weights, polygon detail and data version.
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+
+# Default memory budget for rendered maps (bytes)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Weights are rounded before hashing so that tiny slider jitter hits the cache
+WEIGHT_DECIMALS = 3
+
+
+def map_key(tab, groups, clusters, weights, data_version, **extra):
+    """Stable hash of the state that determines a rendered map."""
+    state = {
+        "tab": tab,
+        "groups": sorted(str(g) for g in groups),
+        "clusters": sorted(str(c) for c in clusters),
+        "weights": [round(float(w), WEIGHT_DECIMALS) for w in weights],
+        "data_version": data_version,
+        "extra": {k: str(v) for k, v in sorted(extra.items())},
+    }
+    return hashlib.sha1(json.dumps(state, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ByteLRUCache:
+    """LRU cache of str/bytes values with a limit on their total size."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _size(value):
+        return len(value.encode("utf-8")) if isinstance(value, str) else len(value)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key]
+
+    def put(self, key, value):
+        size = self._size(value)
+        with self._lock:
+            if key in self._items:
+                self.current_bytes -= self._size(self._items.pop(key))
+            # Values larger than the whole budget are not cached
+            if size > self.max_bytes:
+                return
+            self._items[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.current_bytes -= self._size(evicted)
+
+    def get_or_render(self, key, render):
+        """Cached value for `key`, calling `render()` (and storing its result) on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = render()
+            self.put(key, value)
+        return value
+
+    def __len__(self):
+        return len(self._items)
+
+
+def kepler_html(fig, center_map=False, read_only=False):
+    """HTML of a KeplerGl map, as rendered by streamlit_keplergl.keplergl_static."""
+    try:
+        html = fig._repr_html_(center_map=center_map, read_only=read_only)
+    except TypeError:
+        html = fig._repr_html_()
+    return html.decode("utf-8") if isinstance(html, bytes) else html
+
+
+def show_kepler(html, height=600):
+    """Display rendered Kepler HTML the same way keplergl_static does."""
+    if hasattr(st, "iframe"):
+        st.iframe(html, height=height + 10, width="stretch")
+    else:
+        components.html(html, height=height + 10)
@@ -0,0 +1,97 @@
+# IGATP Dashboard - Top-K / bottom-K rankings without full sorts
+#
+# Rankings are taken over the per-place means computed by IGATPEngine.
+# The three sub-indices do not depend on the weights, so their orders are
+# sorted once per filter state and reused while the sliders move; IGATP is
+# re-ranked with a partial selection (np.argpartition) only when the
+# weights, the filters or K change.
+
+import numpy as np
+import pandas as pd
+
+from igatp_engine import MEAN_COLUMNS, SUBINDICES
+
+
+def top_k(values, k, largest=True):
+    """Positions of the `k` largest (or smallest) non-NaN values, best first."""
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(values))
+    key = -values[valid] if largest else values[valid]
+
+    k = min(k, len(key))
+    if k == 0:
+        return valid[:0]
+    part = np.argpartition(key, k - 1)[:k]
+    return valid[part[np.argsort(key[part], kind="stable")]]
+
+
+def top_bottom(frame, column, k):
+    """Top-k and bottom-k rows of a small table (municipalities, parishes) by `column`."""
+    values = frame[column].to_numpy(dtype=np.float64)
+    top = frame.iloc[top_k(values, k, largest=True)]
+    bottom = frame.iloc[top_k(values, k, largest=False)[::-1]]
+    return top.reset_index(drop=True), bottom.reset_index(drop=True)
+
+
+class RankingIndex:
+    """Top-K / bottom-K places (by Nome_Local) for IGATP and each sub-index."""
+
+    def __init__(self, engine, level="name"):
+        self.engine = engine
+        self.level = level
+        self._presorted = (None, None, None)
+        self._igatp = (None, None, None)
+
+    def _filter_key(self, groups, clusters):
+        return (tuple(groups), tuple(clusters))
+
+    def _sub_means(self, groups, clusters):
+        """Per-place sub-index means and their descending orders, cached per filter state."""
+        key = self._filter_key(groups, clusters)
+        # Shared across sessions (st.cache_resource): read the cached tuple once
+        cached_key, means, orders = self._presorted
+        if cached_key != key:
+            means = self.engine.means(self.level, np.zeros(len(SUBINDICES)), groups, clusters)[:, 1:]
+            orders = {}
+            for j, column in enumerate(SUBINDICES):
+                values = means[:, j]
+                order = np.argsort(-values, kind="stable")
+                orders[column] = order[~np.isnan(values[order])]
+            self._presorted = (key, means, orders)
+        return means, orders
+
+    def _igatp_ranking(self, k, weights, groups, clusters):
+        """Top-k and bottom-k IGATP positions, recomputed only when weights, filters or k change."""
+        key = (self._filter_key(groups, clusters), tuple(np.round(weights, 6)), k)
+        cached_key, igatp, positions = self._igatp
+        if cached_key != key:
+            means, _ = self._sub_means(groups, clusters)
+            igatp = means @ np.asarray(weights, dtype=np.float64)
+            positions = (top_k(igatp, k, largest=True), top_k(igatp, k, largest=False))
+            self._igatp = (key, igatp, positions)
+        return igatp, positions
+
+    def _series(self, positions, values, column):
+        index = self.engine.names[positions].rename("Nome_Local")
+        return pd.Series(values[positions], index=index, name=column)
+
+    def top(self, column, k, weights, groups, clusters):
+        """The `k` places with the highest mean `column` (one of MEAN_COLUMNS)."""
+        return self._ranked(column, k, weights, groups, clusters, largest=True)
+
+    def bottom(self, column, k, weights, groups, clusters):
+        """The `k` places with the lowest mean `column`, lowest first."""
+        return self._ranked(column, k, weights, groups, clusters, largest=False)
+
+    def _ranked(self, column, k, weights, groups, clusters, largest):
+        if column not in MEAN_COLUMNS:
+            raise ValueError(f"Unknown ranking column: {column}")
+
+        if column == "IGATP":
+            igatp, (top, bottom) = self._igatp_ranking(k, weights, groups, clusters)
+            return self._series(top if largest else bottom, igatp, column)
+
+        means, orders = self._sub_means(groups, clusters)
+        order = orders[column]
+        positions = order[:k] if largest else order[::-1][:k]
+        return self._series(positions, means[:, SUBINDICES.index(column)], column)
@@ -0,0 +1,41 @@
+# IGATP Dashboard - Spatial assignment of places to municipalities and parishes
+#
+# The point-in-polygon join is done once, when the data is loaded, and the
+# result is stored as integer codes on every point. Widget reruns then only
+# need integer filtering and groupby, never a new spatial join.
+
+import numpy as np
+import geopandas as gpd
+
+
+def codigo_territorial(points, shape, predicate="within"):
+    """Return, for each point, the row position of the polygon that contains it (-1 if none)."""
+    shape = shape.to_crs(points.crs)
+    joined = gpd.sjoin(
+        points[["geometry"]],
+        gpd.GeoDataFrame(geometry=shape.geometry.values, crs=shape.crs),
+        how="inner",
+        predicate=predicate
+    )
+
+    # Points on a shared border may match two polygons: keep the first one
+    joined = joined[~joined.index.duplicated(keep="first")]
+
+    codes = np.full(len(points), -1, dtype=np.int32)
+    positions = points.index.get_indexer(joined.index)
+    codes[positions] = joined["index_right"].to_numpy()
+    return codes
+
+
+def assign_territories(points, shape_mun, shape_freg):
+    """Attach `mun_code` / `freg_code` to the points and keep only those inside the AMP.
+
+    Codes are row positions in `shape_mun` / `shape_freg`, so a territorial
+    mean is just a groupby (or bincount) over an integer column.
+    """
+    points = points.reset_index(drop=True)
+    points["mun_code"] = codigo_territorial(points, shape_mun.reset_index(drop=True))
+    points["freg_code"] = codigo_territorial(points, shape_freg.reset_index(drop=True))
+
+    # Same clipping as before: only points within the AMP municipalities
+    return points[points["mun_code"] >= 0].reset_index(drop=True)
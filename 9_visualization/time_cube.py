@@ -0,0 +1,67 @@
+# IGATP Dashboard - Pre-aggregated sentiment time cube
+#
+# Reviews are reduced once to month x municipality x thematic group x
+# cluster x dominant topic cells holding the sum and count of `Polaridade`.
+# The Temporal Evolution tab then slices the cube with the sidebar filters
+# and averages at O(cells) cost instead of re-reading and grouping reviews.
+
+import pandas as pd
+
+
+CUBE_KEYS = ["month", "mun_code", "Grupo_Tematico", "cluster_k7_pam", "dominant_topic"]
+
+
+def build_time_cube(reviews, points):
+    """Aggregate reviews into (CUBE_KEYS) cells with Polaridade sum and count.
+
+    Reviews are matched to places on (Nome_Local, Cidade): the review
+    `Categoria` uses the Portuguese search terms ("restaurante", "museu"),
+    not the Google place types of the index. Reviews of places that are not
+    on the map keep missing territory/group/cluster.
+    """
+    reviews = reviews[["Nome_Local", "Cidade", "Data_Convertida", "Polaridade", "dominant_topic"]].copy()
+    reviews["month"] = (
+        pd.to_datetime(reviews["Data_Convertida"], errors="coerce")
+        .dt.to_period("M")
+        .dt.to_timestamp()
+    )
+    reviews = reviews.dropna(subset=["month", "Polaridade"])
+
+    places = (
+        pd.DataFrame(points[["Nome_Local", "Cidade", "mun_code", "Grupo_Tematico", "cluster_k7_pam"]])
+        .drop_duplicates(subset=["Nome_Local", "Cidade"])
+    )
+    reviews = reviews.merge(places, on=["Nome_Local", "Cidade"], how="left")
+    reviews["mun_code"] = reviews["mun_code"].fillna(-1).astype("int32")
+
+    cube = (
+        reviews
+        .groupby(CUBE_KEYS, dropna=False, observed=True)["Polaridade"]
+        .agg(Polaridade_sum="sum", Polaridade_count="count")
+        .reset_index()
+    )
+    return cube
+
+
+def slice_time_cube(cube, groups=None, clusters=None, municipalities=None, topics=None, options=None):
+    """Monthly mean polarity over the cells matching the filters (None = no filter).
+
+    `options` maps a cube column to the full option list of its widget. A
+    filter that selects every option is not applied, so with everything
+    selected the reviews of places that are not on the map (missing
+    group/cluster) still count, as in the all-reviews mean.
+    """
+    options = options or {}
+    keep = pd.Series(True, index=cube.index)
+    for column, values in (("Grupo_Tematico", groups), ("cluster_k7_pam", clusters),
+                           ("mun_code", municipalities), ("dominant_topic", topics)):
+        if values is None or (column in options and pd.Index(options[column]).isin(values).all()):
+            continue
+        keep &= cube[column].isin(values)
+
+    monthly = cube[keep].groupby("month")[["Polaridade_sum", "Polaridade_count"]].sum()
+    monthly = monthly[monthly["Polaridade_count"] > 0]
+    return pd.DataFrame({
+        "Data_Convertida": monthly.index,
+        "Polaridade": (monthly["Polaridade_sum"] / monthly["Polaridade_count"]).to_numpy(),
+    })
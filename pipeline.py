@@ -0,0 +1,314 @@
+# IGATP - Pipeline runner for the numbered stages
+#
+# Usage:  python pipeline.py [stage ...] [--jobs N] [--force] [--dry-run]
+#
+# Every stage declares the files it reads, the files it writes and the code
+# that produces them (a notebook or Python modules). A stage is skipped when
+# the content hashes of its code and inputs match the last successful run
+# and its outputs are still the ones it wrote; otherwise it is re-run. Since
+# the decision uses the *content* of the upstream outputs, a change that
+# does not alter an artifact stops the rebuild there. Independent stages run
+# in parallel.
+#
+# Notebooks are executed with nbconvert on a temporary copy in which the
+# hardcoded C:/Users/.../<project>/ paths point to this repository.
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST = os.path.join(PROJECT_DIR, ".pipeline", "manifest.json")
+
+# Absolute paths of the authors' machine used in the notebooks
+HARDCODED_ROOT = re.compile(
+    r"C:/Users/[^\"']*?/(?:seminar_project|perceived_attractiveness_indice_project)[/\\]")
+
+SPATIAL = "1_data_collection/spatial_data_AMP"
+SHAPEFILES = [f"{SPATIAL}/shape_CAOP_Conc_AMP.{ext}" for ext in ("shp", "shx", "dbf", "prj")] + \
+             [f"{SPATIAL}/shape_CAOP_Freg_AMP.{ext}" for ext in ("shp", "shx", "dbf", "prj")]
+
+
+class Stage:
+    """A step of the pipeline: `run` is a notebook path or a callable."""
+
+    def __init__(self, name, run, inputs, outputs, code=()):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.code = list(code) or ([run] if isinstance(run, str) else [])
+
+
+def _composite_index():
+    subprocess.run([sys.executable, "scoring.py"], cwd=os.path.join(PROJECT_DIR, "5_composite_index"), check=True)
+
+
+def _topic_modeling():
+    subprocess.run([sys.executable, "topic_serving.py", "update", "../2_pre_processing_NLP/comments_clean.csv",
+                    "--clusters", "composite_index_with_clusters.csv"],
+                   cwd=os.path.join(PROJECT_DIR, "6_unsupervised_learning"), check=True)
+
+
+def _territorial_aggregation():
+    subprocess.run([sys.executable, "territorial_aggregation.py"], cwd=os.path.join(PROJECT_DIR, "8_spatial_analysis"),
+                   check=True)
+
+
+def _spatial_autocorrelation():
+    subprocess.run([sys.executable, "spatial_weights.py"], cwd=os.path.join(PROJECT_DIR, "8_spatial_analysis"),
+                   check=True)
+
+
+def _build_bundle():
+    sys.path.insert(0, os.path.join(PROJECT_DIR, "9_visualization"))
+    from data_bundle import build_bundle
+    build_bundle(PROJECT_DIR)
+
+
+STAGES = [
+    Stage("pre_processing", "2_pre_processing_NLP/pre_processing_NLP.ipynb",
+          inputs=["1_data_collection/google_places_API/csv/google_places_AMP_with_coordinates.csv",
+                  "1_data_collection/google_places_API/csv/comments_google_maps_AMP.csv"],
+          outputs=["2_pre_processing_NLP/ratings_clean.csv", "2_pre_processing_NLP/comments_clean.csv"]),
+    # ratings_geocoded.csv (3_exploratory_analysis) is produced outside the notebooks and is a source here
+    Stage("bayesian_rating", "4_bayesian_rating_adjustment/bayesian_rating_adjustment.ipynb",
+          inputs=["3_exploratory_analysis/ratings_geocoded.csv", "2_pre_processing_NLP/comments_clean.csv"],
+          outputs=["4_bayesian_rating_adjustment/ratings_with_bayesian_adjustment.csv"]),
+    # composite_index.ipynb computed by scoring.py, which also saves the fitted normalizations
+    Stage("composite_index", _composite_index,
+          inputs=["4_bayesian_rating_adjustment/ratings_with_bayesian_adjustment.csv",
+                  "2_pre_processing_NLP/comments_clean.csv"],
+          outputs=["5_composite_index/composite_index.csv", "5_composite_index/scoring_params.json"],
+          code=["5_composite_index/scoring.py", "4_bayesian_rating_adjustment/hierarchical_bayes.py"]),
+    Stage("clustering", "6_unsupervised_learning/clustering_analysis.ipynb",
+          inputs=["5_composite_index/composite_index.csv"],
+          outputs=["6_unsupervised_learning/composite_index_with_clusters.csv"]),
+    # topic_serving.py owns the topics file: it scores only new/changed reviews against the saved model
+    # (a notebook run would overwrite those rows with a full refit)
+    Stage("topic_modeling", _topic_modeling,
+          inputs=["2_pre_processing_NLP/comments_clean.csv", "6_unsupervised_learning/composite_index_with_clusters.csv"],
+          outputs=["6_unsupervised_learning/ratings_polarity_lda_topics.csv"],
+          code=["6_unsupervised_learning/topic_serving.py", "6_unsupervised_learning/topic_sweep.py"]),
+    # The parish table of spatial_analysis.ipynb, computed by territorial_aggregation.py (the notebook keeps the maps)
+    Stage("spatial_analysis", _territorial_aggregation,
+          inputs=["6_unsupervised_learning/composite_index_with_clusters.csv"] + SHAPEFILES,
+          outputs=["8_spatial_analysis/mean_freg_all_by_parish.csv", "8_spatial_analysis/territorial_means.csv"],
+          code=["8_spatial_analysis/territorial_aggregation.py", "9_visualization/spatial_assignment.py"]),
+    Stage("spatial_autocorrelation", _spatial_autocorrelation,
+          inputs=["8_spatial_analysis/mean_freg_all_by_parish.csv"] + SHAPEFILES,
+          outputs=["8_spatial_analysis/lisa_by_parish.csv", "8_spatial_analysis/moran_global.csv"],
+          code=["8_spatial_analysis/spatial_weights.py"]),
+    Stage("dashboard_bundle", _build_bundle,
+          inputs=["6_unsupervised_learning/composite_index_with_clusters.csv",
+                  "6_unsupervised_learning/ratings_polarity_lda_topics.csv",
+                  "8_spatial_analysis/mean_freg_all_by_parish.csv",
+                  "8_spatial_analysis/lisa_by_parish.csv"] + SHAPEFILES,
+          outputs=[f"9_visualization/data_bundle/{name}.arrow"
+                   for name in ("points", "municipalities", "parishes", "parish_means", "time_cube")],
+          code=["9_visualization/data_bundle.py", "9_visualization/spatial_assignment.py",
+                "9_visualization/time_cube.py"]),
+]
+
+
+# Hashing
+
+class Hasher:
+    """sha256 of files, reused across runs while (size, mtime) do not change."""
+
+    def __init__(self, known=None):
+        self.known = known or {}
+
+    def file(self, rel):
+        path = os.path.join(PROJECT_DIR, rel)
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        cached = self.known.get(rel)
+        if cached and cached["size"] == stat.st_size and cached["mtime"] == stat.st_mtime:
+            return cached["sha256"]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.known[rel] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": digest.hexdigest()}
+        return digest.hexdigest()
+
+    def code(self, rel):
+        """Notebooks are hashed on their code cells only (outputs and markdown do not matter)."""
+        if not rel.endswith(".ipynb"):
+            return self.file(rel)
+        with open(os.path.join(PROJECT_DIR, rel), encoding="utf-8") as f:
+            cells = json.load(f)["cells"]
+        source = "\n\f\n".join("".join(c["source"]) for c in cells if c["cell_type"] == "code")
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def stage_key(self, stage):
+        state = {"code": {c: self.code(c) for c in stage.code},
+                 "inputs": {i: self.file(i) for i in stage.inputs}}
+        return hashlib.sha256(json.dumps(state, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST):
+        return {"stages": {}, "files": {}}
+    with open(MANIFEST, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    os.makedirs(os.path.dirname(MANIFEST), exist_ok=True)
+    tmp = MANIFEST + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, MANIFEST)
+
+
+# Execution
+
+def run_notebook(rel):
+    """Execute a notebook (with the hardcoded paths rewritten) in its own directory."""
+    path = os.path.join(PROJECT_DIR, rel)
+    with open(path, encoding="utf-8") as f:
+        nb = json.load(f)
+    root = PROJECT_DIR.replace("\\", "/") + "/"
+    for cell in nb["cells"]:
+        if cell["cell_type"] == "code":
+            cell["source"] = [HARDCODED_ROOT.sub(root, line) for line in cell["source"]]
+
+    workdir = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(suffix=".ipynb", dir=workdir)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(nb, f)
+        subprocess.run([sys.executable, "-m", "jupyter", "nbconvert", "--to", "notebook", "--execute",
+                        "--ExecutePreprocessor.timeout=-1", "--output", tmp, tmp],
+                       cwd=workdir, check=True)
+    finally:
+        os.remove(tmp)
+
+
+def execute(stage):
+    start = time.time()
+    if callable(stage.run):
+        stage.run()
+    else:
+        run_notebook(stage.run)
+    missing = [o for o in stage.outputs if not os.path.exists(os.path.join(PROJECT_DIR, o))]
+    if missing:
+        raise RuntimeError(f"{stage.name} did not write {missing}")
+    return time.time() - start
+
+
+def upstream(stages):
+    """stage name -> names of the stages producing its inputs."""
+    producer = {o: s.name for s in stages for o in s.outputs}
+    return {s.name: {producer[i] for i in s.inputs if i in producer and producer[i] != s.name} for s in stages}
+
+
+def select(stages, targets):
+    """The target stages plus everything they depend on (all stages when no target is given)."""
+    if not targets:
+        return stages
+    deps = upstream(stages)
+    unknown = set(targets) - set(deps)
+    if unknown:
+        raise ValueError(f"Unknown stages: {sorted(unknown)}")
+    wanted, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in wanted:
+            wanted.add(name)
+            todo.extend(deps[name])
+    return [s for s in stages if s.name in wanted]
+
+
+def run_pipeline(stages=STAGES, targets=(), jobs=2, force=False, dry_run=False):
+    """Run the stages whose code or inputs changed. Returns {stage: "skipped" | "ran" | "failed" | ...}."""
+    stages = select(stages, targets)
+    deps = upstream(stages)
+    by_name = {s.name: s for s in stages}
+    manifest = load_manifest()
+    hasher = Hasher(manifest["files"])
+    status = {}
+
+    def up_to_date(stage, key):
+        record = manifest["stages"].get(stage.name)
+        return (record is not None and record.get("key") == key
+                and all(hasher.file(o) == record.get("outputs", {}).get(o) for o in stage.outputs))
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        running = {}
+        while len(status) < len(stages):
+            for name, stage in by_name.items():
+                if name in status or name in running.values():
+                    continue
+                if any(status.get(d) in ("failed", "blocked") for d in deps[name]):
+                    status[name] = "blocked"
+                    print(f"⛔ {name}: upstream failed")
+                    continue
+                if not all(status.get(d) in ("skipped", "ran", "would run") for d in deps[name]):
+                    continue
+
+                key = hasher.stage_key(stage)
+                if not force and up_to_date(stage, key):
+                    status[name] = "skipped"
+                    print(f"✔️ {name}: up to date")
+                elif dry_run:
+                    status[name] = "would run"
+                    print(f"▶️ {name}: would run")
+                else:
+                    print(f"▶️ {name}: running")
+                    running[pool.submit(execute, stage)] = name
+                    manifest["stages"].setdefault(name, {})["pending_key"] = key
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                stage = by_name[name]
+                try:
+                    elapsed = future.result()
+                except Exception as error:
+                    status[name] = "failed"
+                    manifest["stages"][name].pop("pending_key", None)
+                    if not manifest["stages"][name]:
+                        del manifest["stages"][name]  # failed on its first run: no record to keep
+                    print(f"❌ {name}: {error}")
+                    continue
+                status[name] = "ran"
+                record = manifest["stages"][name]
+                record["key"] = record.pop("pending_key")
+                record["outputs"] = {o: hasher.file(o) for o in stage.outputs}
+                save_manifest(manifest)
+                print(f"✅ {name}: done in {elapsed:.1f}s")
+
+    save_manifest(manifest)
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the IGATP stages that are out of date.")
+    parser.add_argument("stages", nargs="*", help="Stages to bring up to date (default: all)")
+    parser.add_argument("--jobs", type=int, default=2, help="Stages run in parallel")
+    parser.add_argument("--force", action="store_true", help="Re-run even if up to date")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would run")
+    parser.add_argument("--list", action="store_true", help="List the stages and their dependencies")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, deps in upstream(STAGES).items():
+            print(f"{name} <- {', '.join(sorted(deps)) or '(sources)'}")
+        sys.exit(0)
+
+    status = run_pipeline(targets=args.stages, jobs=args.jobs, force=args.force, dry_run=args.dry_run)
+    sys.exit(1 if any(s in ("failed", "blocked") for s in status.values()) else 0)